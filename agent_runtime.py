@@ -0,0 +1,207 @@
+"""并发执行同一步中相互独立的工具调用的代理执行器"""
+import os
+import asyncio
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Iterator, AsyncIterator, Union, Any
+
+from langchain.agents import AgentExecutor
+from langchain_core.agents import AgentAction, AgentFinish, AgentStep
+
+from utils.async_utils import acquire_lock
+from utils.cancellation import current_cancel_token
+
+# 会操作同一个系统资源的工具，同一资源上的调用按模型给出的顺序串行执行，不同请求之间也互斥
+TOOL_RESOURCES = {
+    'set-volume': 'audio',
+    'adjust-volume': 'audio',
+    'mute_volume': 'audio',
+    'recover_volume': 'audio',
+    'set-brightness': 'display',
+    'adjust-brightness': 'display',
+    'organize-files': 'filesystem',
+    'write_document': 'filesystem'
+}
+_resource_locks: Dict[str, threading.Lock] = {name: threading.Lock() for name in set(TOOL_RESOURCES.values())}
+
+# 执行同步工具的线程池
+tool_executor = ThreadPoolExecutor(
+    max_workers=int(os.environ.get('TOOL_MAX_WORKERS', 8)),
+    thread_name_prefix='agent-tool'
+)
+
+# 父类逐个执行工具调用时，只记录下来，等这一步的所有工具调用都确定后再统一执行
+_deferred: contextvars.ContextVar[bool] = contextvars.ContextVar('deferred_tool_calls', default=False)
+
+
+class _PendingStep:
+    __slots__ = ('agent_action', 'args')
+
+    def __init__(self, agent_action: AgentAction, args: tuple):
+        self.agent_action = agent_action
+        self.args = args
+
+
+def _group_by_resource(pending: List[_PendingStep]) -> List[List[int]]:
+    """按资源分组（保持原有顺序），没有登记资源的工具各自一组"""
+    groups: Dict[Any, List[int]] = {}
+    for index, step in enumerate(pending):
+        key = TOOL_RESOURCES.get(step.agent_action.tool, index)
+        groups.setdefault(key, []).append(index)
+    return list(groups.values())
+
+
+class ConcurrentAgentExecutor(AgentExecutor):
+    """
+    模型在一步中给出多个工具调用时并发执行：
+    同步调用在线程池中执行，异步调用使用 asyncio.gather；
+    操作同一资源的工具调用按顺序串行执行；结果按原来的顺序写回 agent_scratchpad；
+    当前运行被取消（客户端断开）时在下一步之前停止
+    """
+
+    def _should_continue(self, iterations: int, time_elapsed: float) -> bool:
+        token = current_cancel_token()
+        if token is not None:
+            token.raise_if_cancelled()
+        return super()._should_continue(iterations, time_elapsed)
+
+    def _perform_agent_action(self, name_to_tool_map, color_mapping, agent_action, run_manager=None):
+        if _deferred.get():
+            return _PendingStep(agent_action, (name_to_tool_map, color_mapping, agent_action, run_manager))
+        return super()._perform_agent_action(name_to_tool_map, color_mapping, agent_action, run_manager)
+
+    async def _aperform_agent_action(self, name_to_tool_map, color_mapping, agent_action, run_manager=None):
+        if _deferred.get():
+            return _PendingStep(agent_action, (name_to_tool_map, color_mapping, agent_action, run_manager))
+        return await super()._aperform_agent_action(name_to_tool_map, color_mapping, agent_action, run_manager)
+
+    def _run_group(self, pending: List[_PendingStep]) -> List[AgentStep]:
+        lock = _resource_locks.get(TOOL_RESOURCES.get(pending[0].agent_action.tool))
+        if lock is None:
+            return [super(ConcurrentAgentExecutor, self)._perform_agent_action(*step.args) for step in pending]
+        with lock:
+            return [super(ConcurrentAgentExecutor, self)._perform_agent_action(*step.args) for step in pending]
+
+    async def _arun_group(self, pending: List[_PendingStep]) -> List[AgentStep]:
+        lock = _resource_locks.get(TOOL_RESOURCES.get(pending[0].agent_action.tool))
+        if lock is not None:
+            await acquire_lock(lock)
+        try:
+            return [await super(ConcurrentAgentExecutor, self)._aperform_agent_action(*step.args) for step in pending]
+        finally:
+            if lock is not None:
+                lock.release()
+
+    def _iter_next_step(self, *args, **kwargs) -> Iterator[Union[AgentFinish, AgentAction, AgentStep]]:
+        steps = super()._iter_next_step(*args, **kwargs)
+        pending: List[_PendingStep] = []
+        while True:
+            token = _deferred.set(True)
+            try:
+                item = next(steps)
+            except StopIteration:
+                break
+            finally:
+                _deferred.reset(token)
+            if isinstance(item, _PendingStep):
+                pending.append(item)
+            else:
+                yield item
+        if not pending:
+            return
+
+        groups = _group_by_resource(pending)
+        results: List[Optional[AgentStep]] = [None] * len(pending)
+        if len(groups) == 1:
+            for index, step in zip(groups[0], self._run_group(pending)):
+                results[index] = step
+        else:
+            # 每个线程复制当前上下文，保留回调、追踪等上下文变量
+            futures = [
+                (group, tool_executor.submit(contextvars.copy_context().run,
+                                             self._run_group, [pending[index] for index in group]))
+                for group in groups
+            ]
+            for group, future in futures:
+                for index, step in zip(group, future.result()):
+                    results[index] = step
+        yield from results
+
+    async def _aiter_next_step(self, *args, **kwargs) -> AsyncIterator[Union[AgentFinish, AgentAction, AgentStep]]:
+        steps = super()._aiter_next_step(*args, **kwargs)
+        pending: List[_PendingStep] = []
+        while True:
+            token = _deferred.set(True)
+            try:
+                item = await steps.__anext__()
+            except StopAsyncIteration:
+                break
+            finally:
+                _deferred.reset(token)
+            if isinstance(item, _PendingStep):
+                pending.append(item)
+            else:
+                yield item
+        if not pending:
+            return
+
+        groups = _group_by_resource(pending)
+        group_results = await asyncio.gather(
+            *[self._arun_group([pending[index] for index in group]) for group in groups]
+        )
+        results: List[Optional[AgentStep]] = [None] * len(pending)
+        for group, steps_in_group in zip(groups, group_results):
+            for index, step in zip(group, steps_in_group):
+                results[index] = step
+        for step in results:
+            yield step
+
+
+if __name__ == '__main__':
+    import time
+    from langchain_core.tools import StructuredTool
+    from langchain_core.runnables import RunnableLambda
+
+    os.environ.setdefault('AUDIO_BACKEND', 'fake')
+    os.environ.setdefault('BRIGHTNESS_BACKEND', 'fake')
+    from tools import set_volume, set_brightness
+    from tools.audio_backend import get_audio_backend
+    from tools.brightness_backend import get_brightness_backend
+
+    # 模拟耗时不同的工具：两个设备工具（系统调用 100ms）+ 若干 I/O 工具
+    get_audio_backend().latency = 0.1
+    get_brightness_backend().latency = 0.1
+
+    def sleep_tool(index: int, seconds: float):
+        async def coroutine() -> str:
+            await asyncio.sleep(seconds)
+            return f'slept {seconds}s'
+        return StructuredTool.from_function(
+            func=lambda: time.sleep(seconds) or f'slept {seconds}s', coroutine=coroutine,
+            name=f'sleep_{index}', description='sleep'
+        )
+
+    durations = [0.1, 0.2, 0.3, 0.4]
+    demo_tools = [set_volume, set_brightness] + [sleep_tool(i, d) for i, d in enumerate(durations)]
+    actions = [AgentAction('set-volume', {'volume_level': 30}, ''),
+               AgentAction('set-brightness', {'brightness_level': 50}, '')]
+    actions += [AgentAction(f'sleep_{i}', {}, '') for i in range(len(durations))]
+
+    # 不调用大模型的 agent：第一步给出所有工具调用，第二步结束
+    def plan(inputs):
+        if inputs['intermediate_steps']:
+            return AgentFinish({'output': 'done'}, '')
+        return actions
+
+    for executor_class in (AgentExecutor, ConcurrentAgentExecutor):
+        for mode in ('sync', 'async'):
+            executor = executor_class(agent=RunnableLambda(plan), tools=demo_tools, return_intermediate_steps=True)
+            start = time.perf_counter()
+            if mode == 'sync':
+                result = executor.invoke({'input': ''})
+            else:
+                result = asyncio.run(executor.ainvoke({'input': ''}))
+            elapsed = time.perf_counter() - start
+            print(f'{executor_class.__name__:24} {mode:5} {len(actions)} tools: {elapsed:.2f}s '
+                  f'(slowest {max(durations):.2f}s)', [step[1] for step in result['intermediate_steps']][:2])
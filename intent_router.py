@@ -0,0 +1,210 @@
+"""简单设备指令的规则路由：命中高置信度规则时直接调用工具，不经过大模型"""
+import re
+import threading
+from typing import Optional, NamedTuple, Dict, Any, Callable, List, Tuple
+
+from tools import (
+    set_volume,
+    adjust_volume,
+    mute_volume,
+    recover_volume,
+    set_brightness,
+    adjust_brightness,
+    open_application,
+    open_calc
+)
+from utils import get_matcher
+from utils.app_catalog import get_app_catalog
+
+CN_DIGITS = {'零': 0, '〇': 0, '一': 1, '二': 2, '两': 2, '三': 3, '四': 4,
+             '五': 5, '六': 6, '七': 7, '八': 8, '九': 9}
+CN_UNITS = {'十': 10, '百': 100}
+# 默认调节步长
+DEFAULT_STEP = 5
+
+# 数字：20、20%、二十、百分之二十、一百
+NUM = r'(?P<num>百分之[零〇一二两三四五六七八九十百\d]+|[零〇一二两三四五六七八九十百]+|\d{1,3})\s*[%％]?'
+VOLUME = r'(?:系统)?(?:音量|声音)'
+BRIGHTNESS = r'(?:屏幕|系统)?亮度'
+SET = r'(?:调整|调节|调|设置|设|改|开)?(?:到|为|成)'
+UP = r'(?P<up>大|高|亮|响)'
+DOWN = r'(?P<down>小|低|暗)'
+A_LITTLE = r'(?:一点|一些|点|些|一点儿)?'
+OPEN = r'(?:打开|启动|开启|运行)'
+
+# 出现这些词说明包含多个指令，交给大模型处理
+COMPOUND = re.compile(r'并且|然后|同时|再|和|及|以及|[,，;；、]')
+PREFIX = re.compile(r'^(?:请|麻烦|帮我|帮忙|给我|你|能不能|可以)*(?:把|将)?')
+SUFFIX = re.compile(r'(?:一下|吧|呀|啊|哦|好吗|好不好|谢谢)+$')
+# 工具以字符串返回的错误（平台不支持、权限不足、命令失败等），规则路由命中时不直接回复，交给 agent 处理
+ERROR_REPLY = re.compile(r'^(?:Unsupported platform|Application .+ not found|Failed to open|无法找到)|出错|失败|权限|必须在0到100之间')
+
+
+def parse_number(text: str) -> Optional[int]:
+    """解析阿拉伯数字和中文数字（二十、二十五、一百、百分之五十）"""
+    if text.startswith('百分之'):
+        text = text[3:]
+    if text.isdigit():
+        return int(text)
+
+    total, current = 0, 0
+    for char in text:
+        if char in CN_DIGITS:
+            current = CN_DIGITS[char]
+        elif char in CN_UNITS:
+            total += (current or 1) * CN_UNITS[char]
+            current = 0
+        else:
+            return None
+    return total + current
+
+
+class IntentMatch(NamedTuple):
+    intent: str
+    tool: Any
+    args: Dict[str, Any]
+
+
+class IntentRouter:
+    """预编译的指令规则，按顺序匹配，第一个命中的规则生效"""
+
+    def __init__(self):
+        self._rules: List[Tuple[str, re.Pattern, Callable[[re.Match], Optional[IntentMatch]]]] = []
+        self._lock = threading.Lock()
+        self.total = 0
+        self.hits = 0
+        self.errors = 0
+        self.intent_hits: Dict[str, int] = {}
+        self._register_default_rules()
+
+    def add_rule(self, intent: str, pattern: str, build: Callable[[re.Match], Optional[IntentMatch]]) -> None:
+        """添加规则，build 根据匹配结果生成要调用的工具和参数，返回 None 表示放弃"""
+        self._rules.append((intent, re.compile(pattern, re.IGNORECASE), build))
+
+    def _register_default_rules(self) -> None:
+        def level(tool, arg_name, intent):
+            def build(match):
+                value = parse_number(match.group('num'))
+                if value is None or not (0 <= value <= 100):
+                    return None
+                return IntentMatch(intent, tool, {arg_name: value})
+            return build
+
+        def step(tool, intent):
+            def build(match):
+                value = DEFAULT_STEP
+                if match.groupdict().get('num'):
+                    value = parse_number(match.group('num'))
+                    if not value or value > 100:
+                        return None
+                return IntentMatch(intent, tool, {'step': value if match.group('up') else -value})
+            return build
+
+        def fixed(tool, intent):
+            return lambda match: IntentMatch(intent, tool, {})
+
+        self.add_rule('mute_volume', rf'^(?:静音|{VOLUME}(?:静音|关掉|关闭|关了)|(?:打开|开启)静音)$',
+                      fixed(mute_volume, 'mute_volume'))
+        self.add_rule('recover_volume', rf'^(?:取消静音|解除静音|关闭静音|恢复{VOLUME}|{VOLUME}恢复)$',
+                      fixed(recover_volume, 'recover_volume'))
+        self.add_rule('set_volume', rf'^{VOLUME}{SET}{NUM}$', level(set_volume, 'volume_level', 'set_volume'))
+        self.add_rule('adjust_volume', rf'^{VOLUME}(?:调|调节)?(?:{UP}|{DOWN}){A_LITTLE}(?:{NUM})?$',
+                      step(adjust_volume, 'adjust_volume'))
+        self.add_rule('adjust_volume', rf'^(?:调|调节)?(?:{UP}|{DOWN}){A_LITTLE}{VOLUME}$',
+                      step(adjust_volume, 'adjust_volume'))
+        self.add_rule('set_brightness', rf'^{BRIGHTNESS}{SET}{NUM}$',
+                      level(set_brightness, 'brightness_level', 'set_brightness'))
+        self.add_rule('adjust_brightness', rf'^{BRIGHTNESS}(?:调|调节)?(?:{UP}|{DOWN}){A_LITTLE}(?:{NUM})?$',
+                      step(adjust_brightness, 'adjust_brightness'))
+        # 没有说明对象时只有“调亮/调暗”能确定是亮度，“调大一点”“调高一点”也可能是音量，交给大模型
+        self.add_rule('adjust_brightness',
+                      rf'^(?P<lead>屏幕)?(?:调|调节)(?:{UP}|{DOWN}){A_LITTLE}(?P<subject>{BRIGHTNESS}|屏幕)?$',
+                      self._with_subject(step(adjust_brightness, 'adjust_brightness'), '亮暗'))
+        self.add_rule('open_calc', rf'^(?:{OPEN}(?:系统)?(?:计算器|calculator|calc)|(?:系统)?(?:计算器|calculator|calc){OPEN})$',
+                      fixed(open_calc, 'open_calc'))
+        self.add_rule('open_application', rf'^(?:{OPEN}\s*(?P<app>.+?)|(?P<app2>.+?)\s*{OPEN})$',
+                      self._open_application)
+
+    @staticmethod
+    def _with_subject(build: Callable[[re.Match], Optional[IntentMatch]], implied: str):
+        """规则中的对象（lead / subject）可以省略时，只有方向词本身能确定对象（implied 中的字）才继续"""
+        def wrapper(match):
+            direction = match.group('up') or match.group('down')
+            if not (match.group('lead') or match.group('subject')) and direction not in implied:
+                return None
+            return build(match)
+        return wrapper
+
+    @staticmethod
+    def _open_application(match: re.Match) -> Optional[IntentMatch]:
+        # 只有规则或应用目录精确识别的应用才走快速路径；未知应用和模糊匹配（可能打开错误的应用）交给大模型
+        app_name = (match.group('app') or match.group('app2')).strip()
+        try:
+            if not get_matcher().match_exact(app_name) and not get_app_catalog().lookup(app_name, exact=True):
+                return None
+        except EnvironmentError:
+            return None
+        return IntentMatch('open_application', open_application, {'app_name': app_name})
+
+    @staticmethod
+    def normalize(query: str) -> str:
+        query = query.strip().rstrip('。.！!？?~～ ')
+        query = PREFIX.sub('', query)
+        query = SUFFIX.sub('', query)
+        return query.strip()
+
+    def route(self, query: str) -> Optional[IntentMatch]:
+        """匹配指令，没有命中或者指令有歧义时返回 None"""
+        query = self.normalize(query)
+        if not query or COMPOUND.search(query):
+            return None
+        for intent, pattern, build in self._rules:
+            match = pattern.match(query)
+            if match:
+                return build(match)
+        return None
+
+    def handle(self, query: str) -> Optional[str]:
+        """命中规则时直接调用工具并返回工具的回复，否则返回 None（交给 agent 处理）"""
+        intent_match = self.route(query)
+        with self._lock:
+            self.total += 1
+        if intent_match is None:
+            return None
+
+        try:
+            reply = intent_match.tool.invoke(intent_match.args)
+        except Exception:
+            reply = None
+        if not isinstance(reply, str) or ERROR_REPLY.search(reply):
+            # 工具执行失败不算命中，交给 agent 处理（agent 可以解释错误或者换一种方式）
+            with self._lock:
+                self.errors += 1
+            return None
+
+        with self._lock:
+            self.hits += 1
+            self.intent_hits[intent_match.intent] = self.intent_hits.get(intent_match.intent, 0) + 1
+        return reply
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'total': self.total,
+                'hits': self.hits,
+                'errors': self.errors,
+                'hit_rate': round(self.hits / self.total, 4) if self.total else 0.0,
+                'intents': dict(self.intent_hits)
+            }
+
+
+# 进程内共享的路由
+intent_router = IntentRouter()
+
+
+if __name__ == '__main__':
+    for text in ['音量调整到20%', '静音', '亮度调高一点', '打开vscode', '帮我把计算器打开',
+                 '把音量调到百分之五十', '声音小一点', '调亮一点', '调大一点', '屏幕调高一点', '帮我把QQ音乐打开',
+                 '打开vscode并且亮度设置到50']:
+        intent_match = intent_router.route(text)
+        print(text, '->', intent_match and (intent_match.intent, intent_match.args))
@@ -1,6 +1,5 @@
 from langchain_openai import ChatOpenAI
 from langchain.agents import AgentExecutor, create_tool_calling_agent, create_react_agent
-from langchain_core.callbacks.manager import CallbackManager
 from langchain_core.callbacks.streaming_stdout import StreamingStdOutCallbackHandler
 from langchain_core.prompts import (
     ChatPromptTemplate,
@@ -22,9 +21,19 @@ from tools import (
     organize_files
 )
 from utils import transform_messages_type, ChatMessage
+from utils.http_pool import http_client_kwargs
+from utils.response_cache import create_response_cache, ResponseCache
+from utils.history_manager import HistoryManager, extractive_summarizer, make_llm_summarizer
+from utils.cancellation import CancelToken, CancellationHandler, set_cancel_token, reset_cancel_token
+from intent_router import intent_router
+from agent_runtime import ConcurrentAgentExecutor
 
-from typing import Optional, List
+from typing import Optional, List, AsyncIterator, Tuple
+from collections import OrderedDict
 from dotenv import load_dotenv, find_dotenv
+import threading
+import hashlib
+import asyncio
 import os
 
 load_dotenv(find_dotenv())
@@ -33,6 +42,59 @@ model_name = 'glm-4'
 openai_api_base = 'https://open.bigmodel.cn/api/paas/v4/'
 zhipu_key = os.environ['ZHIPUAI_API_KEY']
 model_temperature = 0.95
+# 代理执行器缓存的最大数量，超出后淘汰最久未使用的
+executor_cache_size = int(os.environ.get('EXECUTOR_CACHE_SIZE', 8))
+_executor_cache: 'OrderedDict[Tuple, AgentExecutor]' = OrderedDict()
+_executor_cache_lock = threading.Lock()
+# 不会改变系统状态的工具（调用了其他工具的回复不会被缓存）
+READ_ONLY_TOOLS = {'_Exception'}
+# 回复缓存，默认关闭（RESPONSE_CACHE=memory|sqlite 开启）
+response_cache: Optional[ResponseCache] = create_response_cache(
+    backend=os.environ.get('RESPONSE_CACHE'),
+    ttl=float(os.environ.get('RESPONSE_CACHE_TTL', 3600)),
+    path=os.environ.get('RESPONSE_CACHE_PATH'),
+    max_entries=int(os.environ.get('RESPONSE_CACHE_SIZE', 1024))
+)
+_toolset_version: Optional[str] = None
+# 简单设备指令直接由规则路由处理，不经过大模型（INTENT_ROUTER=0 关闭）
+intent_router_enabled = os.environ.get('INTENT_ROUTER', '1') == '1'
+
+
+# 早期历史消息的摘要方式：extractive（默认，不调用模型）或 llm
+def history_summarizer():
+    if os.environ.get('HISTORY_SUMMARIZER', 'extractive') != 'llm':
+        return extractive_summarizer
+    return make_llm_summarizer(ChatOpenAI(
+        temperature=0.1,
+        model=model_name,
+        api_key=zhipu_key,
+        base_url=openai_api_base,
+        **http_client_kwargs(openai_api_base)
+    ))
+
+
+# 历史消息按模型的 token 预算裁剪（HISTORY_TRIM=0 关闭，原样发送全部历史）
+history_manager: Optional[HistoryManager] = (
+    HistoryManager(summarizer=history_summarizer()) if os.environ.get('HISTORY_TRIM', '1') == '1' else None
+)
+
+
+# 历史消息转换为 langchain 消息（converted_history 是会话中已经转换好的消息，和 history_messages 一一对应）
+def prepare_chat_history(
+        history_messages: Optional[List[ChatMessage]],
+        model: Optional[str],
+        conversation_id: Optional[str] = None,
+        converted_history: Optional[List] = None
+) -> List:
+    if not history_messages:
+        return []
+    if history_manager is None:
+        if converted_history is not None:
+            return converted_history[1:] if history_messages[0].role == 'system' else list(converted_history)
+        return transform_messages_type(history_messages=history_messages)
+    return history_manager.prepare(
+        history_messages, model=model, conversation_id=conversation_id, converted=converted_history
+    )
 
 
 # 获取所有工具集
@@ -54,6 +116,28 @@ def get_tools(tool=None) -> List:
     return tools
 
 
+# 工具集版本：工具的名称、描述、参数变化后缓存自动失效
+def toolset_version() -> str:
+    global _toolset_version
+    if _toolset_version is None:
+        signature = [(tool.name, tool.description, str(tool.args)) for tool in get_tools()]
+        _toolset_version = hashlib.sha256(repr(signature).encode('utf-8')).hexdigest()[:16]
+    return _toolset_version
+
+
+# 本次运行是否调用了有副作用的工具
+def has_side_effects(intermediate_steps) -> bool:
+    return any(action.tool not in READ_ONLY_TOOLS for action, _ in intermediate_steps or [])
+
+
+# 写入回复缓存（有副作用的运行不缓存）
+def cache_response(cache_key: str, output: str, intermediate_steps) -> None:
+    if has_side_effects(intermediate_steps):
+        response_cache.bypass()
+    else:
+        response_cache.set(cache_key, output)
+
+
 # 加载prompt
 def load_prompt(prompt_type: str = None, custom_prompt=None):
     if custom_prompt:
@@ -68,29 +152,20 @@ def load_prompt(prompt_type: str = None, custom_prompt=None):
     return prompt
 
 
-# 创建代理执行器
-def executor_llm_agent(
+# 构建代理执行器（不绑定回调，回调在invoke时通过config传入，便于多个请求复用）
+def build_llm_agent(
         model: Optional[str] = model_name,
         streaming: Optional[bool] = True,
-        temperature: Optional[float] = model_temperature,
-        **kwargs):
-    # 流式输出
-    if streaming:
-        llm = ChatOpenAI(
-            temperature=temperature,
-            model=model,
-            api_key=zhipu_key,
-            base_url=openai_api_base,
-            streaming=streaming,
-            callback_manager=CallbackManager([StreamingStdOutCallbackHandler()])
-        )
-    else:
-        llm = ChatOpenAI(
-            temperature=temperature,
-            model=model,
-            api_key=zhipu_key,
-            base_url=openai_api_base
-        )
+        temperature: Optional[float] = model_temperature):
+    llm = ChatOpenAI(
+        temperature=temperature,
+        model=model,
+        api_key=zhipu_key,
+        base_url=openai_api_base,
+        streaming=streaming,
+        # 复用共享连接池，避免每次请求都重新建立 TCP+TLS 连接
+        **http_client_kwargs(openai_api_base)
+    )
 
     # agent = create_react_agent(llm, tools, prompt)
     # create_tool_calling_agent 使用其他的 会导致tool中参数不能正常输入
@@ -103,15 +178,19 @@ def executor_llm_agent(
             MessagesPlaceholder(variable_name='agent_scratchpad')
         ]
     )
-    agent = create_tool_calling_agent(llm, get_tools(), load_prompt(custom_prompt=chat_prompt))
+    tools = get_tools()
+    agent = create_tool_calling_agent(llm, tools, load_prompt(custom_prompt=chat_prompt))
 
     # 代理执行器
     def agent_executor_option(verbose: bool = True, handle_parsing_errors: bool = True):
-        agent_executor = AgentExecutor(
+        # 同一步中相互独立的工具调用并发执行
+        agent_executor = ConcurrentAgentExecutor(
             agent=agent,
-            tools=get_tools(),
+            tools=tools,
             verbose=verbose,
-            handle_parsing_errors=handle_parsing_errors
+            handle_parsing_errors=handle_parsing_errors,
+            # 返回工具调用记录，用于判断回复能否缓存
+            return_intermediate_steps=True
         )
         return agent_executor
 
@@ -120,17 +199,67 @@ def executor_llm_agent(
     return agent_executor
 
 
+# 获取代理执行器：按 (model, temperature, streaming) 缓存复用，超出容量时淘汰最久未使用的
+def executor_llm_agent(
+        model: Optional[str] = model_name,
+        streaming: Optional[bool] = True,
+        temperature: Optional[float] = model_temperature,
+        **kwargs):
+    key = (model, temperature, bool(streaming))
+    with _executor_cache_lock:
+        agent_executor = _executor_cache.get(key)
+        if agent_executor is not None:
+            _executor_cache.move_to_end(key)
+            return agent_executor
+
+        agent_executor = build_llm_agent(model=model, streaming=streaming, temperature=temperature)
+        _executor_cache[key] = agent_executor
+        while len(_executor_cache) > executor_cache_size:
+            _executor_cache.popitem(last=False)
+        return agent_executor
+
+
+# 预先构建默认模型的代理执行器，避免首个请求承担构建开销
+def warmup_executors(models: Optional[List[str]] = None):
+    for model in models or [model_name]:
+        for streaming in (True, False):
+            executor_llm_agent(model=model, streaming=streaming, temperature=model_temperature)
+
+
+# 每次调用时传入的回调（流式输出打印到控制台；传入取消标记时客户端断开后中断运行）
+def invoke_callbacks(streaming: Optional[bool] = True, cancel_token: Optional[CancelToken] = None) -> List:
+    callbacks = [StreamingStdOutCallbackHandler()] if streaming else []
+    if cancel_token is not None:
+        callbacks.append(CancellationHandler(cancel_token))
+    return callbacks
+
+
 def stdout_result(
         query: str,
         history_messages: Optional[List[ChatMessage]] = None,
         model: Optional[str] = model_name,
         streaming: Optional[bool] = True,
         temperature: Optional[float] = model_temperature,
+        conversation_id: Optional[str] = None,
+        converted_history: Optional[List] = None,
+        cancel_token: Optional[CancelToken] = None,
         **kwargs
 ):
-    if not temperature:
+    if temperature is None:
         temperature = model_temperature
 
+    if intent_router_enabled:
+        routed_value = intent_router.handle(query)
+        if routed_value is not None:
+            return routed_value
+
+    cache_key = None
+    if response_cache:
+        cache_key = response_cache.make_key(model, temperature, query, history_messages, toolset_version())
+        cached_value = response_cache.get(cache_key)
+        if cached_value is not None:
+            return cached_value
+
     agent_with_chat_history = executor_llm_agent(
         model=model,
         temperature=temperature,
@@ -138,15 +267,138 @@ def stdout_result(
         **kwargs
     )
 
-    # 获取历史消息
-    chat_history = []
-    if history_messages:
-        chat_history = transform_messages_type(history_messages=history_messages)
+    # 获取历史消息（超出模型的 token 预算时早期消息替换为摘要）
+    chat_history = prepare_chat_history(history_messages, model, conversation_id, converted_history)
+
+    # 工作线程会被复用，取消标记只在本次调用期间有效
+    context_token = set_cancel_token(cancel_token)
+    try:
+        received_value = agent_with_chat_history.invoke(
+            {'input': query, 'chat_history': chat_history},
+            config={'callbacks': invoke_callbacks(streaming, cancel_token)}
+        )
+    finally:
+        reset_cancel_token(context_token)
+    if cache_key:
+        cache_response(cache_key, received_value['output'], received_value['intermediate_steps'])
+    return received_value['output']
+
+
+async def ainvoke_result(
+        query: str,
+        history_messages: Optional[List[ChatMessage]] = None,
+        model: Optional[str] = model_name,
+        streaming: Optional[bool] = False,
+        temperature: Optional[float] = model_temperature,
+        conversation_id: Optional[str] = None,
+        converted_history: Optional[List] = None,
+        cancel_token: Optional[CancelToken] = None,
+        **kwargs
+) -> str:
+    """
+    stdout_result 的异步版本：模型请求使用异步 client 在事件循环中执行，
+    取消所在的任务会立即中断正在进行的模型 HTTP 请求（工作线程中的同步请求只能等它结束）
+    """
+    if temperature is None:
+        temperature = model_temperature
+
+    if intent_router_enabled:
+        routed_value = await asyncio.to_thread(intent_router.handle, query)
+        if routed_value is not None:
+            return routed_value
+
+    cache_key = None
+    if response_cache:
+        cache_key = response_cache.make_key(model, temperature, query, history_messages, toolset_version())
+        cached_value = await asyncio.to_thread(response_cache.get, cache_key)
+        if cached_value is not None:
+            return cached_value
+
+    # 缓存未命中时构建执行器，和读取历史一样放到线程中执行
+    agent_with_chat_history = await asyncio.to_thread(
+        executor_llm_agent, model=model, temperature=temperature, streaming=streaming, **kwargs
+    )
+    chat_history = await asyncio.to_thread(
+        prepare_chat_history, history_messages, model, conversation_id, converted_history
+    )
 
-    received_value = agent_with_chat_history.invoke({'input': query, 'chat_history': chat_history})
+    # 取消标记在调用方任务的上下文中设置，任务结束时随之丢弃
+    set_cancel_token(cancel_token)
+    received_value = await agent_with_chat_history.ainvoke(
+        {'input': query, 'chat_history': chat_history},
+        config={'callbacks': invoke_callbacks(streaming, cancel_token)}
+    )
+    if cache_key:
+        cache_response(cache_key, received_value['output'], received_value['intermediate_steps'])
     return received_value['output']
 
 
+async def astream_result(
+        query: str,
+        history_messages: Optional[List[ChatMessage]] = None,
+        model: Optional[str] = model_name,
+        temperature: Optional[float] = model_temperature,
+        conversation_id: Optional[str] = None,
+        converted_history: Optional[List] = None,
+        cancel_token: Optional[CancelToken] = None,
+        **kwargs
+) -> AsyncIterator[str]:
+    """
+    逐token流式输出agent的回答（模型生成一个token就输出一个token）
+    取消消费方所在的任务会中断正在进行的模型请求；cancel_token 用于在工具执行线程中设置取消后停止后续步骤
+    """
+    if temperature is None:
+        temperature = model_temperature
+
+    if intent_router_enabled:
+        # 工具调用是同步的，放到线程中执行避免阻塞事件循环
+        routed_value = await asyncio.to_thread(intent_router.handle, query)
+        if routed_value is not None:
+            yield routed_value
+            return
+
+    cache_key = None
+    if response_cache:
+        cache_key = response_cache.make_key(model, temperature, query, history_messages, toolset_version())
+        # 缓存可能是 SQLite 后端，查询放到线程中执行
+        cached_value = await asyncio.to_thread(response_cache.get, cache_key)
+        if cached_value is not None:
+            yield cached_value
+            return
+
+    # 首次创建 agent 会构建模型 client 和工具，同样放到线程中执行
+    agent_with_chat_history = await asyncio.to_thread(
+        executor_llm_agent,
+        model=model,
+        temperature=temperature,
+        streaming=True,
+        **kwargs
+    )
+
+    # 获取历史消息（超出模型的 token 预算时早期消息替换为摘要，摘要可能调用模型），放到线程中执行避免阻塞事件循环
+    chat_history = await asyncio.to_thread(
+        prepare_chat_history, history_messages, model, conversation_id, converted_history
+    )
+
+    # 执行器在每一步之前检查取消标记（在生产者任务的上下文中设置，任务结束时随之丢弃）
+    set_cancel_token(cancel_token)
+    # astream_events 会把agent内部chat model的增量输出以事件的形式抛出
+    async for event in agent_with_chat_history.astream_events(
+            {'input': query, 'chat_history': chat_history},
+            config={'callbacks': invoke_callbacks(streaming=True, cancel_token=cancel_token)},
+            version='v2'
+    ):
+        if event['event'] == 'on_chat_model_stream':
+            # tool call 的参数增量 content 为空，只转发文本内容
+            content = event['data']['chunk'].content
+            if content:
+                yield content
+        elif cache_key and event['event'] == 'on_chain_end' and not event['parent_ids']:
+            # 最外层 AgentExecutor 结束，得到完整回复和工具调用记录
+            output = event['data']['output']
+            cache_response(cache_key, output['output'], output['intermediate_steps'])
+
+
 if __name__ == '__main__':
     agent_with_chat_history = executor_llm_agent(streaming=False)
     result = agent_with_chat_history.invoke({'input': '帮我把 Visual Studio Code 打开'})
@@ -1,10 +1,18 @@
 import os
 import ctypes
+import threading
+from enum import IntEnum
+from concurrent.futures import Executor
+from collections import OrderedDict
+from typing import Dict, Tuple, NamedTuple, Optional, AsyncIterator, Union, List
 from ctypes import cdll
 from ctypes import Structure
 from time import sleep
 import asyncio
 
+from utils import StreamChannel
+from utils.cancellation import CancelToken
+
 DLL_FILE = 'flowy.dll'
 DLL_PATH = os.path.join(os.path.dirname(__file__), DLL_FILE)
 
@@ -19,6 +27,19 @@ class ChatMessage(Structure):
     _fields_ = [("role", ctypes.c_int), ("content", ctypes.c_char_p)]
 
 
+class FlowyStatus(IntEnum):
+    """流式输出回调的状态"""
+    SPLASH = 0  # 开场
+    INCREMENT = 1  # 增量内容
+    FINISH = 2  # 结束
+    FULL = 3  # 完整内容
+
+
+class FlowyEvent(NamedTuple):
+    status: Union[FlowyStatus, int]
+    fragment: str
+
+
 # 定义函数类型
 ret_type = None
 arg_types = (ctypes.c_int, ctypes.c_char_p)
@@ -40,13 +61,38 @@ class CallResult(Structure):
 
 flowyDLL = cdll.LoadLibrary(DLL_PATH)
 
+# 加载 DLL 时统一声明参数和返回值类型，调用时不再重复设置
+flowyDLL.InitEnv.restype = ctypes.POINTER(CallResult)
+flowyDLL.AddOpenAIChatModel.argtypes = [Model]
+flowyDLL.AddOpenAIChatModel.restype = ctypes.c_int
+CHAT_FUNCTIONS = (
+    'ChatWithPCAssistant',
+    'ChatWithWeeklyReportAssistant',
+    'ChatWithMindMapAssistant',
+    'ChatWithMeetingMinutesAssistant',
+    'ChatWithAgents',
+)
+for _name in CHAT_FUNCTIONS:
+    getattr(flowyDLL, _name).argtypes = [ChatInput]
+    getattr(flowyDLL, _name).restype = ctypes.POINTER(CallResult)
+
+# 中断正在进行的对话：DLL 导出该函数（参数为对话调用的 ChatInput）时，客户端断开后通知 DLL 停止，
+# 没有导出时只丢弃之后的回调（DLL 调用仍然会执行完）
+FLOWY_CANCEL_FUNCTION = os.environ.get('FLOWY_CANCEL_FUNCTION', 'CancelChat')
+flowy_cancel = getattr(flowyDLL, FLOWY_CANCEL_FUNCTION, None)
+if flowy_cancel is not None:
+    flowy_cancel.argtypes = [ctypes.POINTER(ChatInput)]
+    flowy_cancel.restype = ctypes.c_int
+
+# 历史消息角色 0 system,1 user,2 assistant
+ROLE_IDS = {'system': 0, 'user': 1, 'assistant': 2}
+
 
 # def message_response(status,msg):
 #     print(msg.decode("utf-8"))
 
 
 def init_flowy_env():
-    flowyDLL.InitEnv.restype = ctypes.POINTER(CallResult)
     result = flowyDLL.InitEnv()
 
     return result[0].success == 0
@@ -54,111 +100,177 @@ def init_flowy_env():
 
 
 def add_model(name, endpoint, apikey):
-    model = Model()
-    model.name = ctypes.c_char_p(name.encode("utf-8"))
-    model.apikey = ctypes.c_char_p(apikey.encode("utf-8"))
-    model.endpoint = ctypes.c_char_p(endpoint.encode("utf-8"))
+    model = Model(name.encode("utf-8"), endpoint.encode("utf-8"), apikey.encode("utf-8"))
 
     mid = flowyDLL.AddOpenAIChatModel(model)
 
     return mid
 
 
-def chat_with_pc_assistant(model_id, message, msg_history, stream_callback):
+class HistoryEncoder:
+    """历史消息编码缓存：同一个对话的多轮请求中，未变化的历史前缀直接复用已编码的 buffer"""
+
+    def __init__(self, max_conversations: int = 128):
+        self.max_conversations = max_conversations
+        self._cache: 'OrderedDict[str, List[Tuple[int, str, bytes]]]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _parse(message) -> Tuple[int, str]:
+        # 兼容 {"role":0,"content":"消息"} 和带 role/content 属性的对象，role 可以是数字或 user/assistant/system
+        if isinstance(message, dict):
+            role, content = message['role'], message['content']
+        else:
+            role, content = message.role, message.content
+        return ROLE_IDS.get(role, role), content
+
+    def encode(self, msg_history, conversation_id: Optional[str] = None) -> List[Tuple[int, str, bytes]]:
+        """返回 [(role, content, content_bytes)]，conversation_id 为空时不缓存"""
+        with self._lock:
+            cached = self._cache.get(conversation_id, []) if conversation_id else []
+
+        encoded = []
+        for i, message in enumerate(msg_history):
+            role, content = self._parse(message)
+            if i < len(cached) and cached[i][0] == role and cached[i][1] == content:
+                encoded.append(cached[i])
+            else:
+                encoded.append((role, content, content.encode("utf-8")))
+
+        if conversation_id:
+            with self._lock:
+                self._cache[conversation_id] = encoded
+                self._cache.move_to_end(conversation_id)
+                while len(self._cache) > self.max_conversations:
+                    self._cache.popitem(last=False)
+        return encoded
+
+    def forget(self, conversation_id: str) -> None:
+        with self._lock:
+            self._cache.pop(conversation_id, None)
+
+
+history_encoder = HistoryEncoder()
+
+
+def _chat(func_name, model_id, message, msg_history=None, stream_callback=None, conversation_id=None,
+          cancel_token: Optional[CancelToken] = None) -> CallResult:
+    """所有对话接口的统一调用入口
+    历史消息一次性写入连续的 ChatMessage 数组，编码后的 buffer 在调用期间保持引用
+    :param cancel_token: 取消标记，设置取消时通知 DLL 停止本次调用（DLL 支持时）
+    """
+    encoded = history_encoder.encode(msg_history or [], conversation_id)
+    history = (ChatMessage * len(encoded))(*[(role, content_bytes) for role, _, content_bytes in encoded])
+    message_bytes = message.encode("utf-8")
+    callback = call_type(stream_callback) if stream_callback else call_type()
+
+    chat_input = ChatInput()
+    chat_input.agentId = 0
+    chat_input.modelId = model_id
+    chat_input.historyMessages = ctypes.cast(history, ctypes.POINTER(ChatMessage))
+    chat_input.historyCount = len(encoded)
+    chat_input.message = message_bytes
+    chat_input.call = callback
+
+    if cancel_token is not None:
+        cancel_token.raise_if_cancelled()
+    unregister = lambda: None
+    if cancel_token is not None and flowy_cancel is not None:
+        unregister = cancel_token.on_cancel(lambda: flowy_cancel(ctypes.byref(chat_input)))
+    try:
+        result = getattr(flowyDLL, func_name)(chat_input)
+    finally:
+        unregister()
+    return result[0]
+
+
+class FlowySession:
+    """flowy 会话管理：每个进程只初始化一次环境，每个模型只注册一次（线程安全）"""
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._initialized = False
+        self._models: Dict[Tuple[str, str, str], int] = {}
+
+    def ensure_env(self) -> None:
+        """初始化运行环境（只在第一次调用时执行）"""
+        with self._lock:
+            if self._initialized:
+                return
+            if not init_flowy_env():
+                raise RuntimeError('flowy 环境初始化失败')
+            self._initialized = True
+
+    def model_id(self, name: str, endpoint: str, apikey: str) -> int:
+        """获取模型id，第一次使用时注册模型，之后直接返回已注册的id"""
+        key = (name, endpoint, apikey)
+        with self._lock:
+            self.ensure_env()
+            if key not in self._models:
+                self._models[key] = add_model(name, endpoint, apikey)
+            return self._models[key]
+
+    def health(self) -> Dict:
+        """当前环境状态（不包含apikey）"""
+        with self._lock:
+            return {
+                'initialized': self._initialized,
+                'cancel_supported': flowy_cancel is not None,
+                'models': [
+                    {'name': name, 'endpoint': endpoint, 'model_id': mid}
+                    for (name, endpoint, _), mid in self._models.items()
+                ]
+            }
+
+    def reset(self) -> None:
+        """重置状态，下次使用时重新初始化环境并注册模型"""
+        with self._lock:
+            self._initialized = False
+            self._models.clear()
+
+
+# 进程内共享的 flowy 会话
+flowy_session = FlowySession()
+
+
+def chat_with_pc_assistant(model_id, message, msg_history, stream_callback, conversation_id=None):
     """PC助手对话
     :param model_id: 模型id
     :param message: 消息
     :param msg_history: 历史对话 [{"role":0,"content":"消息"}] 0 system,1 user,2 assistant
     :param stream_callback: 流式输出回调  def callback(status,msg),status 输出状态 status 0:splash 1:increment 2:finish,msg消息的bytes 需要decode("utf-8")
+    :param conversation_id: 对话id，同一个对话的多轮请求会复用已编码的历史消息
     :return: 请求成功或失败
     """
-    chatInput = ChatInput()
-
-    chatInput.agentId = ctypes.c_int(0)
-    chatInput.modelId = ctypes.c_int(model_id)
-
-    history = (ChatMessage * len(msg_history))()
-    for i in range(len(msg_history)):
-        history[i] = ChatMessage()
-        raw_history = msg_history[i]
-        history[i].role = ctypes.c_int(raw_history.role)
-        history[i].content = ctypes.c_char_p(ctypes.c_char_p(raw_history.content.encode("utf-8")))
-
-    chatInput.historyCount = ctypes.c_int(len(msg_history))
-    chatInput.message = ctypes.c_char_p(message.encode("utf-8"))
-
-    chatInput.call = call_type(stream_callback)
+    return _chat('ChatWithPCAssistant', model_id, message, msg_history, stream_callback, conversation_id).success == 0
 
-    flowyDLL.ChatWithPCAssistant.restype = ctypes.POINTER(CallResult)
 
-    result = flowyDLL.ChatWithPCAssistant(chatInput)
-
-    return result[0].success == 0
-
-
-def chat_with_weekly_assistant(model_id, message, msg_history, stream_callback):
+def chat_with_weekly_assistant(model_id, message, msg_history, stream_callback, conversation_id=None):
     """周报助手对话
     :param model_id: 模型id
     :param message: 消息
     :param msg_history: 历史对话 [{"role":0,"content":"消息"}] 0 system,1 user,2 assistant
     :param stream_callback: 流式输出回调  def callback(status,msg),status 输出状态 status 0:splash 1:increment 2:finish,msg消息的bytes 需要decode("utf-8")
+    :param conversation_id: 对话id，同一个对话的多轮请求会复用已编码的历史消息
     :return: 请求成功或失败
     """
-    chatInput = ChatInput()
-
-    chatInput.agentId = ctypes.c_int(0)
-    chatInput.modelId = ctypes.c_int(model_id)
-
-    history = (ChatMessage * len(msg_history))()
-    for i in range(len(msg_history)):
-        history[i] = ChatMessage()
-        raw_history = msg_history[i]
-        history[i].role = ctypes.c_int(raw_history.role)
-        history[i].content = ctypes.c_char_p(ctypes.c_char_p(raw_history.content.encode("utf-8")))
-
-    chatInput.historyCount = ctypes.c_int(len(msg_history))
-    chatInput.message = ctypes.c_char_p(message.encode("utf-8"))
-
-    chatInput.call = call_type(stream_callback)
-
-    flowyDLL.ChatWithWeeklyReportAssistant.restype = ctypes.POINTER(CallResult)
-
-    result = flowyDLL.ChatWithWeeklyReportAssistant(chatInput)
-
-    return result[0].success == 0
+    return _chat('ChatWithWeeklyReportAssistant', model_id, message, msg_history, stream_callback,
+                 conversation_id).success == 0
 
 
-def chat_with_mindmap_assistant(model_id, message, msg_history):
+def chat_with_mindmap_assistant(model_id, message, msg_history, conversation_id=None):
     """思维导图助手对话
     :param model_id: 模型id
     :param message: 消息
     :param msg_history: 历史对话 [{"role":0,"content":"消息"}] 0 system,1 user,2 assistant
     :param stream_callback: 流式输出回调  def callback(status,msg),status 输出状态 status 0:splash 3:full,msg消息的bytes 需要decode("utf-8")
+    :param conversation_id: 对话id，同一个对话的多轮请求会复用已编码的历史消息
     :return: 请求成功或失败
     """
-    chatInput = ChatInput()
-
-    chatInput.agentId = ctypes.c_int(0)
-    chatInput.modelId = ctypes.c_int(model_id)
-
-    history = (ChatMessage * len(msg_history))()
-    for i in range(len(msg_history)):
-        history[i] = ChatMessage()
-        raw_history = msg_history[i]
-        history[i].role = ctypes.c_int(raw_history.role)
-        history[i].content = ctypes.c_char_p(ctypes.c_char_p(raw_history.content.encode("utf-8")))
-
-    chatInput.historyCount = ctypes.c_int(len(msg_history))
-    chatInput.message = ctypes.c_char_p(message.encode("utf-8"))
-
-    chatInput.call = call_type()
+    result = _chat('ChatWithMindMapAssistant', model_id, message, msg_history, conversation_id=conversation_id)
 
-    flowyDLL.ChatWithMindMapAssistant.restype = ctypes.POINTER(CallResult)
-
-    result = flowyDLL.ChatWithMindMapAssistant(chatInput)
-
-    if result[0].success == 0:
-        return result[0].message.decode("utf-8")
+    if result.success == 0:
+        return result.message.decode("utf-8")
     else:
         return ""
 
@@ -171,65 +283,81 @@ def chat_with_meeting_minutes_assistant(model_id, message):
     :param stream_callback: 流式输出回调  def callback(status,msg),status 输出状态 status 0:splash 3:full,msg消息的bytes 需要decode("utf-8")
     :return: 请求成功或失败
     """
-    chatInput = ChatInput()
-
-    chatInput.agentId = ctypes.c_int(0)
-    chatInput.modelId = ctypes.c_int(model_id)
-
-    chatInput.historyCount = ctypes.c_int(0)
-    chatInput.message = ctypes.c_char_p(message.encode("utf-8"))
-
-    chatInput.call = call_type()
+    result = _chat('ChatWithMeetingMinutesAssistant', model_id, message)
 
-    flowyDLL.ChatWithMeetingMinutesAssistant.restype = ctypes.POINTER(CallResult)
-
-    result = flowyDLL.ChatWithMeetingMinutesAssistant(chatInput)
-
-    if result[0].success == 0:
-        return result[0].message.decode("utf-8")
+    if result.success == 0:
+        return result.message.decode("utf-8")
     else:
         return ""
 
 
-def chat_with_agents(model_id, message, msg_history, stream_callback):
+def chat_with_agents(model_id, message, msg_history, stream_callback, conversation_id=None, cancel_token=None):
     """PC助手,脑图助手,周报助手统一入口
     :param model_id: 模型id
     :param message: 消息
     :param msg_history: 历史对话 [{"role":0,"content":"消息"}] 0 system,1 user,2 assistant
     :param stream_callback: 流式输出回调  def callback(status,msg),status 输出状态 status 0:splash 1:increment 2:finish，3:full,msg消息的bytes 需要decode("utf-8")
+    :param conversation_id: 对话id，同一个对话的多轮请求会复用已编码的历史消息
+    :param cancel_token: 取消标记，设置取消时通知 DLL 停止（DLL 支持时）
     :return: 请求成功或失败
     """
-    chatInput = ChatInput()
-
-    chatInput.agentId = ctypes.c_int(0)
-    chatInput.modelId = ctypes.c_int(model_id)
-
-    history = (ChatMessage * len(msg_history))()
-    for i in range(len(msg_history)):
-        history[i] = ChatMessage()
-        raw_history = msg_history[i]
-        history[i].role = ctypes.c_int(raw_history.role)
-        history[i].content = ctypes.c_char_p(ctypes.c_char_p(raw_history.content.encode("utf-8")))
-
-    chatInput.historyCount = ctypes.c_int(len(msg_history))
-    chatInput.message = ctypes.c_char_p(message.encode("utf-8"))
-
-    chatInput.call = call_type(stream_callback)
-
-    flowyDLL.ChatWithAgents.restype = ctypes.POINTER(CallResult)
-
-    result = flowyDLL.ChatWithAgents(chatInput)
-    # print(result[0].message.decode("utf-8"))
-    return result[0].success == 0
+    return _chat('ChatWithAgents', model_id, message, msg_history, stream_callback, conversation_id,
+                 cancel_token).success == 0
+
+
+async def stream_agents(
+        model_id,
+        message,
+        msg_history,
+        executor: Optional[Executor] = None,
+        conversation_id: Optional[str] = None,
+        cancel_token: Optional[CancelToken] = None
+) -> AsyncIterator[FlowyEvent]:
+    """chat_with_agents 的异步流式版本
+    阻塞的 DLL 调用在工作线程中执行，回调的片段通过线程安全的方式交给事件循环
+    用法：async for status, fragment in stream_agents(mid, "音量调整到20%", []): ...
+    :param executor: 执行 DLL 调用的线程池，默认使用事件循环的默认线程池
+    :param conversation_id: 对话id，同一个对话的多轮请求会复用已编码的历史消息
+    :param cancel_token: 取消标记，消费方提前结束（如客户端断开）时设置取消并通知 DLL 停止
+    """
+    loop = asyncio.get_running_loop()
+    channel = StreamChannel(loop=loop)
+    cancel_token = cancel_token or CancelToken()
+
+    def stream_callback(status, msg_fragment):
+        try:
+            status = FlowyStatus(status)
+        except ValueError:
+            pass
+        channel.put_threadsafe(FlowyEvent(status, msg_fragment.decode("utf-8") if msg_fragment else ''))
+
+    def run():
+        error = None
+        try:
+            if not chat_with_agents(model_id, message, msg_history, stream_callback, conversation_id, cancel_token):
+                error = RuntimeError('flowy 对话请求失败')
+        except Exception as e:
+            error = e
+        channel.finish_threadsafe(error)
+
+    loop.run_in_executor(executor, run)
+    finished = False
+    try:
+        async for event in channel:
+            yield event
+        finished = True
+    finally:
+        # 关闭通道后剩余的回调直接丢弃；提前结束时通知 DLL 停止（不支持中断时 DLL 调用会继续执行完）
+        channel.close()
+        if not finished:
+            cancel_token.cancel('consumer closed')
 
 
 if __name__ == '__main__':
     all_text = ''
 
-    #初始化环境
-    init_flowy_env()
-    # 添加模型
-    mid = add_model("deepseek-chat", "https://api.deepseek.com", "sk-8f229cb93e78416e96430020d260f2b7")
+    # 初始化环境并添加模型
+    mid = flowy_session.model_id("deepseek-chat", "https://api.deepseek.com", "sk-8f229cb93e78416e96430020d260f2b7")
 
 
     #流式输出回调
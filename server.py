@@ -1,25 +1,64 @@
+import os
 import uvicorn
 import time
 import json
 import asyncio
 import argparse
 
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
+from starlette.background import BackgroundTask
 from sse_starlette.sse import EventSourceResponse
 from langdetect import detect
 from pydantic import BaseModel, Field
-from typing import Literal, Optional, List, Union
-
-from run_assistant import init_flowy_env, chat_with_agents, add_model
-from llm_agent import stdout_result
-import asyncio
+from typing import Literal, Optional, List, Union, Any, Tuple
+from contextlib import asynccontextmanager
+
+from run_assistant import flowy_session, stream_agents, FlowyStatus
+import llm_agent
+from llm_agent import ainvoke_result, astream_result, warmup_executors
+from intent_router import intent_router
+from utils import StreamChannel, transform_messages_type
+from utils.agent_pool import AgentWorkerPool, AgentSlot, PoolSaturatedError
+from utils.http_pool import pool_stats, close_http_clients
+from utils.response_cache import create_response_cache
+from utils.session_store import create_session_store, Session
+from utils.sse_encoder import ChunkEncoder, coalesce, COALESCE_MS, COALESCE_BYTES
+from utils.cancellation import CancelToken, RunCancelled, cancellation_stats, watch_disconnect, cancel_task_on
+from tools.document_sink import document_writer
 
 model_name = 'glm-4'
-# 从agent输出的内容
-stream_out_content = ''
+# flowy 使用的模型 (name, endpoint, apikey)
+flowy_model = ("deepseek-chat", "https://api.deepseek.com", "sk-8f229cb93e78416e96430020d260f2b7")
+agent_max_workers = int(os.environ.get('AGENT_MAX_WORKERS', 8))
+agent_model_concurrency = int(os.environ.get('AGENT_MODEL_CONCURRENCY', 4))
+agent_queue_timeout = float(os.environ.get('AGENT_QUEUE_TIMEOUT', 30))
+# agent 执行线程池（按模型限制并发，名额已满时排队，超时返回429）
+agent_pool = AgentWorkerPool(
+    max_workers=agent_max_workers,
+    model_concurrency=agent_model_concurrency,
+    queue_timeout=agent_queue_timeout
+)
+# 启动时预先构建默认模型的代理执行器
+executor_warmup = os.environ.get('AGENT_WARMUP', '1') == '1'
+# 服务端对话会话（SESSION_STORE=memory|sqlite，默认关闭）
+session_store = create_session_store(
+    backend=os.environ.get('SESSION_STORE'),
+    ttl=float(os.environ.get('SESSION_TTL', 3600)),
+    path=os.environ.get('SESSION_STORE_PATH'),
+    max_sessions=int(os.environ.get('SESSION_MAX', 10000))
+)
+
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if executor_warmup:
+        warmup_executors([model_name])
+    yield
+    await close_http_clients()
+
+
+app = FastAPI(lifespan=lifespan)
 
 '''
 参数说明：
@@ -58,6 +97,11 @@ class ChatCompletionRequest(BaseModel):
     temperature: Optional[float] = None
     max_length: Optional[int] = None
     stream: Optional[bool] = True
+    # 对话id：为 "new" 时新建会话并在回复中返回 id；携带已有 id 时 messages 只需要包含本轮的新消息，历史由服务端保存
+    conversation_id: Optional[str] = None
+    # 流式输出时合并片段：间隔(ms)和字节数，为空时使用服务端的默认值（SSE_COALESCE_MS / SSE_COALESCE_BYTES）
+    coalesce_ms: Optional[int] = None
+    coalesce_bytes: Optional[int] = None
 
 
 # 定义ChatCompletionResponseChoice 数据模型-->储存ChatCompletionResponse的Choice
@@ -80,15 +124,20 @@ class ChatCompletionResponse(BaseModel):
     object: Literal["chat.completion", "chat.completion.chunk"]
     choices: List[Union[ChatCompletionResponseChoice, ChatCompletionResponseStreamChoice]]
     created: Optional[int] = Field(default_factory=lambda: int(time.time()))
+    conversation_id: Optional[str] = None
 
 
 class ChatAgent(BaseModel):
     flowy: bool = True
     query: str
     history_messages: List[ChatMessage]
-    model: str = model_name,
+    model: str = model_name
     temperature: Optional[float] = None
     stream: Optional[bool] = True
+    conversation_id: Optional[str] = None
+    # 会话中已经转换好的 langchain 消息，和 history_messages 一一对应
+    converted_history: Optional[List[Any]] = None
+
 
 # 判断语言
 def detect_language(text):
@@ -99,133 +148,266 @@ def detect_language(text):
         return False
 
 
-# 处理 agent invoke
-def selected_executor_agent(option: ChatAgent):
-    global stream_out_content
+# flowy agent 流式输出：只转发增量内容，没有增量时转发完整内容
+async def stream_flowy_agent(option: ChatAgent, cancel_token: Optional[CancelToken] = None):
+    # 环境只初始化一次，模型只注册一次
+    mid = await agent_pool.run_in_worker(flowy_session.model_id, *flowy_model)
+
+    received_increment = False
+    async for status, fragment in stream_agents(
+            mid,
+            option.query,
+            option.history_messages,
+            executor=agent_pool.executor,
+            conversation_id=option.conversation_id,
+            cancel_token=cancel_token
+    ):
+        if status == FlowyStatus.INCREMENT:
+            received_increment = True
+            yield fragment
+        elif status == FlowyStatus.FULL and not received_increment:
+            yield fragment
+
+
+# 生产者：把 agent 的输出写入通道，结束或出错时通知消费者并释放并发名额；客户端断开时被取消
+async def produce_executor_agent(option: ChatAgent, channel: StreamChannel, slot: AgentSlot, cancel_token: CancelToken):
+    try:
+        if option.flowy:
+            async for incremental_text in stream_flowy_agent(option, cancel_token):
+                await channel.put(incremental_text)
+        elif option.stream:
+            async for incremental_text in astream_result(
+                    query=option.query,
+                    history_messages=option.history_messages,
+                    model=option.model,
+                    temperature=option.temperature,
+                    conversation_id=option.conversation_id,
+                    converted_history=option.converted_history,
+                    cancel_token=cancel_token
+            ):
+                await channel.put(incremental_text)
+        else:
+            received_value = await ainvoke_result(
+                query=option.query,
+                history_messages=option.history_messages,
+                model=option.model,
+                streaming=option.stream,
+                temperature=option.temperature,
+                conversation_id=option.conversation_id,
+                converted_history=option.converted_history,
+                cancel_token=cancel_token
+            )
+            await channel.put(received_value)
+    except asyncio.CancelledError:
+        # 取消任务会中断正在进行的模型请求，工作线程中的运行在下一步之前停止
+        cancel_token.cancel('client disconnected')
+        cancellation_stats.record_cancelled(option.model, cancel_token)
+        raise
+    except Exception as e:
+        if isinstance(e, RunCancelled):
+            cancellation_stats.record_cancelled(option.model, cancel_token)
+        await channel.finish(e)
+    else:
+        cancellation_stats.record_completed(option.model, cancel_token)
+        await channel.finish()
+    finally:
+        slot.release()
+
+
+# 获取模型并发名额，已满且排队超时返回429
+async def acquire_agent_slot(model: str) -> AgentSlot:
+    try:
+        return await agent_pool.acquire(model)
+    except PoolSaturatedError as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={'Retry-After': '1'})
 
-    if option.flowy:
-        init_flowy_env()
-        mid = add_model(
-            "deepseek-chat",
-            "https://api.deepseek.com",
-            "sk-8f229cb93e78416e96430020d260f2b7"
-        )
 
-        # 流式输出回调
-        def stream_callback(status, msg_fragment):
-            # status 0:splash 1:increment 2:finish
-            global stream_out_content
+# 新建会话的 conversation_id
+NEW_CONVERSATION = 'new'
 
-            print(msg_fragment.decode("utf-8"))
-            stream_out_content += msg_fragment.decode("utf-8")
 
-        chat_with_agents(mid, option.query, option.history_messages, stream_callback=stream_callback)
-    else:
-        query = option.query
-        history_messages = option.history_messages
-        received_value = stdout_result(
-            query=query,
-            history_messages=history_messages,
-            model=option.model,
-            streaming=option.stream,
-            temperature=option.temperature
-        )
-        stream_out_content = received_value
+# 本轮请求的历史消息：携带 conversation_id 时为会话中保存的历史 + 本轮除最后一条以外的消息
+def load_history(request: ChatCompletionRequest) -> Tuple[Optional[Session], List[ChatMessage], Optional[List[Any]]]:
+    extra_messages = request.messages[:-1]
+    if not request.conversation_id:
+        # 没有要求会话时不保存任何状态，客户端每次发送完整的历史
+        return None, extra_messages, None
+    if session_store is None:
+        raise HTTPException(status_code=400, detail="Conversation sessions are disabled")
+    if request.conversation_id == NEW_CONVERSATION:
+        # 新建会话，回复中返回 conversation_id，之后的请求只需要发送新消息
+        return session_store.create(), extra_messages, None
+
+    session = session_store.get(request.conversation_id)
+    if session is None:
+        raise HTTPException(status_code=404, detail="Conversation not found or expired")
+    history_messages, converted_history = session.snapshot()
+    if extra_messages:
+        history_messages += extra_messages
+        converted_history += transform_messages_type(extra_messages, has_system=True)
+    return session, history_messages, converted_history
+
+
+# 一轮对话正常结束后把本轮的消息和回复追加到会话中
+def save_turn(session: Optional[Session], request: ChatCompletionRequest, answer: str) -> None:
+    if session is not None:
+        session_store.append(session, request.messages + [ChatMessage(role="assistant", content=answer)])
 
 
 @app.post("/v1/chat/completions")
-async def create_chat_completion(request: ChatCompletionRequest):
+async def create_chat_completion(request: ChatCompletionRequest, http_request: Request):
     if request.messages[-1].role != "user":
         raise HTTPException(status_code=400, detail="Invalid request")
     # 获取user的query
     query = request.messages[-1].content
     # 构建历史记录
-    chat_history = []
-    history_messages = request.messages[:-1]
-    for role, content in history_messages:
-        chat_history.append({"role": role, "content": content})
+    session, history_messages, converted_history = load_history(request)
+    conversation_id = session.id if session is not None else None
+    # 开启会话时回复中携带 conversation_id（没有开启时不输出该字段）
+    session_fields = {'conversation_id': conversation_id} if conversation_id else {}
 
     if request.stream:
-        # received_value = stdout_result(
-        #     query=query,
-        #     history_messages=history_messages,
-        #     model=request.model,
-        #     streaming=request.stream,
-        #     temperature=request.temperature
-        # )
-        selected_executor_agent(option=ChatAgent(
+        option = ChatAgent(
             query=query,
             history_messages=history_messages,
             model=request.model,
-            streaming=request.stream,
+            stream=request.stream,
             temperature=request.temperature,
-            flowy=False
-        ))
+            flowy=False,
+            conversation_id=conversation_id,
+            converted_history=converted_history
+        )
+        slot = await acquire_agent_slot(request.model)
 
         async def event_generator():
-            # 定义流式输出的设置
-            choice_data = ChatCompletionResponseStreamChoice(
-                index=0,
-                delta=DeltaMessage(role="assistant"),
-                finish_reason=None
-            )
-            # 将流式输出以ChatCompletionResponse数据模型储存
-            chunk = ChatCompletionResponse(model=request.model, choices=[choice_data], object="chat.completion.chunk")
-            # 使用yield进行流式输出
-            yield "{}".format(json.dumps(chunk.model_dump(exclude_unset=True), ensure_ascii=False))
-
-            start_time = time.time()
-            # for incremental_text in received_value:
-            for incremental_text in stream_out_content:
-                # if await request.is_disconnected():
-                #     print("连接已中断...")
-                #     break
+            # chunk 的结构只渲染一次（角色、内容模板、结束），之后每个片段只转义内容并拼接
+            def render(finish_reason=None, **delta) -> str:
                 choice_data = ChatCompletionResponseStreamChoice(
                     index=0,
-                    delta=DeltaMessage(content=incremental_text),
-                    finish_reason=None
+                    delta=DeltaMessage(**delta),
+                    finish_reason=finish_reason
                 )
                 chunk = ChatCompletionResponse(
                     model=request.model,
                     choices=[choice_data],
-                    object="chat.completion.chunk"
+                    object="chat.completion.chunk",
+                    **session_fields
                 )
-                print(chunk)
-                # 使用yield进行流式输出
-                yield "{}".format(json.dumps(chunk.model_dump(exclude_unset=True), ensure_ascii=False))
-                await asyncio.sleep(0.1)
-                print(time.time() - start_time)
+                return json.dumps(chunk.model_dump(exclude_unset=True), ensure_ascii=False)
+
+            encoder = ChunkEncoder(render)
+            # 使用yield进行流式输出（已经编码好的 SSE 事件，sse_starlette 原样发送）
+            yield encoder.role_event
+
+            # 每个请求独享一个输出通道，模型每生成一段内容就立即转发给客户端
+            channel = StreamChannel()
+            # 客户端断开时 sse_starlette 会取消本生成器，finally 中取消生产者
+            cancel_token = CancelToken()
+            producer = asyncio.create_task(produce_executor_agent(option, channel, slot, cancel_token))
+            interval_ms = request.coalesce_ms if request.coalesce_ms is not None else COALESCE_MS
+            max_bytes = request.coalesce_bytes if request.coalesce_bytes is not None else COALESCE_BYTES
+            fragments = []
+            error = None
+            try:
+                async for incremental_text in coalesce(channel, interval_ms, max_bytes):
+                    fragments.append(incremental_text)
+                    yield encoder.content(incremental_text)
+            except Exception as e:
+                # 生产者出错（模型请求失败、工具异常等）：告知客户端后正常结束流，而不是直接断开连接
+                error = e
+            finally:
+                channel.close()
+                if not producer.done():
+                    cancel_token.cancel('client disconnected')
+                    producer.cancel()
+                slot.release()
+            if error is not None:
+                yield encoder.error_event(str(error) or type(error).__name__, type(error).__name__)
+                yield encoder.done_event
+                return
+            # 只有完整输出的回复才写入会话（出错或者客户端断开时不会执行到这里）
+            save_turn(session, request, ''.join(fragments))
 
             # 全部输出后返回'[DONE]'
-            choice_data = ChatCompletionResponseStreamChoice(
-                index=0,
-                delta=DeltaMessage(),
-                finish_reason="stop"
-            )
-            chunk = ChatCompletionResponse(
-                model=request.model,
-                choices=[choice_data],
-                object="chat.completion.chunk"
-            )
-            # 使用yield进行流式输出
-            yield "{}".format(json.dumps(chunk.model_dump(exclude_unset=True), ensure_ascii=False))
-            yield '[DONE]'
+            yield encoder.stop_event
+            yield encoder.done_event
 
-        return EventSourceResponse(content=event_generator())
+        # 生成器没有被执行时（如客户端提前断开）也要释放名额
+        return EventSourceResponse(content=event_generator(), background=BackgroundTask(slot.release))
     else:
-        received_value = stdout_result(
+        slot = await acquire_agent_slot(request.model)
+        # 非流式请求没有 sse_starlette 的断开监听，单独检查客户端是否断开
+        cancel_token = CancelToken()
+        run = asyncio.ensure_future(ainvoke_result(
             query=query,
             history_messages=history_messages,
             model=request.model,
             streaming=request.stream,
-            temperature=request.temperature
-        )
+            temperature=request.temperature,
+            conversation_id=conversation_id,
+            converted_history=converted_history,
+            cancel_token=cancel_token
+        ))
+        # 客户端断开时取消运行任务，正在进行的模型 HTTP 请求随之中断
+        unregister = cancel_task_on(cancel_token, run)
+        watcher = asyncio.create_task(watch_disconnect(http_request, cancel_token))
+        try:
+            received_value = await run
+        except (RunCancelled, asyncio.CancelledError):
+            if not cancel_token.cancelled:
+                # 服务关闭等原因取消了请求本身
+                raise
+            cancellation_stats.record_cancelled(request.model, cancel_token)
+            # 客户端已经断开，回复不会被接收
+            raise HTTPException(status_code=499, detail="Client closed request")
+        finally:
+            unregister()
+            watcher.cancel()
+            slot.release()
+        cancellation_stats.record_completed(request.model, cancel_token)
+        save_turn(session, request, received_value)
         choice_data = ChatCompletionResponseChoice(
             index=0,
             message=ChatMessage(role="assistant", content=received_value),
             finish_reason="stop"
         )
-        return ChatCompletionResponse(model=request.model, choices=[choice_data], object="chat.completion")
+        return ChatCompletionResponse(
+            model=request.model,
+            choices=[choice_data],
+            object="chat.completion",
+            **session_fields
+        )
+
+
+# 运行状态统计
+@app.get("/v1/metrics")
+async def get_metrics():
+    return {
+        'http_pool': pool_stats(),
+        'flowy': flowy_session.health(),
+        'response_cache': llm_agent.response_cache.stats() if llm_agent.response_cache else None,
+        'intent_router': intent_router.stats(),
+        'history': llm_agent.history_manager.stats() if llm_agent.history_manager else None,
+        'sessions': session_store.stats() if session_store else None,
+        'cancellation': cancellation_stats.stats(),
+        'documents': document_writer.stats()
+    }
+
+
+# 后台文档写入的状态（write_file 返回的 handle）
+@app.get("/v1/documents/{handle_id}")
+async def get_document(handle_id: str):
+    handle = document_writer.get(handle_id)
+    if handle is None:
+        raise HTTPException(status_code=404, detail="Document handle not found or expired")
+    return handle.to_dict()
+
+
+# 重置 flowy 环境（下次请求时重新初始化）
+@app.post("/v1/flowy/reset")
+async def reset_flowy():
+    flowy_session.reset()
+    return flowy_session.health()
 
 
 # 主函数入口
@@ -235,6 +417,38 @@ if __name__ == '__main__':
                         help='ip号')
     parser.add_argument('--port', type=int, default=3000,
                         help='端口号')
+    parser.add_argument('--max-workers', type=int, default=agent_max_workers,
+                        help='执行agent的线程数')
+    parser.add_argument('--model-concurrency', type=int, default=agent_model_concurrency,
+                        help='每个模型的并发上限')
+    parser.add_argument('--queue-timeout', type=float, default=agent_queue_timeout,
+                        help='并发已满时的排队超时时间(s)，<=0 表示直接返回429')
+    parser.add_argument('--no-warmup', action='store_true',
+                        help='启动时不预先构建默认模型的代理执行器')
+    parser.add_argument('--response-cache', type=str, choices=['memory', 'sqlite'], default=None,
+                        help='开启回复缓存（memory: 进程内，sqlite: 本地磁盘）')
+    parser.add_argument('--session-store', type=str, choices=['memory', 'sqlite', 'none'], default=None,
+                        help='对话会话存储（memory: 进程内，sqlite: 本地磁盘，none: 关闭），默认读取 SESSION_STORE，都没有时关闭')
     args = parser.parse_args()
+    if args.response_cache:
+        llm_agent.response_cache = create_response_cache(
+            backend=args.response_cache,
+            ttl=float(os.environ.get('RESPONSE_CACHE_TTL', 3600)),
+            path=os.environ.get('RESPONSE_CACHE_PATH'),
+            max_entries=int(os.environ.get('RESPONSE_CACHE_SIZE', 1024))
+        )
+    if args.session_store:
+        session_store = create_session_store(
+            backend=None if args.session_store == 'none' else args.session_store,
+            ttl=float(os.environ.get('SESSION_TTL', 3600)),
+            path=os.environ.get('SESSION_STORE_PATH'),
+            max_sessions=int(os.environ.get('SESSION_MAX', 10000))
+        )
+    executor_warmup = executor_warmup and not args.no_warmup
+    agent_pool = AgentWorkerPool(
+        max_workers=args.max_workers,
+        model_concurrency=args.model_concurrency,
+        queue_timeout=args.queue_timeout
+    )
     # 启动FastAPI应用
     uvicorn.run(app, host=args.host, port=args.port, workers=1)  # 在指定端口和主机上启动应用
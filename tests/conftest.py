@@ -0,0 +1,9 @@
+import os
+import sys
+
+# 测试直接导入仓库根目录下的模块
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('AUDIO_BACKEND', 'fake')
+os.environ.setdefault('BRIGHTNESS_BACKEND', 'fake')
+# .env 中可能开启了 LangSmith 追踪，测试时关闭（load_dotenv 不会覆盖已有的环境变量）
+os.environ['LANGCHAIN_TRACING_V2'] = 'false'
@@ -0,0 +1,44 @@
+"""agent 线程池：按模型限制并发，信号量不随模型名无限增长"""
+import asyncio
+
+import pytest
+
+from utils.agent_pool import AgentWorkerPool, PoolSaturatedError
+
+
+def test_semaphores_dropped_after_release():
+    async def main():
+        pool = AgentWorkerPool(max_workers=2, queue_timeout=0)
+        for index in range(100):
+            assert await pool.run(f'model-{index}', lambda: index) == index
+        return pool
+
+    pool = asyncio.run(main())
+    assert pool._semaphores == {} and pool._users == {}
+
+
+def test_limit_shared_while_in_use():
+    async def main():
+        pool = AgentWorkerPool(max_workers=2, queue_timeout=0, model_limits={'glm-4': 1})
+        slot = await pool.acquire('glm-4')
+        with pytest.raises(PoolSaturatedError):
+            await pool.acquire('glm-4')
+        assert pool._users == {'glm-4': 1}
+        slot.release()
+        slot.release()
+        assert pool._semaphores == {}
+        (await pool.acquire('glm-4')).release()
+
+    asyncio.run(main())
+
+
+def test_queue_timeout_checks_in():
+    async def main():
+        pool = AgentWorkerPool(max_workers=1, queue_timeout=0.05, model_limits={'glm-4': 1})
+        slot = await pool.acquire('glm-4')
+        with pytest.raises(PoolSaturatedError):
+            await pool.acquire('glm-4')
+        slot.release()
+        assert pool._semaphores == {}
+
+    asyncio.run(main())
@@ -0,0 +1,108 @@
+"""ConcurrentAgentExecutor：独立工具并发执行、同一资源串行、结果按模型给出的顺序返回"""
+import time
+import asyncio
+import threading
+
+import pytest
+from langchain_core.agents import AgentAction, AgentFinish
+from langchain_core.runnables import RunnableLambda
+from langchain_core.tools import StructuredTool
+
+import agent_runtime
+from agent_runtime import ConcurrentAgentExecutor
+from utils.async_utils import acquire_lock, run_io, io_executor
+
+
+def make_tool(name: str, seconds: float, log: list) -> StructuredTool:
+    def func() -> str:
+        log.append(('start', name))
+        time.sleep(seconds)
+        log.append(('end', name))
+        return name
+
+    async def coroutine() -> str:
+        log.append(('start', name))
+        await asyncio.sleep(seconds)
+        log.append(('end', name))
+        return name
+
+    return StructuredTool.from_function(func=func, coroutine=coroutine, name=name, description=name)
+
+
+def run_executor(tools, names, mode):
+    """第一步给出 names 中的所有工具调用，第二步结束"""
+    actions = [AgentAction(name, {}, '') for name in names]
+
+    def plan(inputs):
+        if inputs['intermediate_steps']:
+            return AgentFinish({'output': 'done'}, '')
+        return actions
+
+    executor = ConcurrentAgentExecutor(agent=RunnableLambda(plan), tools=tools, return_intermediate_steps=True)
+    start = time.perf_counter()
+    if mode == 'sync':
+        result = executor.invoke({'input': ''})
+    else:
+        result = asyncio.run(executor.ainvoke({'input': ''}))
+    return result, time.perf_counter() - start
+
+
+@pytest.fixture
+def shared_resource(monkeypatch):
+    """把测试工具 res_a / res_b / res_c 登记到同一个资源上"""
+    resources = dict(agent_runtime.TOOL_RESOURCES, res_a='audio', res_b='audio', res_c='audio')
+    monkeypatch.setattr(agent_runtime, 'TOOL_RESOURCES', resources)
+
+
+@pytest.mark.parametrize('mode', ['sync', 'async'])
+def test_independent_tools_run_concurrently(mode):
+    log = []
+    durations = [0.4, 0.1, 0.3, 0.2]
+    names = [f'sleep_{i}' for i in range(len(durations))]
+    tools = [make_tool(name, seconds, log) for name, seconds in zip(names, durations)]
+
+    result, elapsed = run_executor(tools, names, mode)
+
+    # 总耗时接近最慢的工具，而不是所有工具的耗时之和
+    assert elapsed < max(durations) + 0.25 < sum(durations)
+    # 先完成的工具不会打乱 intermediate_steps 的顺序
+    assert [action.tool for action, _ in result['intermediate_steps']] == names
+    assert [observation for _, observation in result['intermediate_steps']] == names
+
+
+@pytest.mark.parametrize('mode', ['sync', 'async'])
+def test_same_resource_calls_stay_serial_and_ordered(mode, shared_resource):
+    log = []
+    names = ['res_a', 'res_b', 'res_c']
+    tools = [make_tool(name, 0.1, log) for name in names] + [make_tool('free', 0.25, log)]
+
+    result, elapsed = run_executor(tools, names + ['free'], mode)
+
+    shared = [entry for entry in log if entry[1] != 'free']
+    assert shared == [(event, name) for name in names for event in ('start', 'end')]
+    # 同一资源上的调用串行执行，和其他资源的调用并发
+    assert 0.3 <= elapsed < 0.3 + 0.25 + 0.2
+    assert [action.tool for action, _ in result['intermediate_steps']] == names + ['free']
+
+
+def test_lock_waiters_do_not_starve_io_executor():
+    """大量协程等待同一把资源锁时，持有者仍然可以通过 run_io 完成 I/O（等待者不能占满 io_executor）"""
+    lock = threading.Lock()
+
+    async def waiter():
+        await acquire_lock(lock)
+        lock.release()
+
+    async def main():
+        await acquire_lock(lock)
+        try:
+            waiters = [asyncio.ensure_future(waiter()) for _ in range(io_executor._max_workers * 2)]
+            await asyncio.sleep(0.1)
+            result = await asyncio.wait_for(run_io(lambda: 'io done'), timeout=2)
+        finally:
+            lock.release()
+        await asyncio.wait_for(asyncio.gather(*waiters), timeout=2)
+        return result
+
+    assert asyncio.run(main()) == 'io done'
+    assert not lock.locked()
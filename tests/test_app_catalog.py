@@ -0,0 +1,41 @@
+"""应用目录索引：符号链接形成环时扫描正常结束，索引、增量刷新和模糊查找都不受影响"""
+import os
+
+from utils.app_catalog import AppCatalog
+
+
+def _desktop(directory, name, exec_name):
+    with open(os.path.join(directory, f'{exec_name}.desktop'), 'w') as f:
+        f.write(f'[Desktop Entry]\nType=Application\nName={name}\nExec={exec_name} %U\n')
+
+
+def test_symlink_loop(tmp_path):
+    apps = tmp_path / 'applications'
+    sub = apps / 'sub'
+    sub.mkdir(parents=True)
+    _desktop(str(apps), 'Visual Studio Code', 'code')
+    _desktop(str(sub), 'Firefox Web Browser', 'firefox')
+    # sub/loop -> applications，sub/self -> sub
+    os.symlink(str(apps), str(sub / 'loop'))
+    os.symlink(str(sub), str(sub / 'self'))
+
+    index_path = str(tmp_path / 'index.json')
+    catalog = AppCatalog(roots={str(apps): '.desktop'}, index_path=index_path)
+    assert catalog.refresh() is True
+    assert len(catalog) == 2
+    assert catalog.refresh() is False
+
+    # 精确匹配和 trigram 模糊匹配
+    assert catalog.lookup('firefox').name == 'Firefox Web Browser'
+    assert catalog.lookup('visual studio cod').name == 'Visual Studio Code'
+
+    # 增量刷新：新增的应用可以找到，环仍然只扫描一次
+    _desktop(str(sub), 'GNU Image Manipulation Program', 'gimp')
+    assert catalog.refresh() is True
+    assert len(catalog) == 3
+    assert catalog.lookup('image manipulation').name == 'GNU Image Manipulation Program'
+
+    # 从磁盘加载的索引
+    reloaded = AppCatalog(roots={str(apps): '.desktop'}, index_path=index_path)
+    assert len(reloaded) == 3
+    assert reloaded.refresh() is False
@@ -0,0 +1,44 @@
+"""macOS 亮度后端：-d 传入 -l 列出的 CGDirectDisplayID，而不是显示器在列表中的位置"""
+import asyncio
+import subprocess
+
+from tools import brightness_backend
+from tools.brightness_backend import MacBrightnessBackend
+
+LISTING = '''display 0: main, active, awake, online, built-in, ID 0x4280a80
+display 0: brightness 0.750000
+display 1: active, awake, online, external, ID 0x1e6c1a8b
+display 1: brightness 0.300000
+'''
+
+
+def _fake_run(commands):
+    def run(command, **kwargs):
+        commands.append(command)
+        return subprocess.CompletedProcess(command, 0, stdout=LISTING if command[1] == '-l' else '')
+    return run
+
+
+def test_writes_use_display_id(monkeypatch):
+    commands = []
+    monkeypatch.setattr(brightness_backend.subprocess, 'run', _fake_run(commands))
+    backend = MacBrightnessBackend(coalesce_window=0)
+    assert backend.get_levels() == {0: 75, 1: 30}
+
+    backend.set_level(50, 1)
+    backend.set_level(40, 0)
+    writes = [command for command in commands if command[1] == '-d']
+    assert writes == [['brightness', '-d', '0x1e6c1a8b', '0.5'], ['brightness', '-d', '0x4280a80', '0.4']]
+
+
+def test_async_writes_use_display_id(monkeypatch):
+    commands = []
+
+    async def fake_subprocess(*command, check=True):
+        commands.append(list(command))
+        return LISTING if command[1] == '-l' else ''
+
+    monkeypatch.setattr(brightness_backend, 'run_subprocess', fake_subprocess)
+    backend = MacBrightnessBackend(coalesce_window=0)
+    asyncio.run(backend.aset_level(20, 1))
+    assert ['brightness', '-d', '0x1e6c1a8b', '0.2'] in commands
@@ -0,0 +1,168 @@
+"""取消：CancelToken、回调检查、统计、断开检测，以及取消后中断正在进行的模型请求"""
+import asyncio
+import threading
+import uuid
+
+import pytest
+from langchain_core.language_models.fake_chat_models import GenericFakeChatModel
+from langchain_core.outputs import LLMResult, Generation
+
+from utils.cancellation import (
+    CancelToken, CancellationHandler, CancellationStats, RunCancelled, cancel_task_on, watch_disconnect
+)
+
+
+def test_cancel_token_callbacks():
+    token = CancelToken()
+    calls = []
+    token.on_cancel(lambda: calls.append('a'))
+    unregister = token.on_cancel(lambda: calls.append('removed'))
+    token.on_cancel(lambda: 1 / 0)
+    unregister()
+    assert not token.cancelled
+    token.raise_if_cancelled()
+
+    token.cancel('client disconnected')
+    token.cancel('again')
+    assert calls == ['a']
+    assert token.cancelled and token.reason == 'client disconnected'
+    with pytest.raises(RunCancelled):
+        token.raise_if_cancelled()
+    # 已经取消时注册的回调立即执行
+    token.on_cancel(lambda: calls.append('late'))
+    assert calls == ['a', 'late']
+
+
+def test_cancel_from_other_thread():
+    token = CancelToken()
+    fired = threading.Event()
+    token.on_cancel(fired.set)
+    threading.Thread(target=token.cancel).start()
+    assert fired.wait(2)
+
+
+def test_handler_counts_and_raises():
+    token = CancelToken()
+    handler = CancellationHandler(token)
+    streamed, other, usage = uuid.uuid4(), uuid.uuid4(), uuid.uuid4()
+    for _ in range(3):
+        handler.on_llm_new_token('x', run_id=streamed)
+    # 流式调用已经逐 token 计数，结束时不重复统计
+    handler.on_llm_end(LLMResult(generations=[[Generation(text='x x x')]]), run_id=streamed)
+    handler.on_llm_end(LLMResult(generations=[[Generation(text='')]], llm_output={'token_usage': {'completion_tokens': 7}}),
+                       run_id=usage)
+    handler.on_llm_end(LLMResult(generations=[[Generation(text='hello world')]]), run_id=other)
+    assert token.output_tokens > 10
+
+    handler.on_tool_start({}, 'input')
+    token.cancel()
+    with pytest.raises(RunCancelled):
+        handler.on_llm_new_token('x', run_id=streamed)
+    for check in (lambda: handler.on_chat_model_start({}, []), lambda: handler.on_llm_start({}, []),
+                  lambda: handler.on_tool_start({}, 'input')):
+        with pytest.raises(RunCancelled):
+            check()
+
+
+def _token(tokens):
+    token = CancelToken()
+    token.add_tokens(tokens)
+    return token
+
+
+def test_stats_estimates_saved_tokens():
+    stats = CancellationStats()
+    assert stats.expected_tokens('glm-4') == 0
+    stats.record_completed('glm-4', _token(100))
+    stats.record_completed('glm-4', _token(300))
+    # 没有调用模型的运行不计入平均值
+    stats.record_completed('glm-4', _token(0))
+    stats.record_completed('other', _token(1000))
+    assert stats.expected_tokens('glm-4') == 200
+    # 没有记录的模型使用所有模型的平均值
+    assert stats.expected_tokens('unknown') == 1400 // 3
+
+    stats.record_cancelled('glm-4', _token(50))
+    stats.record_cancelled('glm-4', _token(500))
+    assert stats.stats() == {'cancelled_runs': 2, 'completed_runs': 3, 'tokens_before_cancel': 550,
+                             'estimated_tokens_saved': 150}
+
+
+class _Request:
+    def __init__(self, disconnect_after):
+        self.calls = 0
+        self.disconnect_after = disconnect_after
+
+    async def is_disconnected(self):
+        self.calls += 1
+        return self.calls > self.disconnect_after
+
+
+def test_watch_disconnect():
+    token = CancelToken()
+    request = _Request(disconnect_after=2)
+    asyncio.run(asyncio.wait_for(watch_disconnect(request, token, interval=0.01), 2))
+    assert token.cancelled and token.reason == 'client disconnected' and request.calls == 3
+
+    # 运行已经被其他原因取消时停止检查
+    token = CancelToken()
+
+    async def run():
+        watcher = asyncio.ensure_future(watch_disconnect(_Request(disconnect_after=10 ** 6), token, interval=0.01))
+        await asyncio.sleep(0.03)
+        token.cancel('done')
+        await asyncio.wait_for(watcher, 1)
+
+    asyncio.run(run())
+    assert token.reason == 'done'
+
+
+class _HangingModel(GenericFakeChatModel):
+    """模拟一直没有返回的模型请求"""
+    started: asyncio.Event = None
+    aborted: list = None
+
+    def bind_tools(self, tools, **kwargs):
+        return self
+
+    async def _hang(self):
+        self.started.set()
+        try:
+            await asyncio.sleep(30)
+        except asyncio.CancelledError:
+            self.aborted.append(True)
+            raise
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        await self._hang()
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs):
+        await self._hang()
+        yield
+
+
+def test_cancel_aborts_in_flight_model_call(monkeypatch):
+    import llm_agent
+
+    async def run():
+        model = dict(started=asyncio.Event(), aborted=[])
+        monkeypatch.setattr(llm_agent, 'ChatOpenAI', lambda **kwargs: _HangingModel(messages=iter([]), **model))
+        monkeypatch.setattr(llm_agent, 'intent_router_enabled', False)
+        monkeypatch.setattr(llm_agent, 'response_cache', None)
+        llm_agent._executor_cache.clear()
+
+        token = CancelToken()
+        task = asyncio.ensure_future(llm_agent.ainvoke_result('hello', model='cancel-test', cancel_token=token))
+        unregister = cancel_task_on(token, task)
+        await asyncio.wait_for(model['started'].wait(), 10)
+        # 在其他线程中设置取消（和工具线程、断开检测一样）
+        await asyncio.to_thread(token.cancel, 'client disconnected')
+        with pytest.raises(asyncio.CancelledError):
+            await asyncio.wait_for(task, 2)
+        unregister()
+        return model['aborted']
+
+    try:
+        assert asyncio.run(run()) == [True]
+    finally:
+        llm_agent._executor_cache.clear()
@@ -0,0 +1,55 @@
+"""设备工具：后端命令失败、没有权限时返回准确的错误说明，不会中断 agent，也不会误报为平台不支持"""
+import asyncio
+import subprocess
+
+import pytest
+
+from tools import set_volume, adjust_volume, mute_volume, set_brightness, adjust_brightness
+from tools.audio_backend import get_audio_backend
+from tools.brightness_backend import get_brightness_backend
+
+FAILURES = [
+    (subprocess.CalledProcessError(1, ['amixer', 'set'], stderr='amixer: Unable to find simple control'),
+     '失败: 命令 amixer 退出码 1，amixer: Unable to find simple control'),
+    (PermissionError(13, 'Permission denied', '/dev/snd/controlC0'), '失败: 没有权限（/dev/snd/controlC0）'),
+    (FileNotFoundError(2, 'No such file or directory', 'pactl'), '失败: 找不到命令或设备（pactl）'),
+]
+
+
+def _raise(error):
+    def func(*args, **kwargs):
+        raise error
+    return func
+
+
+def _araise(error):
+    async def func(*args, **kwargs):
+        raise error
+    return func
+
+
+@pytest.mark.parametrize('error, message', FAILURES)
+@pytest.mark.parametrize('tool, args', [(set_volume, {'volume_level': 30}), (adjust_volume, {'step': 5}),
+                                        (mute_volume, {})])
+def test_volume_backend_errors(monkeypatch, tool, args, error, message):
+    backend = get_audio_backend()
+    backend.invalidate()
+    monkeypatch.setattr(backend, '_write_volume', _raise(error))
+    monkeypatch.setattr(backend, '_write_mute', _raise(error))
+    monkeypatch.setattr(backend, '_awrite_volume', _araise(error))
+    monkeypatch.setattr(backend, '_awrite_mute', _araise(error))
+    for reply in (tool.invoke(args), asyncio.run(tool.ainvoke(args))):
+        assert message in reply
+        assert reply != 'Unsupported platform'
+
+
+@pytest.mark.parametrize('error, message', FAILURES)
+@pytest.mark.parametrize('tool, args', [(set_brightness, {'brightness_level': 30}), (adjust_brightness, {'step': -5})])
+def test_brightness_backend_errors(monkeypatch, tool, args, error, message):
+    backend = get_brightness_backend()
+    backend.invalidate()
+    monkeypatch.setattr(backend, '_write_level', _raise(error))
+    monkeypatch.setattr(backend, '_awrite_level', _araise(error))
+    for reply in (tool.invoke(args), asyncio.run(tool.ainvoke(args))):
+        assert message in reply
+        assert reply != 'Unsupported platform'
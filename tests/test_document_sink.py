@@ -0,0 +1,46 @@
+"""后台文档写入：失败不会随未读取的 future 丢失，句柄和统计能看到失败"""
+import os
+
+import pytest
+
+from tools.document_sink import DocumentSink, DocumentWriter, current_umask
+
+
+def _failing_chunks():
+    yield 'partial'
+    raise RuntimeError('generator broke')
+
+
+def test_background_write_failure_is_recorded(tmp_path):
+    writer = DocumentWriter()
+    path = str(tmp_path / 'out.md')
+    handle = writer.start(path, _failing_chunks())
+    with pytest.raises(RuntimeError):
+        handle.wait(5)
+
+    assert writer.get(handle.id).to_dict()['status'] == 'failed'
+    assert 'generator broke' in handle.error
+    stats = writer.stats()
+    assert stats['failed'] == 1 and stats['completed'] == 0 and stats['writing'] == 0
+    assert stats['last_error']['id'] == handle.id
+    # 失败时不留下目标文件和临时文件
+    assert os.listdir(tmp_path) == []
+
+
+def test_background_write_success(tmp_path):
+    writer = DocumentWriter()
+    path = str(tmp_path / 'out.md')
+    handle = writer.start(path, iter(['a' * 10, 'b' * 5]), total=15).wait(5)
+    assert handle.status == 'done' and handle.written == 15
+    assert open(path).read() == 'a' * 10 + 'b' * 5
+    assert writer.stats()['completed'] == 1
+
+
+def test_committed_file_follows_umask(tmp_path):
+    path = str(tmp_path / 'out.md')
+    with DocumentSink(path) as sink:
+        sink.write('content')
+    mask = os.umask(0o022)
+    os.umask(mask)
+    assert current_umask() == mask
+    assert os.stat(path).st_mode & 0o777 == 0o666 & ~mask
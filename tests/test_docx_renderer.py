@@ -0,0 +1,86 @@
+"""markdown 解析与 docx 渲染"""
+import io
+import threading
+
+import pytest
+
+from utils import docx_renderer
+from utils.docx_renderer import Block, parse_markdown, render_markdown
+
+
+def _parse(text):
+    return list(parse_markdown(io.StringIO(text)))
+
+
+def test_headings():
+    assert _parse('# 标题\n### Sub title ###\n') == [Block('heading', '标题', 1), Block('heading', 'Sub title', 3)]
+
+
+def test_paragraph_joins_lines():
+    assert _parse('第一行\n第二行\nnext line\n\nsecond') == [
+        Block('paragraph', '第一行第二行 next line'), Block('paragraph', 'second')]
+
+
+def test_nested_lists():
+    assert _parse('- a\n  - b\n    - c\n1. one\n   2) two\n') == [
+        Block('bullet', 'a', 0), Block('bullet', 'b', 1), Block('bullet', 'c', 2),
+        Block('number', 'one', 0), Block('number', 'two', 1)]
+
+
+def test_fenced_code_keeps_content():
+    assert _parse('```python\n# not a heading\n\n- not a list\n```\nafter') == [
+        Block('code', '# not a heading\n\n- not a list'), Block('paragraph', 'after')]
+    assert _parse('~~~\nopen') == [Block('code', 'open')]
+
+
+def test_table():
+    assert _parse('| 名称 | 大小 |\n|:---|---:|\n| a.txt | 1 KB |\ntext') == [
+        Block('table', rows=[['名称', '大小'], ['a.txt', '1 KB']]), Block('paragraph', 'text')]
+
+
+def test_quote():
+    assert _parse('> 引用一\n> 引用二\n正文') == [Block('quote', '引用一引用二'), Block('paragraph', '正文')]
+
+
+def test_render_styles():
+    docx = pytest.importorskip('docx')
+    content = render_markdown(io.StringIO(
+        '# 标题\n\n正文 **粗体** 和 `code`\n\n- 一\n  - 二\n1. 三\n\n> 引用\n\n```\nx = 1\ny = 2\n```\n\n'
+        '| a | b |\n|---|---|\n| 1 | 2 |\n'
+    ))
+    document = docx.Document(io.BytesIO(content))
+    paragraphs = [(paragraph.style.name, paragraph.text) for paragraph in document.paragraphs]
+    assert paragraphs == [
+        ('Heading 1', '标题'), ('Normal', '正文 粗体 和 code'), ('List Bullet', '一'), ('List Bullet 2', '二'),
+        ('List Number', '三'), ('Quote', '引用'), ('No Spacing', 'x = 1\ny = 2')]
+    runs = document.paragraphs[1].runs
+    assert runs[1].bold and runs[3].font.name == docx_renderer.CODE_FONT
+    table = document.tables[0]
+    assert table.style.name == 'Table Grid'
+    assert [[cell.text for cell in row.cells] for row in table.rows] == [['a', 'b'], ['1', '2']]
+    assert table.rows[0].cells[0].paragraphs[0].runs[0].bold
+
+
+def test_process_pool_created_once(monkeypatch):
+    created = []
+
+    class FakePool:
+        def __init__(self, **kwargs):
+            created.append(self)
+
+    monkeypatch.setenv('DOCX_PROCESSES', '1')
+    monkeypatch.setattr(docx_renderer, '_process_pool', None)
+    monkeypatch.setattr(docx_renderer, 'ProcessPoolExecutor', FakePool)
+    barrier = threading.Barrier(8)
+    pools = []
+
+    def get():
+        barrier.wait()
+        pools.append(docx_renderer.get_process_pool())
+
+    threads = [threading.Thread(target=get) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(created) == 1 and all(pool is created[0] for pool in pools)
@@ -0,0 +1,94 @@
+"""目录索引：新增、删除、修改后同步，目录 mtime 精度不足时（RACY_WINDOW 内）仍然重新扫描"""
+import os
+import time
+
+import pytest
+
+from tools.file_index import FileIndex, RACY_WINDOW
+from tools.file_scanner import ONE_DAY
+
+
+def _write(path, content='', age_days=0):
+    with open(path, 'w') as f:
+        f.write(content)
+    if age_days:
+        old = time.time() - age_days * ONE_DAY
+        os.utime(path, (old, old))
+
+
+def _settle(directory, seconds_ago=RACY_WINDOW * 5):
+    # 目录 mtime 设置到 RACY_WINDOW 之外，同步后不再重复扫描
+    past = time.time() - seconds_ago
+    os.utime(directory, (past, past))
+    return past
+
+
+def _rows(index, root):
+    return {name: (bool(is_dir), size) for name, is_dir, size in index._conn.execute(
+        'SELECT name, is_dir, size FROM entries WHERE parent = ?', (os.path.abspath(root),))}
+
+
+@pytest.fixture
+def setup(tmp_path):
+    root = tmp_path / 'desktop'
+    root.mkdir()
+    index = FileIndex(str(tmp_path / 'index.sqlite3'))
+    return str(root), index
+
+
+def test_reconcile_add_delete_modify(setup):
+    root, index = setup
+    _write(os.path.join(root, 'old.txt'), 'x' * 4, age_days=30)
+    _write(os.path.join(root, 'gone.txt'), age_days=30)
+    _settle(root)
+    assert sorted(e.name for e in index.unused(root, 7)) == ['gone.txt', 'old.txt']
+    rescanned = index.stats['dirs_rescanned']
+
+    # 目录没有变化时不重新扫描
+    index.unused(root, 7)
+    assert index.stats['dirs_rescanned'] == rescanned
+
+    # 新增、删除，已有条目的大小变化、同名文件被替换为文件夹
+    _write(os.path.join(root, 'new.txt'), age_days=30)
+    os.remove(os.path.join(root, 'gone.txt'))
+    _write(os.path.join(root, 'old.txt'), 'y' * 100, age_days=30)
+    os.makedirs(os.path.join(root, 'replaced'))
+    _settle(root, seconds_ago=RACY_WINDOW * 4)
+    index.reconcile(root)
+    assert index.stats['dirs_rescanned'] == rescanned + 1
+    assert _rows(index, root) == {'new.txt': (False, 0), 'old.txt': (False, 100), 'replaced': (True, 0)}
+
+    os.rmdir(os.path.join(root, 'replaced'))
+    _write(os.path.join(root, 'replaced'), 'z' * 7, age_days=30)
+    _settle(root, seconds_ago=RACY_WINDOW * 3)
+    index.reconcile(root)
+    assert _rows(index, root)['replaced'] == (False, 7)
+    assert sorted(e.name for e in index.unused(root, 7)) == ['new.txt', 'old.txt', 'replaced']
+
+
+def test_in_place_edit_is_verified(setup):
+    root, index = setup
+    _write(os.path.join(root, 'doc.txt'), age_days=30)
+    _settle(root)
+    assert [e.name for e in index.unused(root, 7)] == ['doc.txt']
+    # 原地修改不会改变目录 mtime，查询候选条目时重新 stat
+    _write(os.path.join(root, 'doc.txt'), 'edited')
+    _settle(root)
+    assert index.unused(root, 7) == []
+
+
+def test_racy_window_rescans(setup):
+    root, index = setup
+    _write(os.path.join(root, 'a.txt'), age_days=30)
+    # 目录 mtime 和扫描时间几乎相同
+    recent = time.time()
+    os.utime(root, (recent, recent))
+    index.reconcile(root)
+    rescanned = index.stats['dirs_rescanned']
+
+    # 同一 mtime 精度内新增了文件：目录 mtime 看起来没有变化，但仍在 RACY_WINDOW 内，下次仍然重新扫描
+    _write(os.path.join(root, 'b.txt'), age_days=30)
+    os.utime(root, (recent, recent))
+    index.reconcile(root)
+    assert index.stats['dirs_rescanned'] == rescanned + 1
+    assert sorted(_rows(index, root)) == ['a.txt', 'b.txt']
@@ -0,0 +1,78 @@
+"""对话历史按预算裁剪：未超预算原样返回，超出时早期消息替换为摘要并增量合并"""
+import pytest
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
+
+from utils import history_manager
+from utils.history_manager import SUMMARY_PREFIX, HistoryManager
+from utils.utils import ChatMessage
+
+
+@pytest.fixture(autouse=True)
+def fixed_tokens(monkeypatch):
+    # 每条消息固定 30 token（含格式开销），预算计算与 tokenizer 无关
+    tokenizer = lambda text: 30 - history_manager.MESSAGE_OVERHEAD
+    monkeypatch.setattr(history_manager, 'get_tokenizer', lambda: tokenizer)
+    history_manager.count_tokens.cache_clear()
+    yield
+    history_manager.count_tokens.cache_clear()
+
+
+class Recorder:
+    def __init__(self):
+        self.calls = []
+
+    def __call__(self, previous, messages, max_tokens):
+        self.calls.append((previous, [message.content for message in messages]))
+        return previous + ''.join(f'[{message.content}]' for message in messages)
+
+
+def _history(count):
+    return [ChatMessage(role='user' if index % 2 == 0 else 'assistant', content=f'm{index}')
+            for index in range(count)]
+
+
+def test_under_budget_unchanged():
+    recorder = Recorder()
+    manager = HistoryManager(default_budget=1000, keep_recent=2, summarizer=recorder)
+    history = [ChatMessage(role='system', content='sys')] + _history(4)
+    messages = manager.prepare(history, model='unknown')
+    assert [type(message) for message in messages] == [HumanMessage, AIMessage, HumanMessage, AIMessage]
+    assert [message.content for message in messages] == ['m0', 'm1', 'm2', 'm3']
+    assert recorder.calls == []
+    assert manager.stats()['trimmed'] == 0
+
+
+def test_over_budget_summary_and_recent():
+    recorder = Recorder()
+    manager = HistoryManager(default_budget=60, keep_recent=2, summarizer=recorder)
+    messages = manager.prepare(_history(6), model='unknown', conversation_id='c1')
+    assert isinstance(messages[0], SystemMessage)
+    assert messages[0].content == SUMMARY_PREFIX + '[m0][m1][m2][m3]'
+    assert [message.content for message in messages[1:]] == ['m4', 'm5']
+    assert recorder.calls == [('', ['m0', 'm1', 'm2', 'm3'])]
+    assert manager.stats()['trimmed'] == 1
+
+
+def test_incremental_merge_reuses_prefix():
+    recorder = Recorder()
+    manager = HistoryManager(default_budget=60, keep_recent=2, summarizer=recorder)
+    manager.prepare(_history(6), model='unknown', conversation_id='c1')
+    # 同一段历史再次请求直接命中缓存
+    manager.prepare(_history(6), model='unknown', conversation_id='c1')
+    assert len(recorder.calls) == 1 and manager.stats()['summary_cache_hits'] == 1
+
+    messages = manager.prepare(_history(8), model='unknown', conversation_id='c1')
+    assert recorder.calls[-1] == ('[m0][m1][m2][m3]', ['m4', 'm5'])
+    assert messages[0].content == SUMMARY_PREFIX + '[m0][m1][m2][m3][m4][m5]'
+    assert [message.content for message in messages[1:]] == ['m6', 'm7']
+
+
+def test_edited_history_invalidates_summary():
+    recorder = Recorder()
+    manager = HistoryManager(default_budget=60, keep_recent=2, summarizer=recorder)
+    manager.prepare(_history(6), model='unknown', conversation_id='c1')
+    edited = _history(8)
+    edited[1] = ChatMessage(role='assistant', content='changed')
+    messages = manager.prepare(edited, model='unknown', conversation_id='c1')
+    assert recorder.calls[-1] == ('', ['m0', 'changed', 'm2', 'm3', 'm4', 'm5'])
+    assert messages[0].content == SUMMARY_PREFIX + '[m0][changed][m2][m3][m4][m5]'
@@ -0,0 +1,90 @@
+"""连接池统计：进行中的请求在响应关闭或失败后减少，连接数来自 httpcore 连接池公开的连接列表"""
+import asyncio
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import httpx
+import pytest
+
+from utils.http_pool import InstrumentedTransport, PoolGauges, get_http_client, pool_stats
+
+
+def _handler(request: httpx.Request) -> httpx.Response:
+    if request.url.path == '/down':
+        raise httpx.ConnectError('refused', request=request)
+    # 迭代器内容不会在构造时读完，和真实连接一样在读取/关闭响应时结束
+    return httpx.Response(200, content=iter([b'x' * 1024]))
+
+
+def test_in_flight_rises_and_falls():
+    transport = InstrumentedTransport(httpx.MockTransport(_handler), PoolGauges(max_connections=1))
+    client = httpx.Client(transport=transport)
+
+    first = client.send(client.build_request('GET', 'http://upstream/a'), stream=True)
+    second = client.send(client.build_request('GET', 'http://upstream/b'), stream=True)
+    assert transport.stats()['in_flight'] == 2
+    assert transport.stats()['waiting'] == 1
+    first.read()
+    first.close()
+    assert transport.stats()['in_flight'] == 1
+    second.close()
+
+    with pytest.raises(httpx.ConnectError):
+        client.get('http://upstream/down')
+    client.get('http://upstream/ok')
+    assert transport.stats() == {'in_flight': 0, 'requests': 4, 'failed': 1, 'waiting': 0}
+
+
+def test_async_in_flight_rises_and_falls():
+    release = asyncio.Event()
+
+    async def handler(request):
+        await release.wait()
+
+        async def body():
+            yield b'ok'
+        return httpx.Response(200, content=body())
+
+    transport = InstrumentedTransport(httpx.MockTransport(handler), PoolGauges(max_connections=10))
+
+    async def run():
+        async with httpx.AsyncClient(transport=transport) as client:
+            tasks = [asyncio.ensure_future(client.get('http://upstream/ok')) for _ in range(3)]
+            await asyncio.sleep(0.05)
+            during = transport.stats()['in_flight']
+            release.set()
+            await asyncio.gather(*tasks)
+            return during
+
+    assert asyncio.run(run()) == 3
+    assert transport.stats()['in_flight'] == 0
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header('Content-Length', '2')
+        self.end_headers()
+        self.wfile.write(b'ok')
+
+    def log_message(self, *args):
+        pass
+
+
+def test_connection_gauges_from_pool():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), _Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f'http://127.0.0.1:{server.server_address[1]}'
+    try:
+        client = get_http_client(url)
+        response = client.send(client.build_request('GET', url + '/'), stream=True)
+        stats = pool_stats()['pools'][url]['sync']
+        assert stats['in_flight'] == 1 and stats['open'] == 1 and stats['idle'] == 0
+        response.read()
+        response.close()
+        stats = pool_stats()['pools'][url]['sync']
+        assert stats['in_flight'] == 0 and stats['open'] == 1 and stats['idle'] == 1 and stats['available'] == 1
+    finally:
+        server.shutdown()
@@ -0,0 +1,87 @@
+"""规则路由：有歧义的指令交给大模型，工具返回错误时不算命中"""
+import pytest
+
+from intent_router import IntentRouter, IntentMatch
+
+
+@pytest.mark.parametrize('query, intent, args', [
+    ('亮度调高一点', 'adjust_brightness', {'step': 5}),
+    ('调亮一点', 'adjust_brightness', {'step': 5}),
+    ('调暗一些', 'adjust_brightness', {'step': -5}),
+    ('屏幕调高一点', 'adjust_brightness', {'step': 5}),
+    ('调大一点屏幕亮度', 'adjust_brightness', {'step': 5}),
+    ('声音小一点', 'adjust_volume', {'step': -5}),
+    ('音量调整到20%', 'set_volume', {'volume_level': 20}),
+])
+def test_route(query, intent, args):
+    match = IntentRouter().route(query)
+    assert match is not None and (match.intent, match.args) == (intent, args)
+
+
+@pytest.mark.parametrize('query', ['调大一点', '调小一点', '调高一点', '帮我调低一些'])
+def test_ambiguous_adjust_falls_through(query):
+    assert IntentRouter().route(query) is None
+
+
+class _FakeTool:
+    def __init__(self, reply):
+        self.reply = reply
+
+    def invoke(self, args):
+        if isinstance(self.reply, Exception):
+            raise self.reply
+        return self.reply
+
+
+@pytest.mark.parametrize('reply', ['Unsupported platform', '设置音量失败: exit status 1', RuntimeError('boom')])
+def test_tool_errors_count_as_misses(monkeypatch, reply):
+    router = IntentRouter()
+    monkeypatch.setattr(router, 'route', lambda query: IntentMatch('set_volume', _FakeTool(reply), {}))
+    assert router.handle('音量调整到20%') is None
+    assert router.stats()['hits'] == 0 and router.stats()['errors'] == 1
+
+
+def test_tool_success_counts_as_hit(monkeypatch):
+    router = IntentRouter()
+    monkeypatch.setattr(router, 'route', lambda query: IntentMatch('set_volume', _FakeTool('音量已经调节到20'), {}))
+    assert router.handle('音量调整到20%') == '音量已经调节到20'
+    assert router.stats()['hits'] == 1
+
+
+class _Catalog:
+    def __init__(self, names):
+        self.names = names
+        self.fuzzy_calls = 0
+
+    def lookup(self, app_name, min_score=0.45, exact=False):
+        if app_name in self.names:
+            return app_name
+        self.fuzzy_calls += not exact
+        # 模糊匹配会把相近的名称当作已知应用
+        return None if exact else self.names[0]
+
+
+@pytest.fixture
+def apps(monkeypatch):
+    import intent_router
+    from utils import pattern_app_name
+
+    monkeypatch.setattr(pattern_app_name, 'get_os_type', lambda: 'macOS')
+    catalog = _Catalog(['Firefox', 'QQ音乐'])
+    monkeypatch.setattr(intent_router, 'get_matcher', lambda: pattern_app_name.BasicMatcher())
+    monkeypatch.setattr(intent_router, 'get_app_catalog', lambda: catalog)
+    return catalog
+
+
+@pytest.mark.parametrize('query, app_name', [('打开Firefox', 'Firefox'), ('帮我把QQ音乐打开', 'QQ音乐'),
+                                             ('打开vscode', 'vscode'), ('打开备忘录', '备忘录')])
+def test_open_exact_app(apps, query, app_name):
+    match = IntentRouter().route(query)
+    assert match is not None and match.intent == 'open_application' and match.args == {'app_name': app_name}
+
+
+@pytest.mark.parametrize('query', ['打开Firefix', '打开QQ音', '打开codeblocks', '打开我的code项目'])
+def test_near_miss_app_goes_to_llm(apps, query):
+    # 规则在名称中间匹配（code）或者目录只能模糊匹配时不走快速路径
+    assert IntentRouter().route(query) is None
+    assert apps.fuzzy_calls == 0
@@ -0,0 +1,145 @@
+"""批量移动：中断后继续、撤销、重名加后缀、跨文件系统复制（模拟 EXDEV）"""
+import errno
+import os
+
+import pytest
+
+from tools import move_engine
+from tools.move_engine import MoveEngine, MoveJournal
+
+real_rename = os.rename
+
+
+def _make(folder, names, content='data'):
+    os.makedirs(folder, exist_ok=True)
+    paths = []
+    for name in names:
+        path = os.path.join(folder, name)
+        with open(path, 'w') as f:
+            f.write(f'{content}:{name}')
+        paths.append(path)
+    return paths
+
+
+class Crash(BaseException):
+    """模拟进程在移动过程中被杀掉（不是 OSError，不会被当作单个条目的失败）"""
+
+
+@pytest.fixture
+def engine(tmp_path):
+    return MoveEngine(journal_dir=str(tmp_path / 'journal'))
+
+
+def test_resume_after_crash(tmp_path, engine, monkeypatch):
+    items = _make(str(tmp_path / 'src'), [f'f{i}.txt' for i in range(5)])
+    target = str(tmp_path / 'dst')
+    calls = {'n': 0}
+
+    def crashing_rename(src, dst):
+        calls['n'] += 1
+        if calls['n'] == 3:
+            raise Crash()
+        real_rename(src, dst)
+
+    monkeypatch.setattr(os, 'rename', crashing_rename)
+    with pytest.raises(Crash):
+        engine.move_batch(items, target, batch_id='b1')
+    monkeypatch.setattr(os, 'rename', real_rename)
+
+    # 计划已经完整落盘，已经移动的两项 done 记录可能还没有写入
+    states = MoveJournal.state(engine.journal_path('b1'))
+    assert len(states) == 5
+    assert sorted(os.listdir(target)) == ['f0.txt', 'f1.txt']
+
+    report = engine.resume('b1')
+    assert report['moved'] == 3 and report['failed'] == []
+    assert sorted(os.listdir(target)) == [f'f{i}.txt' for i in range(5)]
+    assert os.listdir(tmp_path / 'src') == []
+
+    # 中断前移动的条目没有 done 记录，撤销时根据文件是否存在推断
+    engine.undo('b1')
+    assert sorted(os.listdir(tmp_path / 'src')) == [f'f{i}.txt' for i in range(5)]
+
+
+def test_undo_after_completed_run(tmp_path, engine):
+    src = str(tmp_path / 'src')
+    items = _make(src, ['a.txt', 'b.txt'])
+    os.makedirs(os.path.join(src, 'folder'))
+    _make(os.path.join(src, 'folder'), ['inner.txt'])
+    items.append(os.path.join(src, 'folder'))
+    target = str(tmp_path / 'dst')
+
+    report = engine.move_batch(items, target, batch_id='b2')
+    assert report['moved'] == 3 and not report['failed']
+    undo_report = engine.undo('b2')
+    assert undo_report['moved'] == 3 and not undo_report['failed']
+    assert sorted(os.listdir(src)) == ['a.txt', 'b.txt', 'folder']
+    assert open(os.path.join(src, 'folder', 'inner.txt')).read() == 'data:inner.txt'
+    assert os.listdir(target) == []
+    ops = [record['op'] for record in MoveJournal.read(engine.journal_path('b2'))]
+    assert ops.count('undone') == 3
+
+
+def test_name_collisions_get_suffix(tmp_path, engine):
+    target = str(tmp_path / 'dst')
+    _make(target, ['report.pdf'])
+    os.makedirs(os.path.join(target, 'photos'))
+    first = _make(str(tmp_path / 'one'), ['report.pdf'])
+    second = _make(str(tmp_path / 'two'), ['report.pdf'], content='second')
+    folder = str(tmp_path / 'three' / 'photos')
+    os.makedirs(folder)
+
+    report = engine.move_batch(first + second + [folder], target, batch_id='b3')
+    assert not report['failed']
+    assert sorted(os.listdir(target)) == ['photos', 'photos (1)', 'report (1).pdf', 'report (2).pdf', 'report.pdf']
+    assert open(os.path.join(target, 'report (2).pdf')).read() == 'second:report.pdf'
+    assert len(report['renamed']) == 3
+
+
+def _cross_device(src, dst):
+    # 只有复制完成后的临时文件 rename 在同一文件系统内
+    if '.moving-' not in os.path.basename(src):
+        raise OSError(errno.EXDEV, 'Invalid cross-device link')
+    real_rename(src, dst)
+
+
+def test_exdev_copies_via_temp_name(tmp_path, engine, monkeypatch):
+    src = str(tmp_path / 'src')
+    items = _make(src, ['a.txt'])
+    os.makedirs(os.path.join(src, 'folder', 'sub'))
+    _make(os.path.join(src, 'folder', 'sub'), ['deep.txt'])
+    items.append(os.path.join(src, 'folder'))
+    target = str(tmp_path / 'dst')
+
+    monkeypatch.setattr(os, 'rename', _cross_device)
+    report = engine.move_batch(items, target, batch_id='b4')
+    assert report['moved'] == 2 and report['bytes_copied'] > 0 and not report['failed']
+    assert sorted(os.listdir(target)) == ['a.txt', 'folder']
+    assert open(os.path.join(target, 'folder', 'sub', 'deep.txt')).read() == 'data:deep.txt'
+    assert os.listdir(src) == []
+    methods = {record['method'] for record in MoveJournal.read(engine.journal_path('b4')) if record['op'] == 'done'}
+    assert methods == {'copy'}
+
+
+def test_failed_copy_leaves_no_partial_target(tmp_path, engine, monkeypatch):
+    items = _make(str(tmp_path / 'src'), ['big.bin'])
+    target = str(tmp_path / 'dst')
+    real_copy = move_engine.fast_copy_file
+
+    def broken_copy(src, dst):
+        with open(dst, 'w') as f:
+            f.write('partial')
+        raise OSError(errno.ENOSPC, 'No space left on device')
+
+    monkeypatch.setattr(os, 'rename', _cross_device)
+    monkeypatch.setattr(move_engine, 'fast_copy_file', broken_copy)
+    report = engine.move_batch(items, target, batch_id='b5')
+    assert len(report['failed']) == 1
+    # 没有留下写了一半的目标或临时文件，源文件保留
+    assert os.listdir(target) == []
+    assert os.path.exists(items[0])
+
+    monkeypatch.setattr(move_engine, 'fast_copy_file', real_copy)
+    report = engine.resume('b5')
+    assert report['moved'] == 1 and not report['failed']
+    assert open(os.path.join(target, 'big.bin')).read() == 'data:big.bin'
@@ -0,0 +1,46 @@
+"""应用名称匹配：规则按添加顺序生效，和逐条 re.search 的结果一致"""
+import re
+
+import pytest
+
+from utils import pattern_app_name
+from utils.pattern_app_name import BasicMatcher
+
+
+@pytest.fixture
+def matcher(monkeypatch):
+    monkeypatch.setattr(pattern_app_name, 'get_os_type', lambda: 'macOS')
+    matcher = BasicMatcher(cache_size=0)
+    matcher.add_rule('Foo', r'(?i)(foo|fooz)')
+    matcher.add_rule('Baz', r'ba[rz]\d*')
+    matcher.add_rule('Bar', r'bar')
+    matcher.add_rule('Qux', r'(?i)\bqux\b')
+    return matcher
+
+
+def reference(matcher, text):
+    # 原来的实现：按规则顺序逐条 re.search
+    return next((name for name, pattern in matcher.app_patterns.items() if re.search(pattern, text)), None)
+
+
+def test_first_rule_wins_regardless_of_position(matcher):
+    # 靠后位置但先添加的规则优先
+    assert matcher.match_app('bar then FOO') == 'Foo'
+    # 正则规则排在字面规则之前时优先
+    assert matcher.match_app('bar') == 'Baz'
+    # 默认规则排在 add_rule 添加的规则之前
+    assert matcher.match_app('foo in vscode') == 'Visual Studio Code'
+
+
+@pytest.mark.parametrize('text', [
+    'bar then FOO', 'bar', 'baz12', 'foo in vscode', '打开备忘录', '打开 备忘录', 'open my notes', 'notebook',
+    'QUX', 'quxx', 'a qux b', 'nothing here', 'VS Code', 'İstanbul qux', '',
+])
+def test_matches_per_rule_search(matcher, text):
+    assert matcher.match_app(text) == reference(matcher, text)
+
+
+def test_aliases_only_when_no_rule_matches(matcher):
+    matcher.add_alias('Music', 'qq音乐', '音乐')
+    assert matcher.match_app('打开QQ音乐') == 'Music'
+    assert matcher.match_app('QQ音乐 foo') == 'Foo'
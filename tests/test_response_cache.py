@@ -0,0 +1,119 @@
+"""回复缓存：内存和 SQLite 后端的 TTL、LRU 淘汰，key 归一化和工具集版本"""
+import threading
+from types import SimpleNamespace
+
+import pytest
+
+from utils import response_cache
+from utils.response_cache import MemoryCacheBackend, ResponseCache, SQLiteCacheBackend, create_response_cache
+from utils.utils import ChatMessage
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def time(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(response_cache, 'time', clock)
+    return clock
+
+
+@pytest.fixture(params=['memory', 'sqlite'])
+def make_backend(request, tmp_path):
+    def make(max_entries):
+        if request.param == 'memory':
+            return MemoryCacheBackend(max_entries=max_entries)
+        return SQLiteCacheBackend(str(tmp_path / 'cache' / 'response_cache.sqlite3'), max_entries=max_entries)
+
+    return make
+
+
+def test_ttl_expiry(make_backend, clock):
+    cache = ResponseCache(make_backend(10), ttl=60)
+    cache.set('k', 'v')
+    clock.now += 59
+    assert cache.get('k') == 'v'
+    clock.now += 2
+    assert cache.get('k') is None
+    assert len(cache.backend) == 0
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_lru_eviction(make_backend, clock):
+    backend = make_backend(2)
+    backend.set('a', '1', 60)
+    clock.now += 1
+    backend.set('b', '2', 60)
+    clock.now += 1
+    # 访问 a 之后最久未访问的是 b
+    assert backend.get('a') == '1'
+    clock.now += 1
+    backend.set('c', '3', 60)
+    assert len(backend) == 2
+    assert backend.get('b') is None
+    assert backend.get('a') == '1' and backend.get('c') == '3'
+
+
+def test_sqlite_survives_reopen(tmp_path, clock):
+    path = str(tmp_path / 'response_cache.sqlite3')
+    SQLiteCacheBackend(path).set('k', 'v', 60)
+    assert SQLiteCacheBackend(path).get('k') == 'v'
+
+
+def test_key_normalization():
+    cache = create_response_cache('memory')
+    history = [ChatMessage(role='user', content='你好\n'), ChatMessage(role='assistant', content='  你好！ ')]
+    key = cache.make_key('glm-4', 0.1, '打开  记事本', history, 'v1')
+    spaced = [ChatMessage(role='user', content=' 你好'), ChatMessage(role='assistant', content='你好！')]
+    assert cache.make_key('glm-4', 0.1, '  打开 记事本\n', spaced, 'v1') == key
+    assert cache.make_key('glm-4', 0.1, '打开记事本', history, 'v1') != key
+    assert cache.make_key('glm-4', 0.2, '打开 记事本', history, 'v1') != key
+    assert cache.make_key('glm-4-air', 0.1, '打开 记事本', history, 'v1') != key
+    assert cache.make_key('glm-4', 0.1, '打开 记事本', history[:1], 'v1') != key
+
+
+def test_toolset_version_invalidates(monkeypatch):
+    import llm_agent
+
+    tool = SimpleNamespace(name='open_application', description='打开应用', args={'app_name': {}})
+    monkeypatch.setattr(llm_agent, 'get_tools', lambda: [tool])
+    monkeypatch.setattr(llm_agent, '_toolset_version', None)
+    before = llm_agent.toolset_version()
+    monkeypatch.setattr(llm_agent, '_toolset_version', None)
+    tool.description = '打开本机安装的应用'
+    after = llm_agent.toolset_version()
+    assert before != after
+
+    cache = create_response_cache('memory')
+    cache.set(cache.make_key('glm-4', 0.1, 'q', [], before), 'old')
+    assert cache.get(cache.make_key('glm-4', 0.1, 'q', [], after)) is None
+
+
+def test_counters_thread_safe():
+    cache = create_response_cache('memory')
+    cache.set('hit', 'v')
+
+    def worker():
+        for _ in range(2000):
+            cache.get('hit')
+            cache.get('miss')
+
+    threads = [threading.Thread(target=worker) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    stats = cache.stats()
+    assert (stats['hits'], stats['misses'], stats['hit_rate']) == (16000, 16000, 0.5)
+
+
+def test_unknown_backend():
+    assert create_response_cache(None) is None
+    with pytest.raises(ValueError):
+        create_response_cache('redis')
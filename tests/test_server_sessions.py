@@ -0,0 +1,75 @@
+"""server.py 中的会话参数：conversation_id 为 new 时新建会话，未知 id 返回 404，关闭会话时返回 400"""
+import json
+
+import pytest
+
+try:
+    import server
+except OSError as e:
+    # server 导入时加载 flowy.dll
+    pytest.skip(f'server 依赖的 flowy 动态库不可用: {e}', allow_module_level=True)
+
+from fastapi.testclient import TestClient
+
+from utils.session_store import create_session_store
+
+
+@pytest.fixture
+def client(monkeypatch):
+    calls = []
+
+    async def fake_result(query, history_messages=None, converted_history=None, **kwargs):
+        calls.append((query, [m.content for m in history_messages or []]))
+        return f'answer to {query}'
+
+    monkeypatch.setattr(server, 'ainvoke_result', fake_result)
+    monkeypatch.setattr(server, 'session_store', create_session_store('memory'))
+    client = TestClient(server.app)
+    client.calls = calls
+    return client
+
+
+def _post(client, content, **kwargs):
+    return client.post('/v1/chat/completions',
+                       json={'messages': [{'role': 'user', 'content': content}], 'stream': False, **kwargs})
+
+
+def test_session_opt_in(client):
+    response = _post(client, 'q0').json()
+    assert response.get('conversation_id') is None
+    assert server.session_store.stats()['sessions'] == 0
+
+    response = _post(client, 'q1', conversation_id='new').json()
+    conversation_id = response['conversation_id']
+    assert conversation_id and conversation_id != 'new'
+
+    _post(client, 'q2', conversation_id=conversation_id)
+    assert client.calls[-1] == ('q2', ['q1', 'answer to q1'])
+    assert len(server.session_store.get(conversation_id)) == 4
+
+
+def test_unknown_conversation_returns_404(client):
+    assert _post(client, 'q', conversation_id='missing').status_code == 404
+
+
+def test_sessions_disabled_returns_400(client, monkeypatch):
+    monkeypatch.setattr(server, 'session_store', None)
+    assert _post(client, 'q', conversation_id='new').status_code == 400
+    assert _post(client, 'q').status_code == 200
+
+
+def test_stream_error_sends_error_chunk_and_done(client, monkeypatch):
+    async def failing_stream(query, **kwargs):
+        yield 'partial'
+        raise RuntimeError('model unavailable')
+
+    monkeypatch.setattr(server, 'astream_result', failing_stream)
+    response = client.post('/v1/chat/completions', json={
+        'messages': [{'role': 'user', 'content': 'q'}], 'stream': True, 'conversation_id': 'new'})
+    assert response.status_code == 200
+    events = [line[len('data: '):] for line in response.text.splitlines() if line.startswith('data: ')]
+    assert 'partial' in events[1]
+    assert json.loads(events[-2]) == {'error': {'message': 'model unavailable', 'type': 'RuntimeError'}}
+    assert events[-1] == '[DONE]'
+    # 出错的回复不写入会话
+    assert server.session_store.stats()['messages'] == 0
@@ -0,0 +1,102 @@
+"""会话存储：创建、追加、持久化、过期和并发加载"""
+import sqlite3
+import threading
+import time
+
+import pytest
+
+from utils.session_store import SessionStore, SQLiteSessionBackend, create_session_store
+from utils.utils import ChatMessage
+
+
+def _turn(question, answer):
+    return [ChatMessage(role='user', content=question), ChatMessage(role='assistant', content=answer)]
+
+
+def test_memory_create_append_get():
+    store = create_session_store('memory')
+    session = store.create()
+    store.append(session, _turn('q1', 'a1'))
+    assert store.get(session.id) is session
+    messages, converted = session.snapshot()
+    assert [m.content for m in messages] == ['q1', 'a1']
+    assert [type(m).__name__ for m in converted] == ['HumanMessage', 'AIMessage']
+    assert store.get('missing') is None
+    assert store.stats()['hits'] == 1 and store.stats()['misses'] == 1
+
+
+def test_disabled_by_default():
+    assert create_session_store() is None
+
+
+def test_ttl_expiry():
+    store = SessionStore(ttl=0.05)
+    session = store.create()
+    time.sleep(0.1)
+    assert store.get(session.id) is None
+    assert store.stats()['expired'] == 1
+
+
+def test_sqlite_persists_and_reloads(tmp_path):
+    path = str(tmp_path / 'sessions.db')
+    store = create_session_store('sqlite', path=path)
+    session = store.create()
+    store.append(session, _turn('q1', 'a1'))
+    store.append(session, _turn('q2', 'a2'))
+
+    reloaded = create_session_store('sqlite', path=path).get(session.id)
+    assert [m.content for m in reloaded.messages] == ['q1', 'a1', 'q2', 'a2']
+    assert len(reloaded.converted) == 4
+
+
+def test_evicted_session_reloads_from_disk(tmp_path):
+    store = SessionStore(max_sessions=1, backend=SQLiteSessionBackend(str(tmp_path / 's.db')))
+    first = store.create()
+    store.append(first, _turn('q1', 'a1'))
+    store.create()
+    reloaded = store.get(first.id)
+    assert reloaded is not first and len(reloaded) == 2
+    assert store.stats()['loaded'] == 1
+
+
+def test_concurrent_load_returns_one_session(tmp_path):
+    path = str(tmp_path / 's.db')
+    writer = create_session_store('sqlite', path=path)
+    session = writer.create()
+    writer.append(session, _turn('q1', 'a1'))
+
+    store = create_session_store('sqlite', path=path)
+    load = store.backend.load
+    barrier = threading.Barrier(4)
+
+    def slow_load(conversation_id):
+        # 所有线程都从磁盘读到数据之后再继续，模拟同时未命中缓存
+        result = load(conversation_id)
+        barrier.wait(5)
+        return result
+
+    store.backend.load = slow_load
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(store.get(session.id))) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len({id(result) for result in results}) == 1
+
+    # 两个请求在同一个对象上追加，序号不会重复
+    loaded = results[0]
+    for i in range(2):
+        store.append(loaded, _turn(f'q{i + 2}', f'a{i + 2}'))
+    assert [m.content for m in create_session_store('sqlite', path=path).get(session.id).messages] == \
+        ['q1', 'a1', 'q2', 'a2', 'q3', 'a3']
+
+
+def test_sequence_collision_fails_loudly(tmp_path):
+    backend = SQLiteSessionBackend(str(tmp_path / 's.db'))
+    backend.append('sid', 0, _turn('q1', 'a1'), time.time())
+    with pytest.raises(sqlite3.IntegrityError):
+        backend.append('sid', 0, _turn('other', 'turn'), time.time())
+    # 失败的写入整体回滚，之前的轮次保持不变
+    _, messages = backend.load('sid')
+    assert [m.content for m in messages] == ['q1', 'a1']
@@ -0,0 +1,35 @@
+"""流式片段合并：按字节数输出后不会因为残留的计时输出空片段"""
+import asyncio
+
+from utils.sse_encoder import coalesce
+
+
+async def _fragments(items):
+    for item in items:
+        if isinstance(item, float):
+            await asyncio.sleep(item)
+        else:
+            yield item
+
+
+def _collect(items, **kwargs):
+    async def run():
+        return [chunk async for chunk in coalesce(_fragments(items), **kwargs)]
+    return asyncio.run(run())
+
+
+def test_no_empty_chunk_after_byte_flush():
+    chunks = _collect(['a' * 70, 0.1, 'b'], interval_ms=20, max_bytes=64)
+    assert chunks == ['a' * 70, 'b']
+
+
+def test_interval_and_byte_flush():
+    chunks = _collect(['a', 'b', 0.1, 'c' * 10, 'd'], interval_ms=20, max_bytes=8)
+    assert chunks == ['ab', 'c' * 10, 'd']
+    assert all(chunks)
+
+
+def test_error_event():
+    from utils.sse_encoder import ChunkEncoder
+    event = ChunkEncoder.error_event('模型不可用', 'RuntimeError')
+    assert event == 'data: {"error": {"message": "模型不可用", "type": "RuntimeError"}}\r\n\r\n'.encode('utf-8')
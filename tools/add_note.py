@@ -2,6 +2,7 @@
 from langchain.pydantic_v1 import BaseModel, Field
 from langchain.tools import tool
 from utils.utils import get_os_type
+from utils.async_utils import async_impl, run_subprocess
 import os
 
 
@@ -37,6 +38,30 @@ def add_note(title: str, content: str):
         return 'Unsupported platform'
 
 
+@async_impl(add_note)
+async def aadd_note(title: str, content: str):
+    os_type = get_os_type()
+
+    if os_type == 'macOS':
+        apple_script = f'''
+            tell application "Notes"
+                activate
+                tell account "iCloud"
+                    set newNote to make new note at folder "Notes" with properties {{name:"{title}", body:"{content}"}}
+                end tell
+            end tell
+            '''
+        # 直接传给 osascript，不经过 shell
+        await run_subprocess('osascript', '-e', apple_script, check=False)
+        return '备忘录打开了并且写入完成了'
+
+    elif os_type == 'Windows':
+        return '便笺还不能打开'
+
+    else:
+        return 'Unsupported platform'
+
+
 if __name__ == '__main__':
     print(add_note.name)
     print(add_note.invoke({'title': 'beauty girl', 'content': 'a very beautiful girl lucy.'}))
@@ -0,0 +1,405 @@
+"""系统音量后端：每个平台一个长期存在的会话对象，缓存当前音量/静音状态，合并连续的调节"""
+import os
+import re
+import time
+import shutil
+import asyncio
+import platform
+import threading
+import subprocess
+from typing import NamedTuple, Optional, Dict, Any, Tuple
+
+from utils.coalesce import Coalescer
+from utils.async_utils import run_io, run_subprocess
+
+
+class AudioState(NamedTuple):
+    volume: int
+    muted: bool
+
+
+def clamp(level: float) -> int:
+    return int(max(0, min(100, round(level))))
+
+
+class AudioBackend:
+    """
+    音量后端基类，子类实现 _read_state / _write_volume / _write_mute，
+    异步版本 _aread_state / _awrite_volume / _awrite_mute 默认在 I/O 线程池中执行同步实现
+    :param state_ttl: 缓存的音量状态有效期(s)，过期后重新读取（用户可能通过按键调节了音量）
+    :param coalesce_window: 合并窗口(s)，窗口期内连续的音量调节只写入最后的目标值
+    """
+    name = 'base'
+
+    def __init__(self, state_ttl: float = 2.0, coalesce_window: float = 0.03):
+        self.state_ttl = state_ttl
+        self._state: Optional[AudioState] = None
+        self._state_at = 0.0
+        # 最新的目标值 {'volume': 音量, 'mute': 是否静音}，写入时读取，保证最后计算的目标值生效
+        self._targets: Dict[str, Any] = {}
+        self._lock = threading.RLock()
+        self._coalescer = Coalescer(self._apply, window=coalesce_window, aapply=self._aapply)
+        self.reads = 0
+        self.writes = 0
+
+    def _read_state(self) -> AudioState:
+        raise NotImplementedError
+
+    def _write_volume(self, level: int) -> None:
+        raise NotImplementedError
+
+    def _write_mute(self, muted: bool) -> None:
+        raise NotImplementedError
+
+    async def _aread_state(self) -> AudioState:
+        return await run_io(self._read_state)
+
+    async def _awrite_volume(self, level: int) -> None:
+        await run_io(self._write_volume, level)
+
+    async def _awrite_mute(self, muted: bool) -> None:
+        await run_io(self._write_mute, muted)
+
+    def _pop_target(self, key: str) -> Tuple[bool, Any]:
+        with self._lock:
+            if key not in self._targets:
+                return False, None
+            self.writes += 1
+            return True, self._targets.pop(key)
+
+    def _apply(self, key: str, _=None) -> None:
+        found, value = self._pop_target(key)
+        if not found:
+            return
+        try:
+            if key == 'volume':
+                self._write_volume(value)
+            else:
+                self._write_mute(value)
+        except Exception:
+            self.invalidate()
+            raise
+
+    async def _aapply(self, key: str, _=None) -> None:
+        found, value = self._pop_target(key)
+        if not found:
+            return
+        try:
+            if key == 'volume':
+                await self._awrite_volume(value)
+            else:
+                await self._awrite_mute(value)
+        except Exception:
+            self.invalidate()
+            raise
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._state = None
+
+    def get_state(self) -> AudioState:
+        """当前音量状态，缓存有效时不访问系统"""
+        with self._lock:
+            if self._expired():
+                self.reads += 1
+                self._state = self._read_state()
+                self._state_at = time.monotonic()
+            return self._state
+
+    def _expired(self) -> bool:
+        return self._state is None or time.monotonic() - self._state_at > self.state_ttl
+
+    async def aget_state(self) -> AudioState:
+        """get_state 的异步版本，读取系统状态时不阻塞事件循环"""
+        with self._lock:
+            if not self._expired():
+                return self._state
+        state = await self._aread_state()
+        with self._lock:
+            if self._expired():
+                self.reads += 1
+                self._state = state
+                self._state_at = time.monotonic()
+            return self._state
+
+    def _update(self, key: str, value: Any) -> None:
+        # 写入前先更新缓存，后续的调节基于目标值计算
+        with self._lock:
+            self._state = self.get_state()._replace(**{'muted' if key == 'mute' else key: value})
+            self._state_at = time.monotonic()
+            self._targets[key] = value
+
+    def set_volume(self, level: int) -> int:
+        level = clamp(level)
+        self._update('volume', level)
+        self._coalescer.submit('volume')
+        return level
+
+    def adjust_volume(self, step: int) -> Tuple[int, int]:
+        """按步长调节音量，返回 (调节前的音量, 调节后的音量)"""
+        with self._lock:
+            current = self.get_state().volume
+            new_volume = clamp(current + step)
+            if new_volume == current:
+                return current, new_volume
+            self._update('volume', new_volume)
+        self._coalescer.submit('volume')
+        return current, new_volume
+
+    def set_mute(self, muted: bool) -> None:
+        self._update('mute', muted)
+        self._coalescer.submit('mute')
+
+    async def aset_volume(self, level: int) -> int:
+        level = clamp(level)
+        await self.aget_state()
+        self._update('volume', level)
+        await self._coalescer.asubmit('volume')
+        return level
+
+    async def aadjust_volume(self, step: int) -> Tuple[int, int]:
+        await self.aget_state()
+        with self._lock:
+            current = self.get_state().volume
+            new_volume = clamp(current + step)
+            if new_volume == current:
+                return current, new_volume
+            self._update('volume', new_volume)
+        await self._coalescer.asubmit('volume')
+        return current, new_volume
+
+    async def aset_mute(self, muted: bool) -> None:
+        await self.aget_state()
+        self._update('mute', muted)
+        await self._coalescer.asubmit('mute')
+
+    def stats(self) -> Dict[str, Any]:
+        return {'backend': self.name, 'reads': self.reads, 'writes': self.writes, **self._coalescer.stats()}
+
+
+class MacAudioBackend(AudioBackend):
+    """macOS：一次 osascript 同时读取音量和静音状态"""
+    name = 'macOS'
+
+    @staticmethod
+    def _osascript(script: str) -> str:
+        return subprocess.run(['osascript', '-e', script], capture_output=True, text=True, check=True).stdout
+
+    @staticmethod
+    def _parse_state(output: str) -> AudioState:
+        # output volume:44, input volume:75, alert volume:100, output muted:false
+        volume = re.search(r'output volume:(\d+)', output)
+        muted = re.search(r'output muted:(\w+)', output)
+        return AudioState(int(volume.group(1)) if volume else 0, bool(muted) and muted.group(1) == 'true')
+
+    def _read_state(self) -> AudioState:
+        return self._parse_state(self._osascript('get volume settings'))
+
+    def _write_volume(self, level: int) -> None:
+        self._osascript(f'set volume output volume {level}')
+
+    def _write_mute(self, muted: bool) -> None:
+        self._osascript(f'set volume output muted {str(muted).lower()}')
+
+    async def _aread_state(self) -> AudioState:
+        return self._parse_state(await run_subprocess('osascript', '-e', 'get volume settings'))
+
+    async def _awrite_volume(self, level: int) -> None:
+        await run_subprocess('osascript', '-e', f'set volume output volume {level}')
+
+    async def _awrite_mute(self, muted: bool) -> None:
+        await run_subprocess('osascript', '-e', f'set volume output muted {str(muted).lower()}')
+
+
+class WindowsAudioBackend(AudioBackend):
+    """Windows：IAudioEndpointVolume 接口按线程缓存（COM 对象不能跨线程使用）"""
+    name = 'Windows'
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._local = threading.local()
+
+    def _endpoint(self):
+        endpoint = getattr(self._local, 'endpoint', None)
+        if endpoint is None:
+            import comtypes
+            from ctypes import POINTER, cast
+            from comtypes import CLSCTX_ALL
+            from pycaw.pycaw import AudioUtilities, IAudioEndpointVolume
+
+            comtypes.CoInitialize()
+            devices = AudioUtilities.GetSpeakers()
+            interface = devices.Activate(IAudioEndpointVolume._iid_, CLSCTX_ALL, None)
+            endpoint = self._local.endpoint = cast(interface, POINTER(IAudioEndpointVolume))
+        return endpoint
+
+    def _read_state(self) -> AudioState:
+        endpoint = self._endpoint()
+        return AudioState(clamp(endpoint.GetMasterVolumeLevelScalar() * 100), bool(endpoint.GetMute()))
+
+    def _write_volume(self, level: int) -> None:
+        # 标量音量 [0.0, 1.0] 和系统音量滑块一致
+        self._endpoint().SetMasterVolumeLevelScalar(level / 100, None)
+
+    def _write_mute(self, muted: bool) -> None:
+        self._endpoint().SetMute(int(muted), None)
+
+
+class PulseAudioBackend(AudioBackend):
+    """Linux PulseAudio / PipeWire（pactl）"""
+    name = 'pulse'
+    sink = '@DEFAULT_SINK@'
+
+    @staticmethod
+    def _pactl(*args: str) -> str:
+        return subprocess.run(['pactl', *args], capture_output=True, text=True, check=True).stdout
+
+    @staticmethod
+    def _parse_state(volume_output: str, mute_output: str) -> AudioState:
+        volume = re.search(r'(\d+)%', volume_output)
+        return AudioState(int(volume.group(1)) if volume else 0, 'yes' in mute_output)
+
+    def _read_state(self) -> AudioState:
+        return self._parse_state(self._pactl('get-sink-volume', self.sink), self._pactl('get-sink-mute', self.sink))
+
+    def _write_volume(self, level: int) -> None:
+        self._pactl('set-sink-volume', self.sink, f'{level}%')
+
+    def _write_mute(self, muted: bool) -> None:
+        self._pactl('set-sink-mute', self.sink, '1' if muted else '0')
+
+    async def _aread_state(self) -> AudioState:
+        return self._parse_state(await run_subprocess('pactl', 'get-sink-volume', self.sink),
+                                 await run_subprocess('pactl', 'get-sink-mute', self.sink))
+
+    async def _awrite_volume(self, level: int) -> None:
+        await run_subprocess('pactl', 'set-sink-volume', self.sink, f'{level}%')
+
+    async def _awrite_mute(self, muted: bool) -> None:
+        await run_subprocess('pactl', 'set-sink-mute', self.sink, '1' if muted else '0')
+
+
+class AlsaAudioBackend(AudioBackend):
+    """Linux ALSA（amixer），一次调用同时读取音量和静音状态"""
+    name = 'alsa'
+    control = 'Master'
+
+    def _amixer(self, *args: str) -> str:
+        return subprocess.run(['amixer', *args], capture_output=True, text=True, check=True).stdout
+
+    @staticmethod
+    def _parse_state(output: str) -> AudioState:
+        # Front Left: Playback 45 [50%] [-20.00dB] [on]
+        volume = re.search(r'\[(\d+)%\]', output)
+        return AudioState(int(volume.group(1)) if volume else 0, '[off]' in output)
+
+    def _read_state(self) -> AudioState:
+        return self._parse_state(self._amixer('get', self.control))
+
+    def _write_volume(self, level: int) -> None:
+        self._amixer('-q', 'set', self.control, f'{level}%')
+
+    def _write_mute(self, muted: bool) -> None:
+        self._amixer('-q', 'set', self.control, 'mute' if muted else 'unmute')
+
+    async def _aread_state(self) -> AudioState:
+        return self._parse_state(await run_subprocess('amixer', 'get', self.control))
+
+    async def _awrite_volume(self, level: int) -> None:
+        await run_subprocess('amixer', '-q', 'set', self.control, f'{level}%')
+
+    async def _awrite_mute(self, muted: bool) -> None:
+        await run_subprocess('amixer', '-q', 'set', self.control, 'mute' if muted else 'unmute')
+
+
+class FakeAudioBackend(AudioBackend):
+    """内存中的音量后端，用于测试和不支持的平台上调试"""
+    name = 'fake'
+
+    def __init__(self, volume: int = 50, muted: bool = False, latency: float = 0.0, **kwargs):
+        super().__init__(**kwargs)
+        self.volume = volume
+        self.muted = muted
+        self.latency = latency
+
+    def _read_state(self) -> AudioState:
+        time.sleep(self.latency)
+        return AudioState(self.volume, self.muted)
+
+    def _write_volume(self, level: int) -> None:
+        time.sleep(self.latency)
+        self.volume = level
+
+    def _write_mute(self, muted: bool) -> None:
+        time.sleep(self.latency)
+        self.muted = muted
+
+    async def _aread_state(self) -> AudioState:
+        await asyncio.sleep(self.latency)
+        return AudioState(self.volume, self.muted)
+
+    async def _awrite_volume(self, level: int) -> None:
+        await asyncio.sleep(self.latency)
+        self.volume = level
+
+    async def _awrite_mute(self, muted: bool) -> None:
+        await asyncio.sleep(self.latency)
+        self.muted = muted
+
+
+AUDIO_BACKENDS = {
+    'macOS': MacAudioBackend,
+    'Windows': WindowsAudioBackend,
+    'pulse': PulseAudioBackend,
+    'alsa': AlsaAudioBackend,
+    'fake': FakeAudioBackend
+}
+
+_backend: Optional[AudioBackend] = None
+_backend_lock = threading.Lock()
+
+
+def detect_audio_backend() -> str:
+    """根据环境变量 AUDIO_BACKEND 或当前系统选择后端"""
+    name = os.environ.get('AUDIO_BACKEND')
+    if name:
+        return name
+    os_type = platform.system()
+    if os_type == 'Darwin':
+        return 'macOS'
+    if os_type == 'Windows':
+        return 'Windows'
+    if os_type == 'Linux':
+        if shutil.which('pactl'):
+            return 'pulse'
+        if shutil.which('amixer'):
+            return 'alsa'
+    raise EnvironmentError('Unsupported platform.')
+
+
+def get_audio_backend() -> AudioBackend:
+    """进程内共享的音量后端"""
+    global _backend
+    with _backend_lock:
+        if _backend is None:
+            backend_class = AUDIO_BACKENDS.get(detect_audio_backend())
+            if backend_class is None:
+                raise EnvironmentError(f'不支持的音量后端: {os.environ.get("AUDIO_BACKEND")}')
+            _backend = backend_class(
+                state_ttl=float(os.environ.get('AUDIO_STATE_TTL', 2.0)),
+                coalesce_window=float(os.environ.get('AUDIO_COALESCE_WINDOW', 0.03))
+            )
+        return _backend
+
+
+if __name__ == '__main__':
+    from concurrent.futures import ThreadPoolExecutor
+
+    # 模拟每次系统调用 50ms，连续 5 次“音量大一点”
+    backend = FakeAudioBackend(volume=30, latency=0.05)
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=5) as pool:
+        results = list(pool.map(lambda _: backend.adjust_volume(5), range(5)))
+    elapsed = (time.perf_counter() - start) * 1000
+    print('results:', [new for _, new in results], 'final volume:', backend.volume)
+    print(f'{elapsed:.1f} ms', backend.stats())
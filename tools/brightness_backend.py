@@ -0,0 +1,352 @@
+"""屏幕亮度后端：按显示器缓存当前亮度，合并连续的调节，支持多显示器"""
+import os
+import re
+import glob
+import time
+import shutil
+import asyncio
+import platform
+import threading
+import subprocess
+from typing import Optional, Dict, Any, List, Tuple
+
+from utils.coalesce import Coalescer
+from utils.async_utils import run_io, run_subprocess
+
+
+def clamp(level: float) -> int:
+    return int(max(0, min(100, round(level))))
+
+
+class BrightnessBackend:
+    """
+    亮度后端基类，子类实现 _read_levels / _write_level，
+    异步版本 _aread_levels / _awrite_level 默认在 I/O 线程池中执行同步实现
+    :param state_ttl: 缓存的亮度有效期(s)，过期后重新读取（用户可能通过按键调节了亮度）
+    :param coalesce_window: 合并窗口(s)，窗口期内对同一个显示器的连续调节只写入最后的目标值
+    """
+    name = 'base'
+
+    def __init__(self, state_ttl: float = 2.0, coalesce_window: float = 0.03):
+        self.state_ttl = state_ttl
+        self._levels: Optional[Dict[int, int]] = None
+        self._levels_at = 0.0
+        # 每个显示器最新的目标亮度，写入时读取，保证最后计算的目标值生效
+        self._targets: Dict[int, int] = {}
+        self._lock = threading.RLock()
+        self._coalescer = Coalescer(self._apply, window=coalesce_window, aapply=self._aapply)
+        self.reads = 0
+        self.writes = 0
+
+    def _read_levels(self) -> Dict[int, int]:
+        """一次读取所有显示器的亮度 {显示器编号: 0-100}"""
+        raise NotImplementedError
+
+    def _write_level(self, display: int, level: int) -> None:
+        raise NotImplementedError
+
+    async def _aread_levels(self) -> Dict[int, int]:
+        return await run_io(self._read_levels)
+
+    async def _awrite_level(self, display: int, level: int) -> None:
+        await run_io(self._write_level, display, level)
+
+    def _pop_target(self, display: int) -> Optional[int]:
+        with self._lock:
+            level = self._targets.pop(display, None)
+            if level is not None:
+                self.writes += 1
+            return level
+
+    def _apply(self, display: int, _=None) -> None:
+        level = self._pop_target(display)
+        if level is None:
+            return
+        try:
+            self._write_level(display, level)
+        except Exception:
+            self.invalidate()
+            raise
+
+    async def _aapply(self, display: int, _=None) -> None:
+        level = self._pop_target(display)
+        if level is None:
+            return
+        try:
+            await self._awrite_level(display, level)
+        except Exception:
+            self.invalidate()
+            raise
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._levels = None
+
+    def _expired(self) -> bool:
+        return self._levels is None or time.monotonic() - self._levels_at > self.state_ttl
+
+    def get_levels(self) -> Dict[int, int]:
+        """所有显示器的亮度，缓存有效时不访问系统"""
+        with self._lock:
+            if self._expired():
+                self.reads += 1
+                self._levels = self._read_levels()
+                self._levels_at = time.monotonic()
+            return dict(self._levels)
+
+    async def aget_levels(self) -> Dict[int, int]:
+        """get_levels 的异步版本，读取系统亮度时不阻塞事件循环"""
+        with self._lock:
+            if not self._expired():
+                return dict(self._levels)
+        levels = await self._aread_levels()
+        with self._lock:
+            if self._expired():
+                self.reads += 1
+                self._levels = levels
+                self._levels_at = time.monotonic()
+            return dict(self._levels)
+
+    def displays(self, display: Optional[int] = None) -> List[int]:
+        """要操作的显示器，display 为空时表示所有显示器"""
+        levels = self.get_levels()
+        if display is None:
+            return sorted(levels)
+        if display not in levels:
+            raise ValueError(f'显示器 {display} 不存在，可用的显示器: {sorted(levels)}')
+        return [display]
+
+    def _update(self, targets: Dict[int, int]) -> None:
+        # 写入前先更新缓存，后续的调节基于目标值计算
+        with self._lock:
+            self.get_levels()
+            self._levels.update(targets)
+            self._levels_at = time.monotonic()
+            self._targets.update(targets)
+
+    def set_level(self, level: int, display: Optional[int] = None) -> Dict[int, int]:
+        with self._lock:
+            targets = {index: clamp(level) for index in self.displays(display)}
+            self._update(targets)
+        for index in targets:
+            self._coalescer.submit(index)
+        return targets
+
+    def adjust_level(self, step: int, display: Optional[int] = None) -> Dict[int, Tuple[int, int]]:
+        """按步长调节亮度，返回 {显示器编号: (调节前的亮度, 调节后的亮度)}"""
+        with self._lock:
+            levels = self.get_levels()
+            changes = {index: (levels[index], clamp(levels[index] + step)) for index in self.displays(display)}
+            targets = {index: new for index, (old, new) in changes.items() if old != new}
+            self._update(targets)
+        for index in targets:
+            self._coalescer.submit(index)
+        return changes
+
+    async def aset_level(self, level: int, display: Optional[int] = None) -> Dict[int, int]:
+        await self.aget_levels()
+        with self._lock:
+            targets = {index: clamp(level) for index in self.displays(display)}
+            self._update(targets)
+        await asyncio.gather(*[self._coalescer.asubmit(index) for index in targets])
+        return targets
+
+    async def aadjust_level(self, step: int, display: Optional[int] = None) -> Dict[int, Tuple[int, int]]:
+        await self.aget_levels()
+        with self._lock:
+            levels = self.get_levels()
+            changes = {index: (levels[index], clamp(levels[index] + step)) for index in self.displays(display)}
+            targets = {index: new for index, (old, new) in changes.items() if old != new}
+            self._update(targets)
+        await asyncio.gather(*[self._coalescer.asubmit(index) for index in targets])
+        return changes
+
+    def stats(self) -> Dict[str, Any]:
+        return {'backend': self.name, 'reads': self.reads, 'writes': self.writes, **self._coalescer.stats()}
+
+
+class MacBrightnessBackend(BrightnessBackend):
+    """
+    macOS：brightness 命令行工具（brew install brightness）
+    -l 列出的 display N 只是列表中的位置，-d 需要的是 CGDirectDisplayID（同一列表中的 ID 0x...）
+    """
+    name = 'macOS'
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        # 显示器编号 -> CGDirectDisplayID，每次读取亮度时更新
+        self._display_ids: Dict[int, str] = {}
+
+    def _parse_levels(self, output: str) -> Dict[int, int]:
+        # display 0: main, active, awake, online, built-in, ID 0x4280a80
+        # display 0: brightness 0.750000
+        display_ids = {int(index): display_id
+                       for index, display_id in re.findall(r'display (\d+):.*\bID (0x[0-9a-fA-F]+)', output)}
+        levels = {int(index): clamp(float(value) * 100)
+                  for index, value in re.findall(r'display (\d+): brightness ([\d.]+)', output)}
+        if not levels:
+            raise ValueError('无法从命令行输出中解析亮度值')
+        with self._lock:
+            self._display_ids = display_ids
+        return levels
+
+    def _display_id(self, display: int) -> str:
+        with self._lock:
+            display_id = self._display_ids.get(display)
+        if display_id is None:
+            raise ValueError(f'无法确定显示器{display}的ID')
+        return display_id
+
+    def _read_levels(self) -> Dict[int, int]:
+        return self._parse_levels(
+            subprocess.run(['brightness', '-l'], capture_output=True, text=True, check=True).stdout
+        )
+
+    def _write_level(self, display: int, level: int) -> None:
+        subprocess.run(['brightness', '-d', self._display_id(display), str(level / 100)], check=True)
+
+    async def _aread_levels(self) -> Dict[int, int]:
+        return self._parse_levels(await run_subprocess('brightness', '-l'))
+
+    async def _awrite_level(self, display: int, level: int) -> None:
+        await run_subprocess('brightness', '-d', self._display_id(display), str(level / 100))
+
+
+class WindowsBrightnessBackend(BrightnessBackend):
+    """Windows：screen_brightness_control"""
+    name = 'Windows'
+
+    def _read_levels(self) -> Dict[int, int]:
+        import screen_brightness_control as sbc
+        return {index: clamp(level) for index, level in enumerate(sbc.get_brightness())}
+
+    def _write_level(self, display: int, level: int) -> None:
+        import screen_brightness_control as sbc
+        sbc.set_brightness(level, display=display)
+
+
+class SysfsBrightnessBackend(BrightnessBackend):
+    """Linux：/sys/class/backlight（写入需要对 brightness 文件有写权限，例如配置 udev 规则）"""
+    name = 'sysfs'
+
+    def __init__(self, root: str = '/sys/class/backlight', **kwargs):
+        super().__init__(**kwargs)
+        self.devices = sorted(glob.glob(os.path.join(root, '*')))
+        self._max: Dict[int, int] = {}
+
+    def _max_brightness(self, display: int) -> int:
+        if display not in self._max:
+            with open(os.path.join(self.devices[display], 'max_brightness')) as f:
+                self._max[display] = int(f.read()) or 1
+        return self._max[display]
+
+    def _read_levels(self) -> Dict[int, int]:
+        levels = {}
+        for index, device in enumerate(self.devices):
+            with open(os.path.join(device, 'brightness')) as f:
+                levels[index] = clamp(int(f.read()) * 100 / self._max_brightness(index))
+        return levels
+
+    def _write_level(self, display: int, level: int) -> None:
+        with open(os.path.join(self.devices[display], 'brightness'), 'w') as f:
+            f.write(str(round(level * self._max_brightness(display) / 100)))
+
+
+class FakeBrightnessBackend(BrightnessBackend):
+    """内存中的亮度后端，用于测试和不支持的平台上调试"""
+    name = 'fake'
+
+    def __init__(self, levels: Optional[List[int]] = None, latency: float = 0.0, **kwargs):
+        super().__init__(**kwargs)
+        self.levels = dict(enumerate(levels or [50]))
+        self.latency = latency
+
+    def _read_levels(self) -> Dict[int, int]:
+        time.sleep(self.latency)
+        return dict(self.levels)
+
+    def _write_level(self, display: int, level: int) -> None:
+        time.sleep(self.latency)
+        self.levels[display] = level
+
+    async def _aread_levels(self) -> Dict[int, int]:
+        await asyncio.sleep(self.latency)
+        return dict(self.levels)
+
+    async def _awrite_level(self, display: int, level: int) -> None:
+        await asyncio.sleep(self.latency)
+        self.levels[display] = level
+
+
+BRIGHTNESS_BACKENDS = {
+    'macOS': MacBrightnessBackend,
+    'Windows': WindowsBrightnessBackend,
+    'sysfs': SysfsBrightnessBackend,
+    'fake': FakeBrightnessBackend
+}
+
+_backend: Optional[BrightnessBackend] = None
+_backend_lock = threading.Lock()
+
+
+def detect_brightness_backend() -> str:
+    """根据环境变量 BRIGHTNESS_BACKEND 或当前系统选择后端"""
+    name = os.environ.get('BRIGHTNESS_BACKEND')
+    if name:
+        return name
+    os_type = platform.system()
+    if os_type == 'Darwin' and shutil.which('brightness'):
+        return 'macOS'
+    if os_type == 'Windows':
+        return 'Windows'
+    if os_type == 'Linux' and glob.glob('/sys/class/backlight/*'):
+        return 'sysfs'
+    raise EnvironmentError('Unsupported platform.')
+
+
+def get_brightness_backend() -> BrightnessBackend:
+    """进程内共享的亮度后端"""
+    global _backend
+    with _backend_lock:
+        if _backend is None:
+            backend_class = BRIGHTNESS_BACKENDS.get(detect_brightness_backend())
+            if backend_class is None:
+                raise EnvironmentError(f'不支持的亮度后端: {os.environ.get("BRIGHTNESS_BACKEND")}')
+            _backend = backend_class(
+                state_ttl=float(os.environ.get('BRIGHTNESS_STATE_TTL', 2.0)),
+                coalesce_window=float(os.environ.get('BRIGHTNESS_COALESCE_WINDOW', 0.03))
+            )
+        return _backend
+
+
+if __name__ == '__main__':
+    from concurrent.futures import ThreadPoolExecutor
+
+    # 基准测试：模拟每次系统调用 20ms，连续 5 次“调亮一点”
+    latency, rounds = 0.02, 5
+
+    # 原来的实现：每次调节都读取一次再写入一次
+    backend = FakeBrightnessBackend(levels=[40, 60], latency=latency)
+    start = time.perf_counter()
+    for _ in range(rounds):
+        current = backend._read_levels()[0]
+        backend._write_level(0, clamp(current + 5))
+    print(f'read + write per step:  {(time.perf_counter() - start) / rounds * 1000:6.1f} ms/step, '
+          f'{rounds * 2} system calls')
+
+    for window in (0.0, 0.03):
+        # 依次调节：只读取一次，之后基于缓存计算目标值
+        backend = FakeBrightnessBackend(levels=[40, 60], latency=latency, coalesce_window=window)
+        start = time.perf_counter()
+        for _ in range(rounds):
+            backend.adjust_level(5, display=0)
+        sequential = (time.perf_counter() - start) / rounds * 1000
+
+        # 同时到达的调节：合并成一次写入
+        burst = FakeBrightnessBackend(levels=[40, 60], latency=latency, coalesce_window=window)
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=rounds) as pool:
+            list(pool.map(lambda _: burst.adjust_level(5), range(rounds)))
+        concurrent = (time.perf_counter() - start) * 1000
+        print(f'window {window * 1000:4.0f} ms: sequential {sequential:6.1f} ms/step {backend.stats()}; '
+              f'burst of {rounds} {concurrent:6.1f} ms total {burst.stats()} levels {burst.levels}')
@@ -0,0 +1,230 @@
+"""
+流式写入文档
+内容分块追加到目标目录下的临时文件，全部写完后 fsync 再原子替换为目标文件；中途失败时删除临时文件，不会留下写了一半的文档
+"""
+import os
+import uuid
+import logging
+import tempfile
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Optional, Iterable, Callable, Dict, Any
+
+from utils.async_utils import io_executor
+
+CHUNK_SIZE = 64 * 1024
+
+logger = logging.getLogger(__name__)
+
+# mkstemp 创建的文件权限是 0600，提交时按进程的 umask 改为普通文件的权限
+_umask: Optional[int] = None
+_umask_lock = threading.Lock()
+
+
+def _read_umask() -> int:
+    # Linux 可以直接读取，不需要修改进程的 umask
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('Umask:'):
+                    return int(line.split()[1], 8)
+    except (OSError, ValueError, IndexError):
+        pass
+    # 其他平台只能先设置再恢复：临时值用 0o077（比任何 umask 都严格），期间其他线程创建的文件不会权限过宽
+    mask = os.umask(0o077)
+    os.umask(mask)
+    return mask
+
+
+def current_umask() -> int:
+    """进程的 umask（第一次提交时在锁内读取一次）"""
+    global _umask
+    with _umask_lock:
+        if _umask is None:
+            _umask = _read_umask()
+        return _umask
+
+
+def iter_chunks(content: str, chunk_size: int = CHUNK_SIZE) -> Iterable[str]:
+    """把完整的字符串切成块（每次只多出一个块的副本）"""
+    for start in range(0, len(content), chunk_size):
+        yield content[start:start + chunk_size]
+
+
+class DocumentSink:
+    """
+    文档写入器
+    :param path: 目标文件路径
+    :param finalize: 提交前对临时文件的处理 finalize(临时文本文件, 输出文件)，例如把文本渲染为 docx；为空时直接替换
+    """
+
+    def __init__(self, path: str, finalize: Optional[Callable[[str, str], None]] = None, encoding: str = 'utf-8'):
+        self.path = path
+        self.finalize = finalize
+        # 已写入的字符数
+        self.written = 0
+        directory, name = os.path.split(os.path.abspath(path))
+        try:
+            fd, self.temp_path = tempfile.mkstemp(prefix=f'.{name}.', suffix='.part', dir=directory)
+        except FileNotFoundError:
+            # 工作目录在缓存之后被删除
+            os.makedirs(directory, exist_ok=True)
+            fd, self.temp_path = tempfile.mkstemp(prefix=f'.{name}.', suffix='.part', dir=directory)
+        self._file = os.fdopen(fd, 'w', encoding=encoding)
+
+    def write(self, chunk: str) -> int:
+        self._file.write(chunk)
+        self.written += len(chunk)
+        return self.written
+
+    def commit(self) -> str:
+        """写完后原子替换为目标文件"""
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._file.close()
+        if self.finalize is None:
+            os.chmod(self.temp_path, 0o666 & ~current_umask())
+            os.replace(self.temp_path, self.path)
+            return self.path
+        output_path = self.temp_path + os.path.splitext(self.path)[1]
+        try:
+            self.finalize(self.temp_path, output_path)
+            os.chmod(output_path, 0o666 & ~current_umask())
+            os.replace(output_path, self.path)
+        finally:
+            for path in (self.temp_path, output_path):
+                if os.path.exists(path):
+                    os.remove(path)
+        return self.path
+
+    def abort(self) -> None:
+        if not self._file.closed:
+            self._file.close()
+        if os.path.exists(self.temp_path):
+            os.remove(self.temp_path)
+
+    def __enter__(self) -> 'DocumentSink':
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        if exc_type is None:
+            self.commit()
+        else:
+            self.abort()
+
+
+class WriteHandle:
+    """后台写入任务的句柄"""
+
+    def __init__(self, path: str, total: Optional[int] = None):
+        self.id = uuid.uuid4().hex[:12]
+        self.path = path
+        self.total = total
+        self.written = 0
+        self.status = 'writing'
+        self.error: Optional[str] = None
+        self.future: Optional[Future] = None
+        # 写入结束并且结果已经记录（done-callback 执行完）
+        self.finished = threading.Event()
+
+    def wait(self, timeout: Optional[float] = None) -> 'WriteHandle':
+        if self.future is not None:
+            self.finished.wait(timeout)
+            self.future.result(0)
+        return self
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {'id': self.id, 'path': self.path, 'status': self.status, 'written': self.written,
+                'total': self.total, 'error': self.error}
+
+
+class DocumentWriter:
+    """
+    在 I/O 线程池中执行文档写入，调用方立即拿到句柄
+    :param max_handles: 保留的句柄数量（超过后丢弃最早的）
+    """
+
+    def __init__(self, max_handles: int = 128):
+        self.max_handles = max_handles
+        self._handles: 'OrderedDict[str, WriteHandle]' = OrderedDict()
+        self._lock = threading.Lock()
+        self.started = 0
+        self.completed = 0
+        self.failed = 0
+        self.last_error: Optional[Dict[str, Any]] = None
+
+    def _write(
+            self,
+            handle: WriteHandle,
+            chunks: Iterable[str],
+            finalize: Optional[Callable[[str, str], None]],
+            on_progress: Optional[Callable[[WriteHandle], None]]
+    ) -> None:
+        try:
+            with DocumentSink(handle.path, finalize) as sink:
+                for chunk in chunks:
+                    handle.written = sink.write(chunk)
+                    if on_progress is not None:
+                        on_progress(handle)
+            handle.status = 'done'
+        except Exception as e:
+            handle.status = 'failed'
+            handle.error = str(e)
+            raise
+        finally:
+            if on_progress is not None:
+                on_progress(handle)
+
+    def start(
+            self,
+            path: str,
+            chunks: Iterable[str],
+            total: Optional[int] = None,
+            finalize: Optional[Callable[[str, str], None]] = None,
+            on_progress: Optional[Callable[[WriteHandle], None]] = None
+    ) -> WriteHandle:
+        """开始写入 path，chunks 可以是任意（包括边生成边产出的）字符串迭代器"""
+        handle = WriteHandle(path, total)
+        with self._lock:
+            self._handles[handle.id] = handle
+            while len(self._handles) > self.max_handles:
+                self._handles.popitem(last=False)
+            self.started += 1
+        handle.future = io_executor.submit(self._write, handle, chunks, finalize, on_progress)
+        handle.future.add_done_callback(lambda future: self._finished(handle, future))
+        return handle
+
+    def _finished(self, handle: WriteHandle, future: Future) -> None:
+        """后台写入结束：没有调用方等待结果，失败在这里记录，不会随 future 一起丢失"""
+        error = future.exception()
+        try:
+            with self._lock:
+                if error is None:
+                    self.completed += 1
+                    return
+                self.failed += 1
+                self.last_error = {'id': handle.id, 'path': handle.path, 'error': handle.error or str(error)}
+            if handle.status != 'failed':
+                handle.status = 'failed'
+                handle.error = str(error)
+            logger.error('document write %s to %s failed: %s', handle.id, handle.path, error, exc_info=error)
+        finally:
+            handle.finished.set()
+
+    def get(self, handle_id: str) -> Optional[WriteHandle]:
+        with self._lock:
+            return self._handles.get(handle_id)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'started': self.started,
+                'completed': self.completed,
+                'failed': self.failed,
+                'writing': self.started - self.completed - self.failed,
+                'last_error': self.last_error
+            }
+
+
+document_writer = DocumentWriter()
@@ -0,0 +1,228 @@
+"""
+目录条目的持久化索引（SQLite）：记录每个条目的 mtime、大小、类型和最后一次写入索引的时间
+按目录 mtime 增量同步，目录没有变化时不重新扫描；“N 天未使用”直接查询索引，
+查询出的候选条目再单独 stat 一次确认（文件原地修改不会改变所在目录的 mtime）
+"""
+import os
+import time
+import sqlite3
+import threading
+from typing import Optional, Iterable, List, Dict, Any
+
+from tools.file_scanner import ScanEntry, ONE_DAY
+
+# 目录 mtime 和扫描时间相差小于该值时，下次仍然重新扫描（文件系统 mtime 精度不足时同一时刻的修改可能被漏掉）
+RACY_WINDOW = 2.0
+
+
+class FileIndex:
+    """
+    目录条目索引
+    :param path: SQLite 文件路径
+    """
+
+    def __init__(self, path: str):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS entries ('
+            'path TEXT PRIMARY KEY, parent TEXT NOT NULL, name TEXT NOT NULL, is_dir INTEGER NOT NULL, '
+            'size INTEGER NOT NULL, mtime REAL NOT NULL, last_seen REAL NOT NULL)'
+        )
+        self._conn.execute('CREATE INDEX IF NOT EXISTS idx_entries_parent ON entries (parent, mtime)')
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS dirs (path TEXT PRIMARY KEY, mtime_ns INTEGER NOT NULL, scanned_at REAL NOT NULL)'
+        )
+        self._conn.commit()
+        self._lock = threading.Lock()
+        self.stats: Dict[str, int] = {'dirs_checked': 0, 'dirs_rescanned': 0, 'entries_updated': 0,
+                                      'entries_removed': 0, 'candidates_verified': 0}
+
+    def _rescan(self, directory: str, now: float) -> None:
+        # 目录发生变化时重新写入所有条目的整行（同名条目可能已经被替换，类型和大小都会变化），删除消失的条目；
+        # 目录没有变化时条目原地修改的 mtime 在查询候选条目时再确认
+        known = {path for (path,) in self._conn.execute('SELECT path FROM entries WHERE parent = ?', (directory,))}
+        rows = []
+        try:
+            iterator = os.scandir(directory)
+        except OSError:
+            return
+        with iterator:
+            for entry in iterator:
+                try:
+                    is_dir = entry.is_dir(follow_symlinks=False)
+                    stat = entry.stat(follow_symlinks=False)
+                except OSError:
+                    # 列出之后被删除，和消失的条目一起删除
+                    continue
+                known.discard(entry.path)
+                rows.append((entry.path, directory, entry.name, int(is_dir),
+                             0 if is_dir else stat.st_size, stat.st_mtime, now))
+        self._conn.executemany(
+            'INSERT OR REPLACE INTO entries (path, parent, name, is_dir, size, mtime, last_seen) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?)', rows
+        )
+        self._conn.executemany('DELETE FROM entries WHERE path = ?', [(path,) for path in known])
+        self.stats['entries_updated'] += len(rows)
+        self.stats['entries_removed'] += len(known)
+
+    def _forget(self, directory: str) -> None:
+        self._conn.execute('DELETE FROM entries WHERE parent = ?', (directory,))
+        self._conn.execute('DELETE FROM dirs WHERE path = ?', (directory,))
+
+    def reconcile(self, root: str, max_depth: int = 0) -> List[str]:
+        """同步 root 下的索引，只重新扫描 mtime 变化的目录，返回同步过的目录"""
+        root = os.path.abspath(root)
+        visited = []
+        now = time.time()
+        with self._lock:
+            stack = [(root, 0)]
+            while stack:
+                directory, depth = stack.pop()
+                self.stats['dirs_checked'] += 1
+                try:
+                    mtime_ns = os.stat(directory).st_mtime_ns
+                except OSError:
+                    self._forget(directory)
+                    continue
+                visited.append(directory)
+
+                row = self._conn.execute('SELECT mtime_ns, scanned_at FROM dirs WHERE path = ?', (directory,)).fetchone()
+                if row is None or row[0] != mtime_ns or mtime_ns / 1e9 > row[1] - RACY_WINDOW:
+                    self.stats['dirs_rescanned'] += 1
+                    self._rescan(directory, now)
+                    self._conn.execute('INSERT OR REPLACE INTO dirs (path, mtime_ns, scanned_at) VALUES (?, ?, ?)',
+                                       (directory, mtime_ns, now))
+
+                if depth < max_depth:
+                    for (subdir,) in self._conn.execute(
+                            'SELECT path FROM entries WHERE parent = ? AND is_dir = 1', (directory,)).fetchall():
+                        stack.append((subdir, depth + 1))
+            self._conn.commit()
+        return visited
+
+    def _verify(self, entries: List[ScanEntry], cutoff_time: float) -> List[ScanEntry]:
+        """重新 stat 候选条目，去掉已经被删除或者最近修改过的"""
+        confirmed = []
+        with self._lock:
+            for entry in entries:
+                self.stats['candidates_verified'] += 1
+                try:
+                    stat = os.stat(entry.path, follow_symlinks=False)
+                except OSError:
+                    self._conn.execute('DELETE FROM entries WHERE path = ?', (entry.path,))
+                    continue
+                if stat.st_mtime != entry.mtime:
+                    self._conn.execute('UPDATE entries SET mtime = ?, size = ? WHERE path = ?',
+                                       (stat.st_mtime, 0 if entry.is_dir else stat.st_size, entry.path))
+                    entry = entry._replace(mtime=stat.st_mtime, size=0 if entry.is_dir else stat.st_size)
+                if entry.mtime < cutoff_time:
+                    confirmed.append(entry)
+            self._conn.commit()
+        return confirmed
+
+    def unused(
+            self,
+            root: str,
+            days: int,
+            max_depth: int = 0,
+            extensions: Optional[Iterable[str]] = None,
+            include_dirs: bool = True,
+            exclude: Optional[Iterable[str]] = None
+    ) -> List[ScanEntry]:
+        """最近 days 天没有修改过的文件和文件夹（和 file_scanner.scan_unused 的结果一致）"""
+        root = os.path.abspath(root)
+        directories = self.reconcile(root, max_depth)
+        cutoff_time = time.time() - days * ONE_DAY
+        extensions = {extension.lower() for extension in extensions} if extensions is not None else None
+        exclude = {os.path.normcase(os.path.abspath(path)) for path in exclude or ()}
+        depths = {directory: len(os.path.relpath(directory, root).split(os.sep)) - (directory == root)
+                  for directory in directories}
+
+        candidates = []
+        with self._lock:
+            for directory in directories:
+                for path, name, is_dir, size, mtime in self._conn.execute(
+                        'SELECT path, name, is_dir, size, mtime FROM entries WHERE parent = ? AND mtime < ?',
+                        (directory, cutoff_time)):
+                    if is_dir and not include_dirs:
+                        continue
+                    if not is_dir and extensions is not None and os.path.splitext(name)[1].lower() not in extensions:
+                        continue
+                    if exclude and os.path.normcase(path) in exclude:
+                        continue
+                    candidates.append(ScanEntry(path, name, bool(is_dir), size, mtime, depths[directory]))
+        return self._verify(candidates, cutoff_time)
+
+    def summary(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'entries': self._conn.execute('SELECT COUNT(*) FROM entries').fetchone()[0],
+                'dirs': self._conn.execute('SELECT COUNT(*) FROM dirs').fetchone()[0],
+                **self.stats
+            }
+
+
+_file_index: Optional[FileIndex] = None
+_file_index_lock = threading.Lock()
+
+
+def get_file_index() -> Optional[FileIndex]:
+    """进程内共享的目录索引，FILE_INDEX=0 时关闭（返回 None）"""
+    global _file_index
+    if os.environ.get('FILE_INDEX', '1') != '1':
+        return None
+    with _file_index_lock:
+        if _file_index is None:
+            path = os.environ.get(
+                'FILE_INDEX_PATH',
+                os.path.join(os.path.expanduser('~'), '.united-agent', 'file_index.sqlite3')
+            )
+            _file_index = FileIndex(path)
+        return _file_index
+
+
+if __name__ == '__main__':
+    import shutil
+    import tempfile
+    from tools.file_scanner import scan_unused
+
+    # 基准测试：100k 个文件的目录，反复查询“7 天未使用”的文件
+    root, index_dir = tempfile.mkdtemp(), tempfile.mkdtemp()
+    file_count = 100_000
+    old_time = time.time() - 30 * ONE_DAY
+    try:
+        for i in range(file_count):
+            path = os.path.join(root, f'file_{i}.txt')
+            with open(path, 'w'):
+                pass
+            # 只有少量文件满足条件
+            if i % 1000 == 0:
+                os.utime(path, (old_time, old_time))
+        os.utime(root, (time.time() - 60, time.time() - 60))
+
+        index = FileIndex(os.path.join(index_dir, 'index.sqlite3'))
+
+        def timed(label, func):
+            start = time.perf_counter()
+            result = func()
+            print(f'{label:32} {time.perf_counter() - start:7.3f}s  {len(result)} unused')
+
+        timed('full scandir scan', lambda: list(scan_unused(root, 7)))
+        timed('index: first run (build)', lambda: index.unused(root, 7))
+        timed('index: unchanged directory', lambda: index.unused(root, 7))
+
+        # 新增 10 个文件，修改 1 个候选文件的内容（目录 mtime 不变）
+        for i in range(10):
+            with open(os.path.join(root, f'new_{i}.txt'), 'w'):
+                pass
+        with open(os.path.join(root, 'file_0.txt'), 'w') as f:
+            f.write('changed')
+        os.utime(root, (time.time() - 60, time.time() - 60))
+        timed('index: 10 new files + 1 edit', lambda: index.unused(root, 7))
+        print(index.summary())
+    finally:
+        shutil.rmtree(root)
+        shutil.rmtree(index_dir)
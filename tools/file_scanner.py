@@ -0,0 +1,151 @@
+"""基于 os.scandir 的目录扫描：复用 DirEntry 的 stat 结果，惰性生成，支持递归深度和过滤条件"""
+import os
+import time
+import fnmatch
+from typing import NamedTuple, Optional, Iterable, Iterator, Dict, Any, List
+
+ONE_DAY = 24 * 60 * 60
+
+
+class ScanEntry(NamedTuple):
+    path: str
+    name: str
+    is_dir: bool
+    size: int
+    mtime: float
+    depth: int
+
+
+def scan(
+        root: str,
+        max_depth: int = 0,
+        extensions: Optional[Iterable[str]] = None,
+        patterns: Optional[Iterable[str]] = None,
+        min_size: Optional[int] = None,
+        max_size: Optional[int] = None,
+        include_dirs: bool = True,
+        exclude: Optional[Iterable[str]] = None
+) -> Iterator[ScanEntry]:
+    """
+    扫描目录，惰性返回文件和文件夹
+    每个条目最多一次 stat（Windows 上 scandir 自带 stat 信息，不需要额外的系统调用）；符号链接不跟随
+    :param root: 要扫描的目录
+    :param max_depth: 递归深度，0 只扫描 root 本身
+    :param extensions: 只返回这些扩展名的文件（小写，带点），为空时不过滤
+    :param patterns: 文件名需要匹配其中一个 glob 模式，如 *.png
+    :param min_size: 文件最小字节数
+    :param max_size: 文件最大字节数
+    :param include_dirs: 是否返回文件夹（文件夹不受扩展名、模式、大小过滤）
+    :param exclude: 跳过的路径（不返回也不进入）
+    """
+    extensions = {extension.lower() for extension in extensions} if extensions is not None else None
+    patterns = list(patterns) if patterns is not None else None
+    exclude = {os.path.normcase(os.path.abspath(path)) for path in exclude or ()}
+
+    stack = [(root, 0)]
+    while stack:
+        directory, depth = stack.pop()
+        try:
+            iterator = os.scandir(directory)
+        except (PermissionError, FileNotFoundError, NotADirectoryError):
+            continue
+        with iterator:
+            for entry in iterator:
+                if exclude and os.path.normcase(os.path.abspath(entry.path)) in exclude:
+                    continue
+                try:
+                    is_dir = entry.is_dir(follow_symlinks=False)
+                    stat = entry.stat(follow_symlinks=False)
+                except OSError:
+                    # 扫描过程中被删除
+                    continue
+
+                if is_dir:
+                    if include_dirs:
+                        yield ScanEntry(entry.path, entry.name, True, 0, stat.st_mtime, depth)
+                    if depth < max_depth:
+                        stack.append((entry.path, depth + 1))
+                    continue
+
+                if extensions is not None and os.path.splitext(entry.name)[1].lower() not in extensions:
+                    continue
+                if patterns is not None and not any(fnmatch.fnmatch(entry.name, pattern) for pattern in patterns):
+                    continue
+                if min_size is not None and stat.st_size < min_size:
+                    continue
+                if max_size is not None and stat.st_size > max_size:
+                    continue
+                yield ScanEntry(entry.path, entry.name, False, stat.st_size, stat.st_mtime, depth)
+
+
+def scan_unused(root: str, days: int, **kwargs) -> Iterator[ScanEntry]:
+    """最近 days 天没有修改过的文件和文件夹"""
+    cutoff_time = time.time() - days * ONE_DAY
+    return (entry for entry in scan(root, **kwargs) if entry.mtime < cutoff_time)
+
+
+def build_plan(entries: Iterable[ScanEntry], target_folder: str) -> Dict[str, Any]:
+    """生成移动计划（dry-run 时直接返回给调用方，不移动任何文件）"""
+    items: List[Dict[str, Any]] = []
+    total_size = 0
+    for entry in entries:
+        items.append({
+            'path': entry.path,
+            'type': 'folder' if entry.is_dir else 'file',
+            'size': entry.size,
+            'mtime': time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(entry.mtime)),
+            'destination': os.path.join(target_folder, entry.name)
+        })
+        total_size += entry.size
+    return {'target': target_folder, 'count': len(items), 'total_size': total_size, 'items': items}
+
+
+if __name__ == '__main__':
+    import shutil
+    import tempfile
+
+    def legacy_scan(desktop_path, days, allowed):
+        """原来的实现（去掉 print）：listdir + 每个条目多次 stat"""
+        unused_items = []
+        cutoff_time = time.time() - days * ONE_DAY
+        for item in os.listdir(desktop_path):
+            item_path = os.path.join(desktop_path, item)
+            if os.path.isfile(item_path):
+                if os.path.splitext(item)[-1].lower() in allowed:
+                    if not os.path.exists(item_path):
+                        continue
+                    if os.path.getmtime(item_path) < cutoff_time:
+                        unused_items.append(item_path)
+            if os.path.isdir(item_path):
+                if not os.path.exists(item_path):
+                    continue
+                if os.path.getmtime(item_path) < cutoff_time:
+                    unused_items.append(item_path)
+        return unused_items
+
+    # 基准测试：单个目录 100k 个文件，一半是 10 天前修改的
+    root = tempfile.mkdtemp()
+    file_count = 100_000
+    old_time = time.time() - 10 * ONE_DAY
+    extensions = ['.txt', '.png', '.mp4', '.log']
+    try:
+        start = time.perf_counter()
+        for i in range(file_count):
+            path = os.path.join(root, f'file_{i}{extensions[i % len(extensions)]}')
+            with open(path, 'w'):
+                pass
+            if i % 2:
+                os.utime(path, (old_time, old_time))
+        print(f'created {file_count} files in {time.perf_counter() - start:.1f}s')
+
+        allowed = {'.txt', '.png', '.mp4'}
+        for name, run in [
+            ('listdir + getmtime', lambda: legacy_scan(root, 7, allowed)),
+            ('scandir generator', lambda: [entry.path for entry in scan_unused(root, 7, extensions=allowed)])
+        ]:
+            run()  # 预热目录缓存
+            start = time.perf_counter()
+            result = run()
+            print(f'{name:20} {time.perf_counter() - start:6.3f}s  {len(result)} unused')
+    finally:
+        shutil.rmtree(root)
@@ -0,0 +1,365 @@
+"""
+批量移动文件和文件夹
+同一文件系统内直接 os.rename（原子操作）；跨文件系统时在线程池中并行复制（copy_file_range / sendfile）后删除源文件；
+目标已存在时自动加后缀；每一步写入追加式日志，中断的批次可以继续执行或者撤销
+"""
+import os
+import json
+import errno
+import time
+import uuid
+import shutil
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Any, Optional, Set, Tuple
+
+COPY_CHUNK = 64 * 1024 * 1024
+
+
+def fast_copy_file(src: str, dst: str) -> int:
+    """在内核中复制文件内容（copy_file_range，不支持时使用 sendfile），返回复制的字节数"""
+    size = os.path.getsize(src)
+    with open(src, 'rb') as fsrc, open(dst, 'wb') as fdst:
+        copied = 0
+        for copy in (getattr(os, 'copy_file_range', None), getattr(os, 'sendfile', None)):
+            if copy is None:
+                continue
+            try:
+                while copied < size:
+                    if copy is os.sendfile:
+                        sent = copy(fdst.fileno(), fsrc.fileno(), copied, min(COPY_CHUNK, size - copied))
+                    else:
+                        sent = copy(fsrc.fileno(), fdst.fileno(), min(COPY_CHUNK, size - copied), copied, copied)
+                    if sent == 0:
+                        break
+                    copied += sent
+                if copied >= size:
+                    break
+            except OSError:
+                # 文件系统不支持，换下一种方式
+                continue
+        if copied < size:
+            fsrc.seek(copied)
+            fdst.seek(copied)
+            shutil.copyfileobj(fsrc, fdst, COPY_CHUNK)
+            copied = size
+    shutil.copystat(src, dst)
+    return copied
+
+
+def _copy_tree(src: str, dst: str, pool: ThreadPoolExecutor) -> int:
+    """复制目录：目录结构按顺序创建，文件在线程池中并行复制，最后再设置目录的时间和权限"""
+    futures = []
+
+    def copy_function(file_src, file_dst):
+        futures.append(pool.submit(fast_copy_file, file_src, file_dst))
+        return file_dst
+
+    shutil.copytree(src, dst, symlinks=True, copy_function=copy_function)
+    copied = sum(future.result() for future in futures)
+    # 复制文件会修改目录的 mtime，文件全部复制完后重新设置
+    for directory, _, _ in os.walk(src):
+        shutil.copystat(directory, os.path.join(dst, os.path.relpath(directory, src)))
+    return copied
+
+
+def unique_destination(target_folder: str, name: str, reserved: Set[str]) -> str:
+    """目标已存在（或已经被本批次占用）时加后缀：report.pdf -> report (1).pdf"""
+    stem, extension = os.path.splitext(name)
+    if os.path.isdir(os.path.join(target_folder, name)):
+        stem, extension = name, ''
+    candidate = os.path.join(target_folder, name)
+    index = 1
+    while candidate in reserved or os.path.lexists(candidate):
+        candidate = os.path.join(target_folder, f'{stem} ({index}){extension}')
+        index += 1
+    reserved.add(candidate)
+    return candidate
+
+
+class MoveJournal:
+    """
+    追加式日志（JSON Lines），每一行是一次状态变化：plan / done / failed / undone
+    plan 在执行前全部写入并 fsync；rename 的记录每 flush_every 条写一次（中断时丢失的 done 记录由文件是否存在推断），
+    复制的记录每条立即写入
+    """
+
+    def __init__(self, path: str, flush_every: int = 256):
+        self.path = path
+        self.flush_every = flush_every
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._file = open(path, 'a', encoding='utf-8')
+        self._lock = threading.Lock()
+        self._unflushed = 0
+
+    def write(self, op: str, src: str, dst: str, flush: bool = False, **extra) -> None:
+        record = {'op': op, 'src': src, 'dst': dst, 'time': time.time(), **extra}
+        with self._lock:
+            self._file.write(json.dumps(record, ensure_ascii=False) + '\n')
+            self._unflushed += 1
+            if flush or self._unflushed >= self.flush_every:
+                self._file.flush()
+                self._unflushed = 0
+
+    def sync(self) -> None:
+        with self._lock:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._unflushed = 0
+
+    def close(self) -> None:
+        if not self._file.closed:
+            self.sync()
+            self._file.close()
+
+    @staticmethod
+    def read(path: str) -> List[Dict[str, Any]]:
+        records = []
+        with open(path, encoding='utf-8') as f:
+            for line in f:
+                try:
+                    records.append(json.loads(line))
+                except ValueError:
+                    # 写到一半中断的最后一行
+                    break
+        return records
+
+    @classmethod
+    def state(cls, path: str) -> Dict[Tuple[str, str], str]:
+        """每一项 (src, dst) 的最终状态"""
+        states: Dict[Tuple[str, str], str] = {}
+        for record in cls.read(path):
+            if not record.get('undo'):
+                states[(record['src'], record['dst'])] = record['op']
+        return states
+
+
+class MoveEngine:
+    """
+    批量移动引擎
+    :param journal_dir: 日志目录，每个批次一个 <batch_id>.jsonl
+    :param max_workers: 跨文件系统复制时的并行数
+    :param force_copy: 强制使用复制 + 删除（测试跨文件系统的路径）
+    """
+
+    def __init__(self, journal_dir: Optional[str] = None, max_workers: int = 4, force_copy: bool = False):
+        self.journal_dir = journal_dir or os.path.join(os.path.expanduser('~'), '.united-agent', 'move_journal')
+        self.max_workers = max_workers
+        self.force_copy = force_copy
+
+    def journal_path(self, batch_id: str) -> str:
+        return os.path.join(self.journal_dir, f'{batch_id}.jsonl')
+
+    def _copy_one(self, src: str, dst: str, pool: ThreadPoolExecutor) -> int:
+        """
+        复制 + 删除源文件，返回复制的字节数
+        先复制到目标目录中的临时名称，完成后再 rename 到目标路径：复制失败或中断时不会留下不完整的目标，条目可以重试
+        """
+        is_dir = os.path.isdir(src) and not os.path.islink(src)
+        temp = os.path.join(os.path.dirname(dst), f'.{os.path.basename(dst)}.moving-{uuid.uuid4().hex[:8]}')
+        try:
+            copied = _copy_tree(src, temp, pool) if is_dir else fast_copy_file(src, temp)
+            os.rename(temp, dst)
+        except BaseException:
+            if is_dir:
+                shutil.rmtree(temp, ignore_errors=True)
+            elif os.path.lexists(temp):
+                os.remove(temp)
+            raise
+        if is_dir:
+            shutil.rmtree(src)
+        else:
+            os.remove(src)
+        return copied
+
+    def _run(
+            self,
+            batch_id: str,
+            pairs: List[Tuple[str, str]],
+            journal: MoveJournal,
+            undo: bool = False
+    ) -> Dict[str, Any]:
+        """
+        同一文件系统的条目在当前线程中直接 rename（没有数据复制，并行没有收益），
+        跨文件系统（EXDEV）的条目交给线程池复制；单个条目失败只记录下来，继续处理其他条目
+        """
+        report = {'batch_id': batch_id, 'journal': journal.path, 'moved': 0, 'renamed': [], 'failed': [],
+                  'bytes_copied': 0}
+
+        # 撤销时的反向移动单独标记，不影响原条目的状态
+        extra = {'undo': True} if undo else {}
+
+        def done(src, dst, method, copied=0):
+            # 复制耗时较长，每完成一项立即写入日志
+            journal.write('done', src, dst, flush=method == 'copy', method=method, bytes=copied, **extra)
+            report['moved'] += 1
+            report['bytes_copied'] += copied
+            if os.path.basename(src) != os.path.basename(dst):
+                report['renamed'].append((src, dst))
+
+        def failed(src, dst, error):
+            journal.write('failed', src, dst, flush=True, error=str(error), **extra)
+            report['failed'].append((src, str(error)))
+
+        to_copy = []
+        for src, dst in pairs:
+            try:
+                if os.path.lexists(dst):
+                    raise FileExistsError(f'目标已存在: {dst}')
+                if self.force_copy:
+                    to_copy.append((src, dst))
+                    continue
+                os.rename(src, dst)
+                done(src, dst, 'rename')
+            except OSError as e:
+                if e.errno == errno.EXDEV:
+                    to_copy.append((src, dst))
+                else:
+                    failed(src, dst, e)
+
+        if to_copy:
+            # 条目和目录中的文件使用不同的线程池，避免条目占满线程后等待文件复制而死锁
+            with ThreadPoolExecutor(max_workers=self.max_workers) as item_pool, \
+                    ThreadPoolExecutor(max_workers=self.max_workers) as file_pool:
+                futures = [(src, dst, item_pool.submit(self._copy_one, src, dst, file_pool)) for src, dst in to_copy]
+                for src, dst, future in futures:
+                    try:
+                        done(src, dst, 'copy', future.result())
+                    except Exception as e:
+                        failed(src, dst, e)
+        return report
+
+    def move_batch(self, items: List[str], target_folder: str, batch_id: Optional[str] = None) -> Dict[str, Any]:
+        """把 items 移动到 target_folder，先写入完整的计划再执行，单个失败不影响其他条目"""
+        batch_id = batch_id or time.strftime('%Y%m%d-%H%M%S-') + uuid.uuid4().hex[:6]
+        os.makedirs(target_folder, exist_ok=True)
+        reserved: Set[str] = set()
+        pairs = [(item, unique_destination(target_folder, os.path.basename(item.rstrip(os.sep)), reserved))
+                 for item in items]
+
+        journal = MoveJournal(self.journal_path(batch_id))
+        try:
+            for src, dst in pairs:
+                journal.write('plan', src, dst)
+            # 计划落盘后才开始移动，中断时 resume / undo 可以从日志中恢复
+            journal.sync()
+            return self._run(batch_id, pairs, journal)
+        finally:
+            journal.close()
+
+    def resume(self, batch_id: str) -> Dict[str, Any]:
+        """继续执行中断的批次：只处理计划中还没有完成的条目"""
+        path = self.journal_path(batch_id)
+        pairs = [(src, dst) for (src, dst), op in MoveJournal.state(path).items()
+                 if op in ('plan', 'failed') and os.path.lexists(src)]
+        journal = MoveJournal(path)
+        try:
+            return self._run(batch_id, pairs, journal)
+        finally:
+            journal.close()
+
+    def undo(self, batch_id: str) -> Dict[str, Any]:
+        """撤销批次：把已经移动的条目移回原来的位置，返回反向移动的报告"""
+        path = self.journal_path(batch_id)
+        # 中断时最后几条 done 可能没有写入，源路径不存在且目标存在的 plan 也视为已移动
+        moved = [(src, dst) for (src, dst), op in MoveJournal.state(path).items()
+                 if op == 'done' or (op == 'plan' and not os.path.lexists(src) and os.path.lexists(dst))]
+        journal = MoveJournal(path)
+        try:
+            # 反向移动，目标就是原来的路径，不再加后缀
+            report = self._run(batch_id, [(dst, src) for src, dst in reversed(moved)], journal, undo=True)
+            failed = {path for path, _ in report['failed']}
+            for src, dst in moved:
+                if dst not in failed:
+                    journal.write('undone', src, dst)
+        finally:
+            journal.close()
+        return report
+
+
+_engine: Optional[MoveEngine] = None
+_engine_lock = threading.Lock()
+
+
+def get_move_engine() -> MoveEngine:
+    """进程内共享的移动引擎"""
+    global _engine
+    with _engine_lock:
+        if _engine is None:
+            _engine = MoveEngine(
+                journal_dir=os.environ.get('MOVE_JOURNAL_DIR'),
+                max_workers=int(os.environ.get('MOVE_MAX_WORKERS', 4))
+            )
+        return _engine
+
+
+if __name__ == '__main__':
+    import tempfile
+
+    def make_files(folder, count, size=0):
+        os.makedirs(folder, exist_ok=True)
+        paths = []
+        for i in range(count):
+            path = os.path.join(folder, f'file_{i}.txt')
+            with open(path, 'wb') as f:
+                f.write(b'x' * size)
+            paths.append(path)
+        return paths
+
+    def timed(label, func, total_bytes=0):
+        start = time.perf_counter()
+        result = func()
+        elapsed = time.perf_counter() - start
+        throughput = f', {total_bytes / elapsed / 1e6:8.1f} MB/s' if total_bytes else ''
+        print(f'{label:42} {elapsed:7.3f}s{throughput}')
+        return result
+
+    root = tempfile.mkdtemp()
+    try:
+        engine = MoveEngine(journal_dir=os.path.join(root, 'journal'))
+        copy_engine = MoveEngine(journal_dir=os.path.join(root, 'journal'), force_copy=True)
+
+        # 5000 个小文件：shutil.move 逐个移动 vs 批量 rename
+        items = make_files(os.path.join(root, 'a'), 5000, 1024)
+        os.makedirs(os.path.join(root, 'a_dst'))
+        timed('shutil.move, 5000 files', lambda: [shutil.move(path, os.path.join(root, 'a_dst')) for path in items])
+        items = make_files(os.path.join(root, 'b'), 5000, 1024)
+        report = timed('engine rename, 5000 files', lambda: engine.move_batch(items, os.path.join(root, 'b_dst')))
+
+        # 名称冲突：再移动一批同名文件
+        items = make_files(os.path.join(root, 'b'), 100, 1024)
+        report = engine.move_batch(items, os.path.join(root, 'b_dst'))
+        print('collisions renamed:', len(report['renamed']), report['renamed'][0][1].rsplit(os.sep, 1)[-1])
+
+        # 跨文件系统路径：并行复制 8 个 64MB 文件
+        items = make_files(os.path.join(root, 'c'), 8, 64 * 1024 * 1024)
+        timed('engine copy, 8 x 64MB files', lambda: copy_engine.move_batch(items, os.path.join(root, 'c_dst')),
+              total_bytes=8 * 64 * 1024 * 1024)
+
+        # 大目录：2000 个文件的目录整体复制，对比 shutil.copytree + rmtree
+        make_files(os.path.join(root, 'd0', 'big_folder'), 2000, 16 * 1024)
+        timed('shutil.copytree + rmtree, 2000 files', lambda: shutil.copytree(
+            os.path.join(root, 'd0', 'big_folder'), os.path.join(root, 'd0_dst')) and shutil.rmtree(
+            os.path.join(root, 'd0', 'big_folder')), total_bytes=2000 * 16 * 1024)
+        make_files(os.path.join(root, 'd', 'big_folder'), 2000, 16 * 1024)
+        timed('engine copy, folder with 2000 files', lambda: copy_engine.move_batch(
+            [os.path.join(root, 'd', 'big_folder')], os.path.join(root, 'd_dst')), total_bytes=2000 * 16 * 1024)
+
+        # 撤销最后一个批次
+        items = make_files(os.path.join(root, 'e'), 10)
+        report = engine.move_batch(items, os.path.join(root, 'e_dst'))
+        undo_report = engine.undo(report['batch_id'])
+        print('undo: restored', undo_report['moved'], 'failed', len(undo_report['failed']),
+              '| files back in place:', len(os.listdir(os.path.join(root, 'e'))),
+              '| second undo:', engine.undo(report['batch_id'])['moved'])
+
+        # 中断后继续：只写入计划、不执行，resume 完成剩余条目
+        items = make_files(os.path.join(root, 'f'), 20)
+        engine.move_batch(items[:5], os.path.join(root, 'f_dst'), batch_id='interrupted')
+        journal = MoveJournal(engine.journal_path('interrupted'))
+        for path in items[5:]:
+            journal.write('plan', path, os.path.join(root, 'f_dst', os.path.basename(path)))
+        journal.close()
+        print('resume: moved', engine.resume('interrupted')['moved'], '| remaining:', len(os.listdir(os.path.join(root, 'f'))))
+    finally:
+        shutil.rmtree(root)
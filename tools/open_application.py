@@ -2,28 +2,41 @@
 from langchain.pydantic_v1 import BaseModel, Field
 from langchain.tools import tool
 import os
+import asyncio
 import subprocess
-from utils import get_os_type, BasicMatcher
+from utils import get_os_type, get_matcher
+from utils.async_utils import async_impl, run_io, run_subprocess
+from utils.app_catalog import get_app_catalog
 
 
 class AppNameInput(BaseModel):
     app_name: str = Field(description="The name of the app")
 
 
+def resolve_app(app_name: str):
+    """匹配应用名称，返回 (应用名称, 应用目录中的应用)"""
+    # 进程内共享的匹配器，规则只编译一次
+    matched_name = get_matcher().match_app(app_name)
+    # 正则匹配重新赋值
+    if matched_name:
+        app_name = matched_name
+
+    # 在已安装应用目录中查找（精确匹配名称/别名，找不到时模糊匹配）
+    app_entry = get_app_catalog().lookup(app_name)
+    if app_entry:
+        app_name = app_entry.name
+    return app_name, app_entry
+
+
 @tool("open-application", args_schema=AppNameInput)
 def open_application(app_name: str) -> str:
     """Open the specified app on your computer."""
 
     system_platform = get_os_type()
-
-    basic_matcher = BasicMatcher()
-    matched_name = basic_matcher.match_app(app_name)
-    # 正则匹配重新赋值
-    if matched_name:
-        app_name = matched_name
+    app_name, app_entry = resolve_app(app_name)
 
     if system_platform == "macOS":
-        app_path = f"/Applications/{app_name}.app"
+        app_path = app_entry.path if app_entry else f"/Applications/{app_name}.app"
         if os.path.exists(app_path):
             subprocess.run(["open", app_path])
             return f'{app_name}已经打开了'
@@ -34,7 +47,11 @@ def open_application(app_name: str) -> str:
 
     elif system_platform == "Windows":
         try:
-            subprocess.run(["start", app_name], shell=True)
+            if app_entry:
+                # 开始菜单中的快捷方式
+                subprocess.run(["start", "", app_entry.path], shell=True)
+            else:
+                subprocess.run(["start", app_name], shell=True)
             return f'{app_name}已经打开了'
         except Exception as e:
             # raise RuntimeError(f"Failed to open {app_name}: {e}")
@@ -66,6 +83,44 @@ def open_calc():
             return '无法找到计算器程序'
 
 
+@async_impl(open_application)
+async def aopen_application(app_name: str) -> str:
+    system_platform = get_os_type()
+    # 应用目录可能需要刷新索引（磁盘 I/O），放到 I/O 线程池中执行
+    app_name, app_entry = await run_io(resolve_app, app_name)
+
+    if system_platform == "macOS":
+        app_path = app_entry.path if app_entry else f"/Applications/{app_name}.app"
+        if not await run_io(os.path.exists, app_path):
+            return f'Application {app_name} not found in /Applications'
+        await run_subprocess("open", app_path, check=False)
+        return f'{app_name}已经打开了'
+
+    elif system_platform == "Windows":
+        try:
+            # start 是 cmd 的内置命令
+            await run_subprocess("cmd", "/c", "start", "", app_entry.path if app_entry else app_name, check=False)
+            return f'{app_name}已经打开了'
+        except Exception as e:
+            return f'Failed to open {app_name}: {e}'
+
+    else:
+        return 'Unsupported platform'
+
+
+@async_impl(open_calc)
+async def aopen_calc():
+    system_platform = get_os_type()
+    command = {'macOS': ['open', '-a', 'Calculator'], 'Windows': ['calc.exe']}.get(system_platform)
+    if command:
+        try:
+            # 和同步版本一样只启动进程，不等待退出
+            await asyncio.create_subprocess_exec(*command)
+            return '计算器已打开'
+        except FileNotFoundError:
+            return '无法找到计算器程序'
+
+
 if __name__ == '__main__':
     print(open_application.name)
     result = open_application.invoke('vscode')
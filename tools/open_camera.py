@@ -2,6 +2,7 @@ from langchain.pydantic_v1 import BaseModel, Field
 from langchain.tools import tool
 from typing import Callable
 import cv2
+from utils.async_utils import async_impl, run_io
 
 
 # class CameraCallback(BaseModel):
@@ -34,3 +35,9 @@ def open_camera() -> str:
     cap.release()
     cv2.destroyAllWindows()
     return '摄像头已经关闭了'
+
+
+@async_impl(open_camera)
+async def aopen_camera() -> str:
+    # 摄像头画面循环会一直阻塞到用户退出，在线程中执行
+    return await run_io(open_camera.func)
@@ -1,13 +1,15 @@
 """将桌面最近未使用的文件放在一个temp的文件夹"""
 from langchain.pydantic_v1 import BaseModel, Field
 from langchain.tools import tool
-from typing import Literal, List
+from typing import Literal, List, Iterable, Dict, Any
 from utils.utils import get_os_type
+from utils.async_utils import async_impl, run_io
+from tools.file_scanner import ScanEntry, scan_unused, build_plan
+from tools.file_index import get_file_index
+from tools.move_engine import get_move_engine
 import os
-import time
-import shutil
+import json
 
-ONE_DAY = 24 * 60 * 60
 allowed_extensions = {
     # 文档文件
     '.txt', '.docx', '.md', '.xlsx', '.pdf', '.pptx',
@@ -20,6 +22,8 @@ allowed_extensions = {
 
 class RecentDays(BaseModel):
     days: int = Field(description='Number of days (Recent unused days).')
+    dry_run: bool = Field(default=False, description='Only list the files and folders that would be moved, '
+                                                     'without moving anything.')
 
 
 def get_desktop_path(system_type: Literal['Windows', 'macOS']) -> str:
@@ -32,47 +36,19 @@ def get_desktop_path(system_type: Literal['Windows', 'macOS']) -> str:
         raise EnvironmentError(f"该系统 {system_type} 暂不支持")
 
 
-def get_unused_files_and_folders(desktop_path: str, days: int = 10) -> List[str]:
+def find_unused_entries(desktop_path: str, days: int = 10, exclude: Iterable[str] = ()) -> List[ScanEntry]:
+    """获取指定天数内未使用的文件和文件夹（修改时间 mtime 更新的时机是文件内容发生了变更）"""
+    file_index = get_file_index()
+    if file_index is not None:
+        # 从持久化索引中查询，目录没有变化时不需要重新扫描
+        return file_index.unused(desktop_path, days, extensions=allowed_extensions, exclude=exclude)
+    # scandir 每个条目只 stat 一次
+    return list(scan_unused(desktop_path, days, extensions=allowed_extensions, exclude=exclude))
+
+
+def get_unused_files_and_folders(desktop_path: str, days: int = 10, exclude: Iterable[str] = ()) -> List[str]:
     """获取指定天数内未使用的文件和文件夹"""
-    unused_items = []
-    cutoff_time = time.time() - days * ONE_DAY
-
-    # 获取指定目录下的文件以及文件夹
-    for item in os.listdir(desktop_path):
-        item_path = os.path.join(desktop_path, item)
-
-        # 处理文件
-        if os.path.isfile(item_path):
-            file_extension = os.path.splitext(item)[-1].lower()  # 获取文件扩展名并转为小写
-            if file_extension in allowed_extensions:
-                if not os.path.exists(item_path):  # 确保路径存在
-                    continue
-                # 指定文件或目录的最后访问时间 单位s
-                # last_access_time = os.path.getatime(item_path)
-                # 修改时间 (getmtime) 更新的时机是文件内容发生了变更
-                last_modify_time = os.path.getmtime(item_path)
-                date = time.localtime(last_modify_time)
-                format_date = time.strftime('%Y-%m-%d %H:%M:%S', date)
-                print(format_date, item_path)
-
-                if last_modify_time < cutoff_time:
-                    unused_items.append(item_path)
-        # 处理文件夹
-        if os.path.isdir(item_path):
-            if not os.path.exists(item_path):  # 确保路径存在
-                continue
-            # 指定文件或目录的最后访问时间 单位s
-            # last_access_time = os.path.getatime(item_path)
-            # 修改时间 (getmtime) 更新的时机是文件内容发生了变更
-            last_modify_time = os.path.getmtime(item_path)
-            date = time.localtime(last_modify_time)
-            format_date = time.strftime('%Y-%m-%d %H:%M:%S', date)
-            print(format_date, item_path)
-
-            if last_modify_time < cutoff_time:
-                unused_items.append(item_path)
-
-    return unused_items
+    return [entry.path for entry in find_unused_entries(desktop_path, days, exclude)]
 
 
 def create_temp_folder(desktop_path: str) -> str:
@@ -83,22 +59,27 @@ def create_temp_folder(desktop_path: str) -> str:
     return temp_folder_path
 
 
-def move_items_to_temp(unused_items: List[str], temp_folder_path: str):
-    """将未使用的文件和文件夹移动到 temp 文件夹"""
-    for item in unused_items:
-        item_name = os.path.basename(item)
-        destination = os.path.join(temp_folder_path, item_name)
-        if os.path.exists(destination):
-            continue  # 跳过已经存在的文件或文件夹
+def move_items_to_temp(unused_items: List[str], temp_folder_path: str) -> Dict[str, Any]:
+    """
+    将未使用的文件和文件夹移动到 temp 文件夹
+    同名条目加后缀后移动；单个条目失败不影响其他条目，返回移动报告（包含可用于撤销的 batch_id）
+    """
+    return get_move_engine().move_batch(unused_items, temp_folder_path)
 
-        try:
-            shutil.move(item, destination)
-        except PermissionError:
-            raise PermissionError
+
+def format_move_report(report: Dict[str, Any], days: int, temp_folder_path: str) -> str:
+    message = f'已将最近 {days} 天未使用的 {report["moved"]} 个文件和文件夹移动到 {temp_folder_path}'
+    if report['renamed']:
+        renamed = '、'.join(f'{os.path.basename(src)} -> {os.path.basename(dst)}' for src, dst in report['renamed'])
+        message += f'；目标已存在，重命名：{renamed}'
+    if report['failed']:
+        failed = '；'.join(f'{src}：{error}' for src, error in report['failed'])
+        message += f'；{len(report["failed"])} 个移动失败：{failed}'
+    return message + f'（批次 {report["batch_id"]}）'
 
 
 @tool('organize-files', args_schema=RecentDays)
-def organize_files(days: int):
+def organize_files(days: int, dry_run: bool = False):
     """
     Place the files and folders on the desktop that have not been used in the last few days in a temp folder
     (Organize desktop files and folders into temp folders according to the number of days they have not been used).
@@ -107,14 +88,19 @@ def organize_files(days: int):
     os_type = get_os_type()
     try:
         desktop_path = get_desktop_path(os_type)
-        unused_items = get_unused_files_and_folders(desktop_path, days=days)
+        temp_folder_path = os.path.join(desktop_path, "temp")
+        # temp 文件夹本身不参与整理
+        if dry_run:
+            entries = find_unused_entries(desktop_path, days, exclude=[temp_folder_path])
+            return json.dumps(build_plan(entries, temp_folder_path), ensure_ascii=False)
 
+        unused_items = get_unused_files_and_folders(desktop_path, days=days, exclude=[temp_folder_path])
         if not unused_items:
             return f"没有最近 {days} 天未使用的文件或文件夹"
 
         temp_folder_path = create_temp_folder(desktop_path)
-        move_items_to_temp(unused_items, temp_folder_path)
-        return f'已将最近 {days} 天未使用的文件和文件夹移动到 {temp_folder_path}'
+        report = move_items_to_temp(unused_items, temp_folder_path)
+        return format_move_report(report, days, temp_folder_path)
 
     except PermissionError as e:
         return f'没有权限访问文件或目录：{e}'
@@ -122,6 +108,12 @@ def organize_files(days: int):
         return e
 
 
+@async_impl(organize_files)
+async def aorganize_files(days: int, dry_run: bool = False):
+    # 扫描和移动都是文件 I/O，在 I/O 线程池中执行
+    return await run_io(organize_files.func, days, dry_run)
+
+
 if __name__ == '__main__':
     print(organize_files.name)
     # 最近3天
@@ -1,6 +1,7 @@
 import os
 import re
 import platform
+from functools import lru_cache
 from typing import Optional, Type
 
 from langchain.pydantic_v1 import BaseModel, Field
@@ -9,13 +10,19 @@ from langchain.callbacks.manager import (
     AsyncCallbackManagerForToolRun,
     CallbackManagerForToolRun,
 )
-from utils import write_docx
+from utils.docx_renderer import write_docx_from_file
+from utils.async_utils import run_io
+from tools.document_sink import DocumentSink, document_writer, iter_chunks
 
 # write file suffix
 file_suffix = ['.txt', '.md', '.docx']
 
+# 超过该长度（字符）的内容在后台写入，工具立即返回句柄
+STREAM_THRESHOLD = int(os.environ.get('WRITE_STREAM_THRESHOLD', 64 * 1024))
 
-# 创建一个桌面文件夹
+
+# 创建一个桌面文件夹（结果缓存，不再每次写入都判断系统类型和目录是否存在；目录被删除时由 DocumentSink 重新创建）
+@lru_cache(maxsize=None)
 def create_folder_on_desktop(folder_name: Optional[str] = None) -> str:
     if not folder_name:
         folder_name = 'workspace'
@@ -70,31 +77,33 @@ class WriteFilesTool(BaseTool):
             return 'Unsupported operating system'
 
         match = re.search(r'\.([a-zA-Z0-9]+)$', filename)
-        if match:
-            suffix = match.group().lower()
-            if suffix in file_suffix:
-                if suffix == '.md' or suffix == '.txt':
-                    # 创建并写入内容到 .md 文件
-                    file_path = os.path.join(current_path, filename)
-                    with open(file_path, 'w', encoding='utf-8') as f:
-                        f.write(file_content)
-                elif suffix == '.docx':
-                    file_path = os.path.join(current_path, filename)
-                    write_docx(file_path, file_content)
-                return 'File writing completed.'
-            else:
-                return f'The current file format is not supported.'
-        else:
+        if not match:
             return 'Not a valid file name.'
+        suffix = match.group().lower()
+        if suffix not in file_suffix:
+            return f'The current file format is not supported.'
+
+        file_path = os.path.join(current_path, filename)
+        # .md / .txt 直接写入；.docx 先写入临时文本文件，提交时再渲染
+        finalize = write_docx_from_file if suffix == '.docx' else None
+
+        if len(file_content) <= STREAM_THRESHOLD:
+            with DocumentSink(file_path, finalize) as sink:
+                sink.write(file_content)
+            return 'File writing completed.'
+
+        # 工具调用在这里就结束了，之后不能再通过 run_manager 回调；写入进度和结果通过句柄查询（/v1/documents/{id}）
+        handle = document_writer.start(
+            file_path, iter_chunks(file_content), total=len(file_content), finalize=finalize
+        )
+        return f'File writing started (handle {handle.id}), the file will be saved to {file_path}.'
 
     async def _arun(
-        self,
-        a: int,
-        b: int,
-        run_manager: Optional[AsyncCallbackManagerForToolRun] = None,
+        self, filename: str, file_content: str, run_manager: Optional[AsyncCallbackManagerForToolRun] = None
     ) -> str:
         """Use the tool asynchronously."""
-        raise NotImplementedError("Calculator does not support async")
+        # 文件写入（包括 docx 渲染）在 I/O 线程池中执行
+        return await run_io(self._run, filename, file_content)
 
 
 if __name__ == '__main__':
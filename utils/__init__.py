@@ -1,4 +1,5 @@
-__all__ = ['get_os_type', 'transform_messages_type', 'write_docx', 'ChatMessage', 'BasicMatcher']
+__all__ = ['get_os_type', 'transform_messages_type', 'write_docx', 'ChatMessage', 'BasicMatcher', 'get_matcher', 'StreamChannel']
 
 from utils.utils import *
-from utils.pattern_app_name import BasicMatcher
+from utils.pattern_app_name import BasicMatcher, get_matcher
+from utils.stream_channel import StreamChannel
@@ -0,0 +1,94 @@
+"""agent 执行线程池：同步的 agent 调用不再阻塞事件循环，并按模型限制并发"""
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Optional
+
+
+class PoolSaturatedError(Exception):
+    """模型并发名额已满，且排队超时"""
+
+
+class AgentSlot:
+    """占用的一个模型并发名额，release 可以重复调用"""
+
+    def __init__(self, semaphore: asyncio.Semaphore, on_release: Optional[Callable[[], None]] = None):
+        self._semaphore = semaphore
+        self._on_release = on_release
+        self._released = False
+
+    def release(self) -> None:
+        if not self._released:
+            self._released = True
+            self._semaphore.release()
+            if self._on_release is not None:
+                self._on_release()
+
+
+class AgentWorkerPool:
+    """
+    agent 工作线程池
+    :param max_workers: 执行同步 agent 调用的线程数
+    :param model_concurrency: 每个模型默认的并发上限
+    :param queue_timeout: 名额已满时的排队超时时间（秒），<=0 表示不排队直接拒绝
+    :param model_limits: 单独指定某些模型的并发上限 {"glm-4": 4}
+    """
+
+    def __init__(
+            self,
+            max_workers: int = 8,
+            model_concurrency: int = 4,
+            queue_timeout: float = 30.0,
+            model_limits: Optional[Dict[str, int]] = None
+    ):
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='agent-worker')
+        self.model_concurrency = model_concurrency
+        self.queue_timeout = queue_timeout
+        self.model_limits = model_limits or {}
+        # 只保留正在使用（占用或排队）的模型信号量，模型名来自请求，不能无限增长
+        self._semaphores: Dict[str, asyncio.Semaphore] = {}
+        self._users: Dict[str, int] = {}
+
+    def _checkout(self, model: str) -> asyncio.Semaphore:
+        if model not in self._semaphores:
+            limit = self.model_limits.get(model, self.model_concurrency)
+            self._semaphores[model] = asyncio.Semaphore(limit)
+        self._users[model] = self._users.get(model, 0) + 1
+        return self._semaphores[model]
+
+    def _checkin(self, model: str) -> None:
+        self._users[model] -= 1
+        if self._users[model] == 0:
+            del self._users[model]
+            del self._semaphores[model]
+
+    async def acquire(self, model: str) -> AgentSlot:
+        """获取模型并发名额，排队超时抛出 PoolSaturatedError"""
+        semaphore = self._checkout(model)
+        try:
+            if self.queue_timeout <= 0:
+                if semaphore.locked():
+                    raise PoolSaturatedError(f'模型 {model} 的并发请求已满')
+                await semaphore.acquire()
+            else:
+                try:
+                    await asyncio.wait_for(semaphore.acquire(), timeout=self.queue_timeout)
+                except asyncio.TimeoutError:
+                    raise PoolSaturatedError(f'模型 {model} 的并发请求已满，排队超过 {self.queue_timeout}s')
+        except BaseException:
+            self._checkin(model)
+            raise
+        return AgentSlot(semaphore, functools.partial(self._checkin, model))
+
+    async def run_in_worker(self, func: Callable, *args, **kwargs):
+        """在工作线程中执行同步函数（调用方自行管理并发名额）"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, functools.partial(func, *args, **kwargs))
+
+    async def run(self, model: str, func: Callable, *args, **kwargs):
+        """占用一个模型并发名额，在工作线程中执行同步函数"""
+        slot = await self.acquire(model)
+        try:
+            return await self.run_in_worker(func, *args, **kwargs)
+        finally:
+            slot.release()
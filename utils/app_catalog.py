@@ -0,0 +1,303 @@
+"""已安装应用目录：扫描一次安装位置，建立名称/别名索引，支持模糊查找"""
+import os
+import re
+import json
+import time
+import platform
+import threading
+from typing import Dict, List, Optional, NamedTuple, Tuple, Set
+
+
+class AppEntry(NamedTuple):
+    name: str
+    path: str
+    aliases: Tuple[str, ...] = ()
+
+
+def default_roots() -> Dict[str, str]:
+    """当前系统的应用安装位置 {目录: 应用文件后缀}"""
+    home = os.path.expanduser('~')
+    os_type = platform.system()
+    if os_type == 'Darwin':
+        return {
+            '/Applications': '.app',
+            '/System/Applications': '.app',
+            os.path.join(home, 'Applications'): '.app'
+        }
+    if os_type == 'Windows':
+        program_data = os.environ.get('PROGRAMDATA', r'C:\ProgramData')
+        app_data = os.environ.get('APPDATA', os.path.join(home, 'AppData', 'Roaming'))
+        return {
+            os.path.join(program_data, 'Microsoft', 'Windows', 'Start Menu', 'Programs'): '.lnk',
+            os.path.join(app_data, 'Microsoft', 'Windows', 'Start Menu', 'Programs'): '.lnk'
+        }
+    return {
+        '/usr/share/applications': '.desktop',
+        '/usr/local/share/applications': '.desktop',
+        '/var/lib/flatpak/exports/share/applications': '.desktop',
+        os.path.join(home, '.local', 'share', 'applications'): '.desktop'
+    }
+
+
+def normalize_name(name: str) -> str:
+    """统一大小写，去掉空格和分隔符：Visual Studio Code -> visualstudiocode"""
+    return re.sub(r'[\s\-_.·]+', '', name.lower())
+
+
+def trigrams(name: str) -> Set[str]:
+    padded = f'  {name} '
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def parse_desktop_file(path: str) -> Optional[AppEntry]:
+    """解析 freedesktop .desktop 文件，隐藏的或非应用类型的返回 None"""
+    fields: Dict[str, str] = {}
+    in_entry = False
+    try:
+        with open(path, encoding='utf-8', errors='ignore') as f:
+            for line in f:
+                line = line.strip()
+                if line.startswith('['):
+                    in_entry = line == '[Desktop Entry]'
+                    continue
+                if in_entry and '=' in line:
+                    key, value = line.split('=', 1)
+                    fields.setdefault(key.strip(), value.strip())
+    except OSError:
+        return None
+
+    if fields.get('Type', 'Application') != 'Application' or fields.get('NoDisplay') == 'true' \
+            or fields.get('Hidden') == 'true' or 'Name' not in fields:
+        return None
+
+    aliases = [value for key, value in fields.items() if key.startswith('Name[') or key == 'GenericName']
+    command = fields.get('Exec', '').split()
+    if command:
+        aliases.append(os.path.basename(command[0]))
+    aliases.append(os.path.splitext(os.path.basename(path))[0])
+    return AppEntry(fields['Name'], path, tuple(dict.fromkeys(alias for alias in aliases if alias)))
+
+
+class AppCatalog:
+    """
+    应用目录索引
+    每个目录记录上次扫描时的 mtime，刷新时只重新扫描 mtime 变化的目录；
+    索引保存在磁盘上，进程重启后直接加载
+    :param roots: {目录: 应用文件后缀}，默认使用当前系统的安装位置
+    :param index_path: 索引文件路径，为空时不落盘
+    :param refresh_interval: 查找时距离上次刷新超过该时间(s)则检查目录是否变化
+    """
+    INDEX_VERSION = 1
+
+    def __init__(
+            self,
+            roots: Optional[Dict[str, str]] = None,
+            index_path: Optional[str] = None,
+            refresh_interval: float = 30
+    ):
+        self.roots = roots if roots is not None else default_roots()
+        self.index_path = index_path
+        self.refresh_interval = refresh_interval
+        self._lock = threading.RLock()
+        self._dir_mtimes: Dict[str, float] = {}
+        self._dir_entries: Dict[str, List[AppEntry]] = {}
+        self._dir_subdirs: Dict[str, List[str]] = {}
+        self._entries: List[AppEntry] = []
+        self._exact: Dict[str, int] = {}
+        self._trigram_index: Dict[str, Set[int]] = {}
+        self._last_refresh = 0.0
+        self._load()
+
+    def _load(self) -> None:
+        if not self.index_path or not os.path.exists(self.index_path):
+            return
+        try:
+            with open(self.index_path, encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+        if data.get('version') != self.INDEX_VERSION:
+            return
+        self._dir_mtimes = data['dirs']
+        self._dir_subdirs = data['subdirs']
+        self._dir_entries = {
+            directory: [AppEntry(name, path, tuple(aliases)) for name, path, aliases in entries]
+            for directory, entries in data['entries'].items()
+        }
+        self._rebuild()
+
+    def _save(self) -> None:
+        if not self.index_path:
+            return
+        os.makedirs(os.path.dirname(os.path.abspath(self.index_path)), exist_ok=True)
+        data = {
+            'version': self.INDEX_VERSION,
+            'dirs': self._dir_mtimes,
+            'subdirs': self._dir_subdirs,
+            'entries': {directory: [list(entry) for entry in entries]
+                        for directory, entries in self._dir_entries.items()}
+        }
+        temp_path = f'{self.index_path}.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(temp_path, self.index_path)
+
+    def _scan_dir(self, directory: str, suffix: str, seen: Set[str], visited: Set[Tuple[int, int]]) -> bool:
+        """
+        检查目录及其子目录，只重新扫描 mtime 变化的目录，返回是否有变化
+        :param visited: 本次刷新已经检查过的目录 (st_dev, st_ino)，符号链接形成环或者多个链接指向同一目录时只检查一次
+        """
+        try:
+            stat = os.stat(directory)
+        except OSError:
+            return False
+        if (stat.st_dev, stat.st_ino) in visited:
+            return False
+        visited.add((stat.st_dev, stat.st_ino))
+        mtime = stat.st_mtime
+        seen.add(directory)
+
+        changed = False
+        if self._dir_mtimes.get(directory) != mtime:
+            entries, subdirs = [], []
+            with os.scandir(directory) as it:
+                for dir_entry in it:
+                    if dir_entry.name.lower().endswith(suffix):
+                        if suffix == '.desktop':
+                            app_entry = parse_desktop_file(dir_entry.path)
+                        else:
+                            app_entry = AppEntry(dir_entry.name[:-len(suffix)], dir_entry.path)
+                        if app_entry:
+                            entries.append(app_entry)
+                    elif dir_entry.is_dir():
+                        # 子目录单独记录 mtime（.app 应用包本身是目录，不进入）
+                        subdirs.append(dir_entry.path)
+            self._dir_entries[directory] = entries
+            self._dir_subdirs[directory] = subdirs
+            self._dir_mtimes[directory] = mtime
+            changed = True
+
+        for subdir in self._dir_subdirs.get(directory, []):
+            changed = self._scan_dir(subdir, suffix, seen, visited) or changed
+        return changed
+
+    def refresh(self, force: bool = False) -> bool:
+        """增量刷新索引，返回是否有变化"""
+        with self._lock:
+            if force:
+                self._dir_mtimes.clear()
+            seen: Set[str] = set()
+            visited: Set[Tuple[int, int]] = set()
+            changed = False
+            for root, suffix in self.roots.items():
+                changed = self._scan_dir(root, suffix, seen, visited) or changed
+            # 已经删除的目录
+            for directory in list(self._dir_mtimes):
+                if directory not in seen:
+                    del self._dir_mtimes[directory]
+                    self._dir_entries.pop(directory, None)
+                    self._dir_subdirs.pop(directory, None)
+                    changed = True
+            self._last_refresh = time.time()
+            if changed:
+                self._rebuild()
+                self._save()
+            return changed
+
+    def _rebuild(self) -> None:
+        self._entries = [entry for entries in self._dir_entries.values() for entry in entries]
+        self._exact = {}
+        self._trigram_index = {}
+        for index, entry in enumerate(self._entries):
+            for name in (entry.name, *entry.aliases):
+                normalized = normalize_name(name)
+                if not normalized:
+                    continue
+                self._exact.setdefault(normalized, index)
+                for trigram in trigrams(normalized):
+                    self._trigram_index.setdefault(trigram, set()).add(index)
+
+    def _ensure_fresh(self) -> None:
+        if time.time() - self._last_refresh > self.refresh_interval:
+            self.refresh()
+
+    def lookup(self, app_name: str, min_score: float = 0.45, exact: bool = False) -> Optional[AppEntry]:
+        """
+        按名称查找应用：先精确匹配名称和别名，再按 trigram 相似度模糊匹配
+        :param exact: 只接受精确匹配（不经过大模型确认直接打开应用时使用）
+        """
+        with self._lock:
+            self._ensure_fresh()
+            normalized = normalize_name(app_name)
+            if not normalized:
+                return None
+            if normalized in self._exact:
+                return self._entries[self._exact[normalized]]
+            if exact:
+                return None
+            matches = self.search(app_name, limit=1)
+            if matches and matches[0][1] >= min_score:
+                return matches[0][0]
+            return None
+
+    def search(self, app_name: str, limit: int = 5) -> List[Tuple[AppEntry, float]]:
+        """按 trigram 相似度（Jaccard）返回最相近的应用"""
+        with self._lock:
+            query_trigrams = trigrams(normalize_name(app_name))
+            shared: Dict[int, int] = {}
+            for trigram in query_trigrams:
+                for index in self._trigram_index.get(trigram, ()):
+                    shared[index] = shared.get(index, 0) + 1
+
+            scored = []
+            for index, count in shared.items():
+                entry = self._entries[index]
+                best = max(
+                    count / len(query_trigrams | trigrams(normalize_name(name)))
+                    for name in (entry.name, *entry.aliases)
+                )
+                scored.append((entry, round(best, 4)))
+            scored.sort(key=lambda item: item[1], reverse=True)
+            return scored[:limit]
+
+    def __len__(self):
+        return len(self._entries)
+
+
+_catalog: Optional[AppCatalog] = None
+_catalog_lock = threading.Lock()
+
+
+def get_app_catalog() -> AppCatalog:
+    """进程内共享的应用目录"""
+    global _catalog
+    with _catalog_lock:
+        if _catalog is None:
+            index_path = os.environ.get(
+                'APP_CATALOG_PATH',
+                os.path.join(os.path.expanduser('~'), '.united-agent', 'app_catalog.json')
+            )
+            _catalog = AppCatalog(index_path=index_path)
+        return _catalog
+
+
+if __name__ == '__main__':
+    import tempfile
+
+    # 在临时目录中构造应用目录，验证扫描、增量刷新和查找
+    with tempfile.TemporaryDirectory() as root:
+        apps = os.path.join(root, 'applications')
+        os.makedirs(os.path.join(apps, 'sub'))
+        with open(os.path.join(apps, 'code.desktop'), 'w', encoding='utf-8') as f:
+            f.write('[Desktop Entry]\nType=Application\nName=Visual Studio Code\nExec=/usr/bin/code %F\n')
+        with open(os.path.join(apps, 'sub', 'qqmusic.desktop'), 'w', encoding='utf-8') as f:
+            f.write('[Desktop Entry]\nType=Application\nName=QQMusic\nName[zh_CN]=QQ音乐\nExec=qqmusic %U\n')
+
+        catalog = AppCatalog(roots={apps: '.desktop'}, index_path=os.path.join(root, 'index.json'))
+        print('first scan changed:', catalog.refresh(), 'apps:', len(catalog))
+        print('second scan changed:', catalog.refresh())
+        for name in ['vscode', 'Visual Studio Code', 'code', 'QQ音乐', 'qq music', 'unknown app']:
+            start = time.perf_counter()
+            entry = catalog.lookup(name)
+            print(f'{name!r:22} -> {entry.name if entry else None} ({(time.perf_counter() - start) * 1e6:.1f} us)')
+        print('reloaded from disk:', len(AppCatalog(roots={apps: '.desktop'}, index_path=os.path.join(root, 'index.json'))))
@@ -0,0 +1,108 @@
+"""工具异步实现的公共方法：独立的文件 I/O 线程池、异步子进程、为 @tool 函数挂载异步实现"""
+import os
+import asyncio
+import threading
+import functools
+import contextvars
+import weakref
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Any, Dict
+
+# 文件 I/O 专用线程池，不占用事件循环默认线程池
+io_executor = ThreadPoolExecutor(
+    max_workers=int(os.environ.get('IO_MAX_WORKERS', 8)),
+    thread_name_prefix='agent-io'
+)
+# 等待 threading 锁的专用线程池：锁的持有者会通过 run_io 使用 io_executor，等待者不能占用同一个线程池
+_lock_wait_executor = ThreadPoolExecutor(
+    max_workers=int(os.environ.get('LOCK_WAIT_WORKERS', 16)),
+    thread_name_prefix='agent-lock-wait'
+)
+# 同一事件循环中等待同一把锁的协程先在 asyncio.Lock 上排队，每把锁在每个事件循环中最多占用一个等待线程
+_wait_gates: 'weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[int, asyncio.Lock]]' = weakref.WeakKeyDictionary()
+_wait_gates_lock = threading.Lock()
+
+
+async def run_io(func: Callable, *args, **kwargs) -> Any:
+    """在 I/O 线程池中执行阻塞调用（保留当前上下文变量）"""
+    context = contextvars.copy_context()
+    call = functools.partial(context.run, func, *args, **kwargs)
+    return await asyncio.get_running_loop().run_in_executor(io_executor, call)
+
+
+# 设备后端调用系统命令/设备文件时可能出现的异常（命令失败、命令不存在、没有权限等）
+BACKEND_ERRORS = (subprocess.SubprocessError, OSError)
+
+
+def describe_backend_error(action: str, error: BaseException) -> str:
+    """把后端异常转换为返回给模型的错误说明（区分命令失败、没有权限、找不到命令）"""
+    if isinstance(error, subprocess.CalledProcessError):
+        stderr = error.stderr.decode('utf-8', errors='ignore') if isinstance(error.stderr, bytes) else error.stderr
+        detail = (stderr or '').strip().splitlines()
+        command = error.cmd[0] if isinstance(error.cmd, (list, tuple)) else error.cmd
+        return f'{action}失败: 命令 {command} 退出码 {error.returncode}' + (f'，{detail[0]}' if detail else '')
+    if isinstance(error, PermissionError):
+        return f'{action}失败: 没有权限（{error.filename or error}）'
+    if isinstance(error, FileNotFoundError):
+        return f'{action}失败: 找不到命令或设备（{error.filename or error}）'
+    return f'{action}失败: {error}'
+
+
+async def run_subprocess(*command: str, check: bool = True) -> str:
+    """异步执行命令并返回标准输出，check 为 True 时命令失败抛出 CalledProcessError"""
+    process = await asyncio.create_subprocess_exec(
+        *command,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE
+    )
+    try:
+        stdout, stderr = await process.communicate()
+    except asyncio.CancelledError:
+        if process.returncode is None:
+            process.kill()
+        raise
+    if check and process.returncode:
+        raise subprocess.CalledProcessError(process.returncode, command, stdout, stderr)
+    return stdout.decode('utf-8', errors='ignore')
+
+
+def _wait_gate(loop: asyncio.AbstractEventLoop, lock: threading.Lock) -> asyncio.Lock:
+    with _wait_gates_lock:
+        gates = _wait_gates.setdefault(loop, {})
+        gate = gates.get(id(lock))
+        if gate is None:
+            gate = gates[id(lock)] = asyncio.Lock()
+        return gate
+
+
+async def acquire_lock(lock: threading.Lock) -> None:
+    """
+    等待 threading 锁，不阻塞事件循环（锁同时被同步路径的工作线程使用，不能换成 asyncio.Lock）
+    同一事件循环中的等待者先在 asyncio.Lock 上排队，只有队首在专用线程池中阻塞等待
+    """
+    if lock.acquire(blocking=False):
+        return
+    loop = asyncio.get_running_loop()
+    async with _wait_gate(loop, lock):
+        if lock.acquire(blocking=False):
+            return
+        future = loop.run_in_executor(_lock_wait_executor, lock.acquire)
+        try:
+            await asyncio.shield(future)
+        except asyncio.CancelledError:
+            # 取消后线程仍然会拿到锁，拿到后立即释放
+            future.add_done_callback(lambda _: lock.release())
+            raise
+
+
+def async_impl(sync_tool):
+    """
+    为 @tool 生成的 StructuredTool 挂载异步实现
+    @async_impl(set_volume)
+    async def aset_volume(volume_level: int) -> str: ...
+    """
+    def decorator(coroutine):
+        sync_tool.coroutine = coroutine
+        return coroutine
+    return decorator
@@ -0,0 +1,193 @@
+"""
+客户端断开后取消正在执行的 agent
+每次运行创建一个 CancelToken：客户端断开时设置取消，agent 在下一次调用模型/工具之前、流式输出的下一个 token 时停止；
+统计被取消的运行数，并按同一模型正常完成时的平均输出估算节省的 token 数
+"""
+import os
+import asyncio
+import threading
+import contextvars
+from typing import Optional, Callable, List, Dict, Any
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+from utils.history_manager import heuristic_count
+
+# 非流式请求检查客户端是否断开的间隔(s)
+DISCONNECT_POLL_INTERVAL = float(os.environ.get('DISCONNECT_POLL_INTERVAL', 0.25))
+
+
+class RunCancelled(Exception):
+    """运行已经被取消（客户端断开）"""
+
+
+class CancelToken:
+    """单次运行的取消标记，可以在任意线程中设置和检查"""
+
+    def __init__(self):
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+        self._callbacks: List[Callable[[], None]] = []
+        self.reason: Optional[str] = None
+        self.output_tokens = 0
+
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set()
+
+    def cancel(self, reason: str = 'cancelled') -> None:
+        """设置取消并执行注册的回调（只执行一次）"""
+        with self._lock:
+            if self._event.is_set():
+                return
+            self.reason = reason
+            self._event.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception:
+                pass
+
+    def on_cancel(self, callback: Callable[[], None]) -> Callable[[], None]:
+        """注册取消时的回调（已经取消时立即执行），返回注销函数"""
+        with self._lock:
+            if not self._event.is_set():
+                self._callbacks.append(callback)
+                return lambda: self._remove(callback)
+        callback()
+        return lambda: None
+
+    def _remove(self, callback: Callable[[], None]) -> None:
+        with self._lock:
+            if callback in self._callbacks:
+                self._callbacks.remove(callback)
+
+    def raise_if_cancelled(self) -> None:
+        if self._event.is_set():
+            raise RunCancelled(self.reason)
+
+    def add_tokens(self, count: int) -> None:
+        with self._lock:
+            self.output_tokens += count
+
+
+# 当前运行的取消标记（agent 执行器在每一步之前检查）
+_current_token: contextvars.ContextVar[Optional[CancelToken]] = contextvars.ContextVar('cancel_token', default=None)
+
+
+def current_cancel_token() -> Optional[CancelToken]:
+    return _current_token.get()
+
+
+def set_cancel_token(token: Optional[CancelToken]) -> contextvars.Token:
+    return _current_token.set(token)
+
+
+def reset_cancel_token(context_token: contextvars.Token) -> None:
+    _current_token.reset(context_token)
+
+
+class CancellationHandler(BaseCallbackHandler):
+    """
+    langchain 回调：调用模型和工具之前、每个流式 token 到达时检查取消（抛出异常中断 agent，流式 HTTP 响应随之关闭），
+    同时记录已经输出的 token 数
+    """
+    raise_error = True
+
+    def __init__(self, token: CancelToken):
+        self.token = token
+        self._streamed = set()
+
+    def on_llm_start(self, serialized, prompts, **kwargs) -> None:
+        self.token.raise_if_cancelled()
+
+    def on_chat_model_start(self, serialized, messages, **kwargs) -> None:
+        self.token.raise_if_cancelled()
+
+    def on_tool_start(self, serialized, input_str, **kwargs) -> None:
+        self.token.raise_if_cancelled()
+
+    def on_llm_new_token(self, token: str, *, run_id=None, **kwargs) -> None:
+        self._streamed.add(run_id)
+        self.token.add_tokens(1)
+        self.token.raise_if_cancelled()
+
+    def on_llm_end(self, response, *, run_id=None, **kwargs) -> None:
+        if run_id in self._streamed:
+            self._streamed.discard(run_id)
+            return
+        # 非流式调用：优先使用接口返回的用量，没有时按文本估算
+        usage = (response.llm_output or {}).get('token_usage') or {}
+        count = usage.get('completion_tokens')
+        if count is None:
+            count = sum(heuristic_count(generation.text) for generations in response.generations
+                        for generation in generations)
+        self.token.add_tokens(count)
+
+
+class CancellationStats:
+    """取消统计：被取消的运行数，以及按模型平均输出估算的节省 token 数"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # model -> [完成的运行数, 输出 token 总数]
+        self._completed: Dict[str, List[int]] = {}
+        self.cancelled = 0
+        self.tokens_before_cancel = 0
+        self.estimated_tokens_saved = 0
+
+    def expected_tokens(self, model: Optional[str]) -> int:
+        """该模型一次完整运行的平均输出 token 数（没有记录时使用所有模型的平均值）"""
+        with self._lock:
+            runs, tokens = self._completed.get(model, (0, 0))
+            if not runs:
+                runs = sum(item[0] for item in self._completed.values())
+                tokens = sum(item[1] for item in self._completed.values())
+        return tokens // runs if runs else 0
+
+    def record_completed(self, model: Optional[str], token: CancelToken) -> None:
+        # 规则路由、缓存命中等没有调用模型的运行不计入平均值
+        if token.output_tokens <= 0:
+            return
+        with self._lock:
+            item = self._completed.setdefault(model, [0, 0])
+            item[0] += 1
+            item[1] += token.output_tokens
+
+    def record_cancelled(self, model: Optional[str], token: CancelToken) -> None:
+        saved = max(self.expected_tokens(model) - token.output_tokens, 0)
+        with self._lock:
+            self.cancelled += 1
+            self.tokens_before_cancel += token.output_tokens
+            self.estimated_tokens_saved += saved
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'cancelled_runs': self.cancelled,
+                'completed_runs': sum(item[0] for item in self._completed.values()),
+                'tokens_before_cancel': self.tokens_before_cancel,
+                'estimated_tokens_saved': self.estimated_tokens_saved
+            }
+
+
+cancellation_stats = CancellationStats()
+
+
+def cancel_task_on(token: CancelToken, task: asyncio.Future) -> Callable[[], None]:
+    """
+    取消标记被设置时（可能在工具执行线程中）取消 task，正在进行的异步模型请求随之中断，
+    不需要等到下一次回调检查；返回注销函数
+    """
+    loop = asyncio.get_running_loop()
+    return token.on_cancel(lambda: loop.call_soon_threadsafe(task.cancel))
+
+
+async def watch_disconnect(request, token: CancelToken, interval: float = DISCONNECT_POLL_INTERVAL) -> None:
+    """定期检查客户端是否断开（starlette Request.is_disconnected），断开时取消运行"""
+    while not token.cancelled:
+        if await request.is_disconnected():
+            token.cancel('client disconnected')
+            return
+        await asyncio.sleep(interval)
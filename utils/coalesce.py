@@ -0,0 +1,132 @@
+"""合并短时间内连续的写操作：同一个 key 在窗口期内的多次提交只执行最后一次"""
+import time
+import asyncio
+import threading
+from typing import Any, Callable, Dict, Hashable, List, Optional, Tuple, Awaitable
+
+from utils.async_utils import run_io, acquire_lock
+
+
+class _Batch:
+    __slots__ = ('value', 'done', 'result', 'error', 'size', 'waiters')
+
+    def __init__(self, value: Any):
+        self.value = value
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.size = 1
+        # 异步提交者 (事件循环, future)
+        self.waiters: List[Tuple[asyncio.AbstractEventLoop, asyncio.Future]] = []
+
+    def finish(self) -> None:
+        self.done.set()
+        for loop, future in self.waiters:
+            loop.call_soon_threadsafe(lambda f=future: f.done() or f.set_result(None))
+
+
+class Coalescer:
+    """
+    写操作合并器
+    窗口期内第一个提交者负责等待窗口结束后执行 apply(key, 最后提交的值)，
+    其余提交者只更新目标值并等待同一次执行的结果（异常同样传递给所有提交者）；
+    同步提交（submit）和异步提交（asubmit）可以混用
+    :param apply: 实际执行写操作的函数 apply(key, value)；
+        提交在锁外进行时后计算的值可能先提交，这种情况下 apply 应该在执行时读取最新的目标值
+    :param window: 合并窗口(s)，0 表示不等待
+    :param aapply: apply 的异步版本，为空时在 I/O 线程池中执行 apply
+    """
+
+    def __init__(
+            self,
+            apply: Callable[[Hashable, Any], Any],
+            window: float = 0.03,
+            aapply: Optional[Callable[[Hashable, Any], Awaitable[Any]]] = None
+    ):
+        self.apply = apply
+        self.aapply = aapply
+        self.window = window
+        self._pending: Dict[Hashable, _Batch] = {}
+        # 同一个 key 的写操作串行执行，保证后提交的值最后生效
+        self._apply_locks: Dict[Hashable, threading.Lock] = {}
+        self._lock = threading.Lock()
+        self.submitted = 0
+        self.applied = 0
+
+    def _join(self, key: Hashable, value: Any) -> Tuple[_Batch, Optional[threading.Lock]]:
+        """加入 key 当前的批次，成为第一个提交者时返回写锁"""
+        with self._lock:
+            self.submitted += 1
+            batch = self._pending.get(key)
+            if batch is None:
+                batch = self._pending[key] = _Batch(value)
+                return batch, self._apply_locks.setdefault(key, threading.Lock())
+            batch.value = value
+            batch.size += 1
+            return batch, None
+
+    def _close(self, key: Hashable) -> None:
+        with self._lock:
+            del self._pending[key]
+            self.applied += 1
+
+    @staticmethod
+    def _result(batch: _Batch) -> Any:
+        if batch.error is not None:
+            raise batch.error
+        return batch.result
+
+    def submit(self, key: Hashable, value: Any = None) -> Any:
+        batch, apply_lock = self._join(key, value)
+        if apply_lock is None:
+            batch.done.wait()
+            return self._result(batch)
+
+        if self.window > 0:
+            time.sleep(self.window)
+        # 先拿到写锁再结束本批次，之后新建的批次一定在本次写入之后执行
+        with apply_lock:
+            self._close(key)
+            try:
+                batch.result = self.apply(key, batch.value)
+            except Exception as e:
+                batch.error = e
+            finally:
+                batch.finish()
+        return self._result(batch)
+
+    async def _alead(self, key: Hashable, batch: _Batch, apply_lock: threading.Lock) -> None:
+        if self.window > 0:
+            await asyncio.sleep(self.window)
+        await acquire_lock(apply_lock)
+        try:
+            self._close(key)
+            if self.aapply is not None:
+                batch.result = await self.aapply(key, batch.value)
+            else:
+                batch.result = await run_io(self.apply, key, batch.value)
+        except Exception as e:
+            batch.error = e
+        finally:
+            apply_lock.release()
+            batch.finish()
+
+    async def asubmit(self, key: Hashable, value: Any = None) -> Any:
+        batch, apply_lock = self._join(key, value)
+        if apply_lock is not None:
+            # 写操作放在单独的任务中执行，提交者被取消时其他提交者仍然能拿到结果
+            await asyncio.shield(asyncio.ensure_future(self._alead(key, batch, apply_lock)))
+            return self._result(batch)
+
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        with self._lock:
+            batch.waiters.append((loop, future))
+        if batch.done.is_set():
+            return self._result(batch)
+        await future
+        return self._result(batch)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {'submitted': self.submitted, 'applied': self.applied}
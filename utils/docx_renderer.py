@@ -0,0 +1,338 @@
+"""
+markdown 渲染为 docx
+逐行单遍解析 markdown（标题、段落、列表、代码块、表格、引用），模板文件只从磁盘读取一次并缓存在内存中；
+较长的文档在独立的进程池中渲染，避免 CPU 密集的渲染占用服务进程的 GIL
+"""
+import io
+import os
+import re
+import threading
+import multiprocessing
+from functools import lru_cache
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import NamedTuple, Optional, List, Iterable, Iterator, Callable, Any
+
+# 超过该长度（字符）的文档在进程池中渲染
+PROCESS_THRESHOLD = int(os.environ.get('DOCX_PROCESS_THRESHOLD', 20_000))
+CODE_FONT = 'Courier New'
+
+_heading = re.compile(r'^(#{1,6})\s+(.*?)\s*#*\s*$')
+_list_item = re.compile(r'^(\s*)([-*+]|\d+[.)])\s+(.*)$')
+_rule = re.compile(r'^\s*([-*_])(\s*\1){2,}\s*$')
+_fence = re.compile(r'^\s*(```|~~~)\s*(\S*)')
+_table_separator = re.compile(r'^\s*\|?\s*:?-{3,}:?\s*(\|\s*:?-{3,}:?\s*)*\|?\s*$')
+_inline = re.compile(r'(\*\*(.+?)\*\*|__(.+?)__|\*(.+?)\*|`(.+?)`|\[(.+?)\]\((.+?)\))')
+
+
+class Block(NamedTuple):
+    kind: str  # heading / paragraph / bullet / number / code / table / quote / rule
+    text: str = ''
+    level: int = 0
+    rows: Optional[List[List[str]]] = None
+
+
+def _join(lines: List[str]) -> str:
+    """合并段落内的换行：中文之间直接拼接，其他情况加空格"""
+    text = lines[0]
+    for line in lines[1:]:
+        if text and line and ord(text[-1]) > 0x2e80 and ord(line[0]) > 0x2e80:
+            text += line
+        else:
+            text += ' ' + line
+    return text
+
+
+def _split_row(line: str) -> List[str]:
+    line = line.strip()
+    if line.startswith('|'):
+        line = line[1:]
+    if line.endswith('|'):
+        line = line[:-1]
+    return [cell.strip() for cell in line.split('|')]
+
+
+def parse_markdown(lines: Iterable[str]) -> Iterator[Block]:
+    """单遍解析 markdown，lines 可以是打开的文件（不需要把整个文档读入内存）"""
+    paragraph: List[str] = []
+    quote: List[str] = []
+    table: List[List[str]] = []
+    code: Optional[List[str]] = None
+    fence = ''
+
+    def flush() -> Iterator[Block]:
+        if paragraph:
+            yield Block('paragraph', _join(paragraph))
+            paragraph.clear()
+        if quote:
+            yield Block('quote', _join(quote))
+            quote.clear()
+        if table:
+            yield Block('table', rows=list(table))
+            table.clear()
+
+    for line in lines:
+        line = line.rstrip('\r\n')
+
+        if code is not None:
+            if line.strip().startswith(fence):
+                yield Block('code', '\n'.join(code))
+                code = None
+            else:
+                code.append(line)
+            continue
+
+        match = _fence.match(line)
+        if match:
+            yield from flush()
+            fence, code = match.group(1), []
+            continue
+
+        stripped = line.strip()
+        if not stripped:
+            yield from flush()
+            continue
+
+        if stripped.startswith('|'):
+            if paragraph or quote:
+                yield from flush()
+            if not _table_separator.match(stripped):
+                table.append(_split_row(stripped))
+            continue
+        if table:
+            yield from flush()
+
+        match = _heading.match(line)
+        if match:
+            yield from flush()
+            yield Block('heading', match.group(2), len(match.group(1)))
+            continue
+
+        if _rule.match(line):
+            yield from flush()
+            yield Block('rule')
+            continue
+
+        match = _list_item.match(line)
+        if match:
+            yield from flush()
+            indent = len(match.group(1).expandtabs(4))
+            kind = 'bullet' if match.group(2) in '-*+' else 'number'
+            yield Block(kind, match.group(3), min(indent // 2, 2))
+            continue
+
+        if stripped.startswith('>'):
+            if paragraph:
+                yield from flush()
+            quote.append(stripped.lstrip('>').strip())
+            continue
+
+        if quote:
+            yield from flush()
+        paragraph.append(stripped)
+
+    if code is not None:
+        # 没有闭合的代码块
+        yield Block('code', '\n'.join(code))
+    yield from flush()
+
+
+def _add_runs(paragraph, text: str) -> None:
+    """行内格式：**粗体**、*斜体*、`代码`、[链接](url)"""
+    position = 0
+    for match in _inline.finditer(text):
+        if match.start() > position:
+            paragraph.add_run(text[position:match.start()])
+        bold, bold_underscore, italic, code, link = match.group(2, 3, 4, 5, 6)
+        if bold or bold_underscore:
+            paragraph.add_run(bold or bold_underscore).bold = True
+        elif italic:
+            paragraph.add_run(italic).italic = True
+        elif code:
+            paragraph.add_run(code).font.name = CODE_FONT
+        else:
+            paragraph.add_run(link)
+        position = match.end()
+    if position < len(text):
+        paragraph.add_run(text[position:])
+
+
+@lru_cache(maxsize=None)
+def _template_bytes() -> bytes:
+    """默认模板只从磁盘读取一次（每个进程）"""
+    from docx.api import _default_docx_path
+    with open(_default_docx_path(), 'rb') as f:
+        return f.read()
+
+
+def new_document():
+    from docx import Document
+    return Document(io.BytesIO(_template_bytes()))
+
+
+class _Styles:
+    """样式名称到 styleId 的缓存：python-docx 按名称设置样式时每次都会遍历所有样式，长文档中占大部分渲染时间"""
+
+    def __init__(self, document):
+        self._styles = document.styles
+        self._ids = {}
+
+    def apply(self, paragraph, name: str):
+        style_id = self._ids.get(name)
+        if style_id is None:
+            style_id = self._ids[name] = self._styles[name].style_id
+        paragraph._p.style = style_id
+        return paragraph
+
+
+def render_blocks(document, blocks: Iterable[Block]) -> None:
+    styles = _Styles(document)
+    for block in blocks:
+        if block.kind == 'heading':
+            _add_runs(styles.apply(document.add_paragraph(), f'Heading {block.level}'), block.text)
+        elif block.kind == 'paragraph':
+            _add_runs(document.add_paragraph(), block.text)
+        elif block.kind in ('bullet', 'number'):
+            style = 'List Bullet' if block.kind == 'bullet' else 'List Number'
+            if block.level:
+                style += f' {block.level + 1}'
+            _add_runs(styles.apply(document.add_paragraph(), style), block.text)
+        elif block.kind == 'quote':
+            _add_runs(styles.apply(document.add_paragraph(), 'Quote'), block.text)
+        elif block.kind == 'code':
+            paragraph = styles.apply(document.add_paragraph(), 'No Spacing')
+            for index, line in enumerate(block.text.split('\n')):
+                if index:
+                    paragraph.add_run().add_break()
+                paragraph.add_run(line).font.name = CODE_FONT
+        elif block.kind == 'table':
+            columns = max(len(row) for row in block.rows)
+            table = document.add_table(rows=len(block.rows), cols=columns)
+            table.style = 'Table Grid'
+            for row_index, (row, cells) in enumerate(zip(block.rows, table.rows)):
+                # 每行只取一次 cells（table.cell(r, c) 每次都会重新计算整张表格）
+                for text, cell in zip(row, cells.cells):
+                    paragraph = cell.paragraphs[0]
+                    _add_runs(paragraph, text)
+                    if row_index == 0:
+                        for run in paragraph.runs:
+                            run.bold = True
+        elif block.kind == 'rule':
+            document.add_paragraph()
+
+
+def render_markdown(lines: Iterable[str]) -> bytes:
+    """把 markdown 渲染为 docx 文件内容"""
+    document = new_document()
+    render_blocks(document, parse_markdown(lines))
+    buffer = io.BytesIO()
+    document.save(buffer)
+    return buffer.getvalue()
+
+
+def _render_file(text_path: str, docx_path: str) -> None:
+    with open(text_path, encoding='utf-8') as f:
+        content = render_markdown(f)
+    with open(docx_path, 'wb') as f:
+        f.write(content)
+
+
+_process_pool: Optional[ProcessPoolExecutor] = None
+# 多个工作线程同时渲染长文档时只创建一个进程池
+_process_pool_lock = threading.Lock()
+
+
+def get_process_pool() -> Optional[ProcessPoolExecutor]:
+    """渲染进程池，DOCX_PROCESSES=0 时关闭（在当前进程中渲染）"""
+    global _process_pool
+    workers = int(os.environ.get('DOCX_PROCESSES', min(2, os.cpu_count() or 1)))
+    if workers <= 0:
+        return None
+    with _process_pool_lock:
+        if _process_pool is None:
+            # spawn：服务进程有多个线程，fork 可能复制到被其他线程持有的锁
+            _process_pool = ProcessPoolExecutor(
+                max_workers=workers, mp_context=multiprocessing.get_context('spawn'), initializer=_template_bytes
+            )
+        return _process_pool
+
+
+def _run_in_pool(func: Callable, *args) -> Any:
+    """在进程池中执行，进程池不可用（关闭或者子进程异常退出）时在当前进程中执行"""
+    global _process_pool
+    pool = get_process_pool()
+    if pool is not None:
+        try:
+            return pool.submit(func, *args).result()
+        except BrokenProcessPool:
+            with _process_pool_lock:
+                # 其他线程可能已经换上了新的进程池
+                if _process_pool is pool:
+                    _process_pool = None
+    return func(*args)
+
+
+def write_docx(doc_path: str, doc_content: str) -> None:
+    """把 markdown 内容写入 docx 文件，长文档在进程池中渲染"""
+    if len(doc_content) > PROCESS_THRESHOLD:
+        content = _run_in_pool(render_markdown, doc_content.splitlines())
+    else:
+        content = render_markdown(io.StringIO(doc_content))
+    with open(doc_path, 'wb') as f:
+        f.write(content)
+
+
+def write_docx_from_file(text_path: str, docx_path: str) -> None:
+    """渲染 markdown 文件为 docx；长文档由子进程直接读取文件，不需要在进程之间传递内容"""
+    if os.path.getsize(text_path) > PROCESS_THRESHOLD:
+        _run_in_pool(_render_file, text_path, docx_path)
+    else:
+        _render_file(text_path, docx_path)
+
+
+if __name__ == '__main__':
+    import time
+    import tempfile
+    from docx import Document
+
+    def make_markdown(pages: int) -> str:
+        """每页约 500 字：标题、段落、列表、代码块，每 5 页一个表格"""
+        parts = []
+        for page in range(pages):
+            parts.append(f'## 第 {page + 1} 节\n')
+            parts.append('这是一个**示例**段落，包含`行内代码`和*斜体*文字。' * 6 + '\n')
+            parts.append('\n'.join(f'- 列表项 {i}：说明文字' for i in range(5)) + '\n')
+            parts.append('1. 第一步\n2. 第二步\n   - 子项\n')
+            parts.append('```python\nimport torch\nx = torch.ones(3)\nprint(x)\n```\n')
+            if page % 5 == 0:
+                parts.append('| 名称 | 数值 | 说明 |\n|---|---|---|\n' +
+                             '\n'.join(f'| 项目{i} | {i * 10} | 描述 |' for i in range(8)) + '\n')
+        return '\n'.join(parts)
+
+    def legacy(content: str) -> bytes:
+        """原来的实现：每次从磁盘加载模板，整个内容写入一个段落"""
+        document = Document()
+        document.add_paragraph(content)
+        buffer = io.BytesIO()
+        document.save(buffer)
+        return buffer.getvalue()
+
+    def timed(label, func, repeat=5):
+        func()
+        start = time.perf_counter()
+        for _ in range(repeat):
+            func()
+        print(f'{label:44} {(time.perf_counter() - start) / repeat * 1000:8.1f} ms')
+
+    timed('Document() from disk', Document, 50)
+    timed('Document() from cached template', new_document, 50)
+    for pages in (10, 100):
+        content = make_markdown(pages)
+        blocks = list(parse_markdown(io.StringIO(content)))
+        print(f'--- {pages} pages: {len(content)} chars, {len(blocks)} blocks')
+        timed('parse only', lambda: list(parse_markdown(io.StringIO(content))))
+        timed('legacy: single paragraph (no structure)', lambda: legacy(content))
+        timed('render_markdown in-process', lambda: render_markdown(io.StringIO(content)))
+        with tempfile.TemporaryDirectory() as folder:
+            path = os.path.join(folder, 'out.docx')
+            timed('write_docx (process pool)', lambda: write_docx(path, content))
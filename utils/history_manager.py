@@ -0,0 +1,263 @@
+"""
+按 token 预算裁剪对话历史
+最近的消息原样保留，放不下的早期消息合并为一段滚动摘要；摘要按对话缓存，新增的早期消息只在原摘要的基础上增量合并
+"""
+import os
+import re
+import hashlib
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+from typing import List, Dict, Any, Optional, Callable, NamedTuple
+
+from langchain_core.messages import BaseMessage, SystemMessage
+
+from utils.utils import ChatMessage, transform_messages_type
+
+# 每个模型的历史消息 token 预算（不包括系统提示词、当前问题和工具调用）
+DEFAULT_BUDGETS = {
+    'glm-4': 6000,
+    'glm-4-0520': 6000,
+    'glm-4-air': 6000,
+    'deepseek-chat': 8000,
+}
+DEFAULT_BUDGET = int(os.environ.get('HISTORY_TOKEN_BUDGET', 4000))
+# 至少原样保留的最近消息数（即使超出预算）
+KEEP_RECENT = int(os.environ.get('HISTORY_KEEP_RECENT', 4))
+# 摘要最多占用预算的比例
+SUMMARY_RATIO = 0.25
+# 每条消息固定的格式开销（role、分隔符）
+MESSAGE_OVERHEAD = 4
+SUMMARY_PREFIX = 'Summary of the earlier conversation:\n'
+
+_cjk = re.compile(r'[⺀-鿿가-힯豈-﫿＀-￯]')
+
+
+def heuristic_count(text: str) -> int:
+    """没有 tokenizer 时估算：中日韩字符每个约 1 token，其他字符约 4 个 1 token"""
+    cjk = len(_cjk.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+@lru_cache(maxsize=None)
+def get_tokenizer(encoding_name: Optional[str] = None) -> Callable[[str], int]:
+    """
+    加载 tiktoken 编码（每个进程只加载一次，加载失败时也只尝试一次）
+    glm / qwen 等模型没有公开的 tiktoken 编码，使用 cl100k_base 近似；HISTORY_TOKENIZER=heuristic 时不加载
+    """
+    encoding_name = encoding_name or os.environ.get('HISTORY_TOKENIZER', 'cl100k_base')
+    if encoding_name == 'heuristic':
+        return heuristic_count
+    try:
+        import tiktoken
+        encoding = tiktoken.get_encoding(encoding_name)
+    except Exception:
+        # 没有安装或者离线环境下无法下载编码文件
+        return heuristic_count
+    return lambda text: len(encoding.encode(text, disallowed_special=()))
+
+
+@lru_cache(maxsize=8192)
+def count_tokens(text: str) -> int:
+    """计算文本的 token 数（历史消息每轮都会重复出现，结果按内容缓存）"""
+    return get_tokenizer()(text) + MESSAGE_OVERHEAD
+
+
+def extractive_summarizer(previous: str, messages: List[ChatMessage], max_tokens: int) -> str:
+    """
+    不调用模型的摘要：每条消息保留第一句（最多 120 字符），追加到原摘要后；超出 max_tokens 时丢弃最早的行
+    """
+    lines = previous.split('\n') if previous else []
+    for message in messages:
+        text = ' '.join(message.content.split())
+        sentence = re.split(r'(?<=[。！？.!?])\s*', text, maxsplit=1)[0]
+        if len(sentence) > 120:
+            sentence = sentence[:120] + '…'
+        lines.append(f'{message.role}: {sentence}')
+    while len(lines) > 1 and count_tokens('\n'.join(lines)) > max_tokens:
+        lines.pop(0)
+    return '\n'.join(lines)
+
+
+def make_llm_summarizer(llm) -> Callable[[str, List[ChatMessage], int], str]:
+    """使用大模型合并摘要：原摘要 + 新的早期消息 -> 新摘要"""
+
+    def summarize(previous: str, messages: List[ChatMessage], max_tokens: int) -> str:
+        conversation = '\n'.join(f'{message.role}: {message.content}' for message in messages)
+        prompt = (
+            f'Update the summary of a conversation between a user and an assistant. '
+            f'Keep facts, decisions, file names and open tasks; answer in the language of the conversation; '
+            f'at most {max_tokens} tokens.\n\n'
+            f'Current summary:\n{previous or "(empty)"}\n\nNew messages:\n{conversation}\n\nUpdated summary:'
+        )
+        return llm.invoke(prompt).content.strip()
+
+    return summarize
+
+
+class _Summary(NamedTuple):
+    covered: int  # 摘要覆盖了前多少条消息
+    fingerprint: str  # 被覆盖的消息前缀的指纹
+    text: str
+
+
+class HistoryManager:
+    """
+    对话历史管理
+    :param budgets: 每个模型的 token 预算，没有配置的模型使用 default_budget
+    :param summarizer: 摘要函数 summarize(原摘要, 新的早期消息, 最大 token 数)
+    :param max_conversations: 缓存摘要的对话数量（LRU）
+    """
+
+    def __init__(
+            self,
+            budgets: Optional[Dict[str, int]] = None,
+            default_budget: int = DEFAULT_BUDGET,
+            keep_recent: int = KEEP_RECENT,
+            summarizer: Callable[[str, List[ChatMessage], int], str] = extractive_summarizer,
+            max_conversations: int = 1024
+    ):
+        self.budgets = dict(DEFAULT_BUDGETS, **(budgets or {}))
+        self.default_budget = default_budget
+        self.keep_recent = keep_recent
+        self.summarizer = summarizer
+        self.max_conversations = max_conversations
+        self._summaries: 'OrderedDict[str, _Summary]' = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {'requests': 0, 'trimmed': 0, 'tokens_in': 0, 'tokens_sent': 0,
+                       'summaries_computed': 0, 'summary_cache_hits': 0, 'last_prompt_tokens': 0}
+
+    def budget(self, model: Optional[str]) -> int:
+        return self.budgets.get(model, self.default_budget)
+
+    @staticmethod
+    def _fingerprints(messages: List[ChatMessage]) -> List[str]:
+        """每个前缀的指纹（链式哈希），用于判断缓存的摘要是否仍然对应同一段对话"""
+        fingerprints = []
+        digest = b''
+        for message in messages:
+            digest = hashlib.sha1(digest + message.role.encode() + b'\0' + message.content.encode('utf-8')).digest()
+            fingerprints.append(digest.hex())
+        return fingerprints
+
+    def _summarize(self, key: str, messages: List[ChatMessage], fingerprints: List[str], cut: int,
+                   max_tokens: int) -> str:
+        """前 cut 条消息的摘要：缓存的摘要是当前前缀的一部分时只合并新增的消息"""
+        with self._lock:
+            cached = self._summaries.get(key)
+            if cached is not None:
+                self._summaries.move_to_end(key)
+        if cached is not None and cached.covered == cut and cached.fingerprint == fingerprints[cut - 1]:
+            self._count('summary_cache_hits')
+            return cached.text
+
+        previous, start = '', 0
+        if cached is not None and cached.covered < cut and cached.fingerprint == fingerprints[cached.covered - 1]:
+            previous, start = cached.text, cached.covered
+        text = self.summarizer(previous, messages[start:cut], max_tokens)
+        self._count('summaries_computed')
+        with self._lock:
+            self._summaries[key] = _Summary(cut, fingerprints[cut - 1], text)
+            self._summaries.move_to_end(key)
+            while len(self._summaries) > self.max_conversations:
+                self._summaries.popitem(last=False)
+        return text
+
+    def _count(self, name: str, value: int = 1) -> None:
+        with self._lock:
+            self._stats[name] += value
+
+    def prepare(
+            self,
+            history_messages: List[ChatMessage],
+            model: Optional[str] = None,
+            conversation_id: Optional[str] = None,
+            converted: Optional[List[BaseMessage]] = None
+    ) -> List[BaseMessage]:
+        """
+        把历史消息转换为 langchain 消息，超出模型预算时早期消息替换为摘要
+        :param conversation_id: 对话 id，为空时以第一条消息区分对话
+        :param converted: 已经转换好的 langchain 消息（和 history_messages 一一对应），不为空时不再重复转换
+        """
+        # 和 transform_messages_type 一样去掉开头的 system 消息
+        messages = history_messages
+        if messages and messages[0].role == 'system':
+            messages = messages[1:]
+            if converted is not None:
+                converted = converted[1:]
+        if not messages:
+            return []
+
+        budget = self.budget(model)
+        tokens = [count_tokens(message.content) for message in messages]
+        total = sum(tokens)
+        if total <= budget:
+            self._record(total, total, trimmed=False)
+            return self._convert(messages, converted, 0)
+
+        # 从最新的消息往前保留，给摘要预留 SUMMARY_RATIO 的预算
+        summary_tokens = int(budget * SUMMARY_RATIO)
+        available = budget - summary_tokens
+        cut, used = len(messages), 0
+        while cut > 0:
+            if len(messages) - cut >= self.keep_recent and used + tokens[cut - 1] > available:
+                break
+            used += tokens[cut - 1]
+            cut -= 1
+        if cut == 0:
+            self._record(total, total, trimmed=False)
+            return self._convert(messages, converted, 0)
+
+        fingerprints = self._fingerprints(messages[:cut])
+        key = conversation_id or fingerprints[0]
+        summary = self._summarize(key, messages, fingerprints, cut, summary_tokens)
+        summary_message = SystemMessage(content=SUMMARY_PREFIX + summary)
+        self._record(total, used + count_tokens(summary_message.content), trimmed=True)
+        return [summary_message] + self._convert(messages, converted, cut)
+
+    @staticmethod
+    def _convert(messages: List[ChatMessage], converted: Optional[List[BaseMessage]], start: int) -> List[BaseMessage]:
+        """从第 start 条开始的 langchain 消息，没有转换好的消息时只转换需要发送的部分"""
+        if converted is not None:
+            return converted[start:]
+        return transform_messages_type(messages[start:], has_system=True)
+
+    def _record(self, tokens_in: int, tokens_sent: int, trimmed: bool) -> None:
+        with self._lock:
+            self._stats['requests'] += 1
+            self._stats['trimmed'] += int(trimmed)
+            self._stats['tokens_in'] += tokens_in
+            self._stats['tokens_sent'] += tokens_sent
+            self._stats['last_prompt_tokens'] = tokens_sent
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                **self._stats,
+                'tokens_saved': self._stats['tokens_in'] - self._stats['tokens_sent'],
+                'conversations': len(self._summaries),
+                'tokenizer': 'heuristic' if get_tokenizer() is heuristic_count else 'tiktoken',
+                'count_cache': count_tokens.cache_info()._asdict()
+            }
+
+
+if __name__ == '__main__':
+    import time
+
+    # 模拟 100 轮的对话，每轮在前一轮的基础上追加一问一答
+    manager = HistoryManager(default_budget=2000)
+    history: List[ChatMessage] = []
+    start = time.perf_counter()
+    for turn in range(100):
+        history.append(ChatMessage(role='user', content=f'第 {turn} 个问题：请介绍一下 pytorch 的张量运算。' * 3))
+        history.append(ChatMessage(role='assistant', content=f'第 {turn} 个回答：张量是多维数组。' * 20))
+        messages = manager.prepare(history, model='unknown-model')
+    elapsed = time.perf_counter() - start
+    # 同一段历史再次请求（如重试）直接使用缓存的摘要
+    manager.prepare(history, model='unknown-model')
+    stats = manager.stats()
+    print(f'100 turns in {elapsed * 1000:.1f} ms, last prompt {stats["last_prompt_tokens"]} tokens '
+          f'(full history {sum(count_tokens(m.content) for m in history)} tokens)')
+    print({key: stats[key] for key in ('requests', 'trimmed', 'tokens_in', 'tokens_sent', 'tokens_saved',
+                                       'summaries_computed', 'summary_cache_hits', 'tokenizer')})
+    print(messages[0].content[:200])
@@ -0,0 +1,231 @@
+"""上游大模型接口共享的 HTTP 连接池（每个 base_url 一个同步 client 和一个异步 client）"""
+import os
+import threading
+from typing import Dict, Any, Tuple, Optional, Callable, Iterator, AsyncIterator
+from urllib.parse import urlsplit
+from urllib.request import getproxies, proxy_bypass
+
+import httpx
+import httpcore
+
+
+def _http2_supported() -> bool:
+    """安装了 h2 才能开启 HTTP/2"""
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+# 连接池大小，可以通过环境变量调整
+pool_limits = httpx.Limits(
+    max_connections=int(os.environ.get('HTTP_MAX_CONNECTIONS', 100)),
+    max_keepalive_connections=int(os.environ.get('HTTP_MAX_KEEPALIVE', 20)),
+    keepalive_expiry=float(os.environ.get('HTTP_KEEPALIVE_EXPIRY', 60))
+)
+# 分阶段超时：连接、读取（流式输出两个token之间的最大间隔）、写入、等待连接池空闲连接
+pool_timeout = httpx.Timeout(
+    connect=float(os.environ.get('HTTP_CONNECT_TIMEOUT', 5)),
+    read=float(os.environ.get('HTTP_READ_TIMEOUT', 120)),
+    write=float(os.environ.get('HTTP_WRITE_TIMEOUT', 30)),
+    pool=float(os.environ.get('HTTP_POOL_TIMEOUT', 10))
+)
+http2_enabled = _http2_supported()
+
+
+class PoolGauges:
+    """
+    单个 client 的请求统计
+    in_flight 为已经发出、响应体还没有读完或关闭的请求（在 finally 中减少，失败和超时的请求不会残留）；
+    waiting 为超过 max_connections 后排队等待连接的请求数（HTTP/1.1 每个请求占用一个连接）
+    """
+
+    def __init__(self, max_connections: Optional[int] = None):
+        self.max_connections = max_connections
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.requests = 0
+        self.failed = 0
+
+    def start(self) -> None:
+        with self._lock:
+            self.in_flight += 1
+            self.requests += 1
+
+    def finish(self, failed: bool = False) -> None:
+        with self._lock:
+            self.in_flight -= 1
+            if failed:
+                self.failed += 1
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            in_flight = self.in_flight
+            stats = {'in_flight': in_flight, 'requests': self.requests, 'failed': self.failed}
+        stats['waiting'] = max(in_flight - self.max_connections, 0) if self.max_connections else 0
+        return stats
+
+
+class _TrackedStream(httpx.SyncByteStream, httpx.AsyncByteStream):
+    """响应体关闭时（读完、出错或者提前关闭）结束计数，只结束一次"""
+
+    def __init__(self, stream, on_close: Callable[[], None]):
+        self._stream = stream
+        self._on_close = on_close
+        self._closed = False
+
+    def _finish(self) -> None:
+        if not self._closed:
+            self._closed = True
+            self._on_close()
+
+    def __iter__(self) -> Iterator[bytes]:
+        yield from self._stream
+
+    def close(self) -> None:
+        try:
+            self._stream.close()
+        finally:
+            self._finish()
+
+    async def __aiter__(self) -> AsyncIterator[bytes]:
+        async for chunk in self._stream:
+            yield chunk
+
+    async def aclose(self) -> None:
+        try:
+            await self._stream.aclose()
+        finally:
+            self._finish()
+
+
+class InstrumentedTransport(httpx.BaseTransport, httpx.AsyncBaseTransport):
+    """包装 httpx 的 transport，统计进行中的请求，并读取 httpcore 连接池公开的连接列表"""
+
+    def __init__(self, transport, gauges: PoolGauges):
+        self.transport = transport
+        self.gauges = gauges
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        self.gauges.start()
+        try:
+            response = self.transport.handle_request(request)
+        except BaseException:
+            self.gauges.finish(failed=True)
+            raise
+        response.stream = _TrackedStream(response.stream, self.gauges.finish)
+        return response
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        self.gauges.start()
+        try:
+            response = await self.transport.handle_async_request(request)
+        except BaseException:
+            self.gauges.finish(failed=True)
+            raise
+        response.stream = _TrackedStream(response.stream, self.gauges.finish)
+        return response
+
+    def close(self) -> None:
+        self.transport.close()
+
+    async def aclose(self) -> None:
+        await self.transport.aclose()
+
+    def connection_stats(self) -> Dict[str, int]:
+        """打开、空闲、可以接收新请求的连接数（httpx 没有公开连接池，拿不到 httpcore 连接池时为空）"""
+        pool = getattr(self.transport, '_pool', None)
+        if not isinstance(pool, (httpcore.ConnectionPool, httpcore.AsyncConnectionPool)):
+            return {}
+        connections = list(pool.connections)
+        return {
+            'open': sum(1 for conn in connections if not conn.is_closed()),
+            'idle': sum(1 for conn in connections if conn.is_idle()),
+            'available': sum(1 for conn in connections if conn.is_available())
+        }
+
+    def stats(self) -> Dict[str, int]:
+        return {**self.gauges.stats(), **self.connection_stats()}
+
+
+def _env_proxy(base_url: str) -> Optional[str]:
+    # 传入自定义 transport 后 httpx 不再读取代理环境变量，这里按 base_url 选择代理（遵守 no_proxy）
+    parts = urlsplit(base_url)
+    if not parts.scheme or (parts.hostname and proxy_bypass(parts.hostname)):
+        return None
+    proxies = getproxies()
+    return proxies.get(parts.scheme) or proxies.get('all')
+
+
+_clients: Dict[str, httpx.Client] = {}
+_async_clients: Dict[str, httpx.AsyncClient] = {}
+# (base_url, sync|async) -> 包装后的 transport
+_transports: Dict[Tuple[str, str], InstrumentedTransport] = {}
+_clients_lock = threading.Lock()
+
+
+def _transport(base_url: str, kind: str) -> InstrumentedTransport:
+    transport_class = httpx.HTTPTransport if kind == 'sync' else httpx.AsyncHTTPTransport
+    transport = InstrumentedTransport(
+        transport_class(limits=pool_limits, http2=http2_enabled, proxy=_env_proxy(base_url)),
+        PoolGauges(pool_limits.max_connections)
+    )
+    _transports[(base_url, kind)] = transport
+    return transport
+
+
+def get_http_client(base_url: str) -> httpx.Client:
+    """获取 base_url 对应的共享同步 client"""
+    with _clients_lock:
+        if base_url not in _clients:
+            _clients[base_url] = httpx.Client(transport=_transport(base_url, 'sync'), timeout=pool_timeout)
+        return _clients[base_url]
+
+
+def get_async_http_client(base_url: str) -> httpx.AsyncClient:
+    """获取 base_url 对应的共享异步 client"""
+    with _clients_lock:
+        if base_url not in _async_clients:
+            _async_clients[base_url] = httpx.AsyncClient(transport=_transport(base_url, 'async'), timeout=pool_timeout)
+        return _async_clients[base_url]
+
+
+def http_client_kwargs(base_url: str) -> Dict[str, Any]:
+    """构建 ChatOpenAI 等模型时注入的共享 client 参数"""
+    return {
+        'http_client': get_http_client(base_url),
+        'http_async_client': get_async_http_client(base_url)
+    }
+
+
+def pool_stats() -> Dict[str, Any]:
+    """连接池统计信息（进行中、排队、打开、空闲的连接数），用于压测时调整连接池大小"""
+    with _clients_lock:
+        transports = list(_transports.items())
+
+    stats = {
+        'limits': {
+            'max_connections': pool_limits.max_connections,
+            'max_keepalive_connections': pool_limits.max_keepalive_connections,
+            'keepalive_expiry': pool_limits.keepalive_expiry
+        },
+        'http2': http2_enabled,
+        'pools': {}
+    }
+    for (url, kind), transport in transports:
+        stats['pools'].setdefault(url, {})[kind] = transport.stats()
+    return stats
+
+
+async def close_http_clients() -> None:
+    """关闭所有共享 client（服务退出时调用）"""
+    with _clients_lock:
+        clients = list(_clients.values())
+        async_clients = list(_async_clients.values())
+        _clients.clear()
+        _async_clients.clear()
+    for client in clients:
+        client.close()
+    for client in async_clients:
+        await client.aclose()
@@ -1,11 +1,110 @@
 import re
-from typing import Dict, Union, Optional
+import threading
+from collections import OrderedDict, deque
+from typing import Any, Dict, Union, Optional, List, Tuple, Iterator
 from utils import get_os_type
 
+# 模式开头的全局标志，如 (?i)
+_GLOBAL_FLAGS = re.compile(r'^\(\?([aiLmsux]+)\)')
+# 字面规则中不能出现的正则元字符
+_REGEX_META = re.compile(r'[\\.^$*+?{}\[\]()|]')
+_NO_MATCH = object()
+
+
+def _literal_rule(pattern: str) -> Optional[Tuple[bool, bool, bool, List[str]]]:
+    """
+    识别只由字面词组成的规则，如 (?i)\\b(Note|Notes|备忘录)\\b，
+    返回 (是否忽略大小写, 开头是否要求单词边界, 结尾是否要求单词边界, 词列表)，不是字面规则时返回 None
+    """
+    flags = _GLOBAL_FLAGS.match(pattern)
+    if flags and set(flags.group(1)) - {'i'}:
+        return None
+    body = pattern[flags.end():] if flags else pattern
+    word_start = body.startswith(r'\b')
+    if word_start:
+        body = body[2:]
+    word_end = body.endswith(r'\b') and not body.endswith(r'\\b')
+    if word_end:
+        body = body[:-2]
+    if body.startswith('(') and body.endswith(')') and '(' not in body[1:-1] and ')' not in body[1:-1]:
+        body = body[1:-1]
+    words = body.split('|')
+    if not all(words) or any(_REGEX_META.search(word) for word in words):
+        return None
+    return bool(flags), word_start, word_end, words
+
+
+def _is_word_char(char: str) -> bool:
+    # 和 re 中 \w 的定义一致
+    return char.isalnum() or char == '_'
+
+
+def _at_boundary(text: str, index: int) -> bool:
+    before = index > 0 and _is_word_char(text[index - 1])
+    after = index < len(text) and _is_word_char(text[index])
+    return before != after
+
+
+def _lower(text: str) -> str:
+    # 个别字符转小写后长度会变化，逐字符处理保证位置和原文一致
+    lowered = text.lower()
+    if len(lowered) == len(text):
+        return lowered
+    return ''.join(char.lower() if len(char.lower()) == 1 else char for char in text)
+
+
+class AhoCorasick:
+    """多模式字符串匹配自动机，匹配耗时只和输入长度有关，和别名数量无关"""
+
+    def __init__(self):
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._output: List[List[Tuple[int, Any]]] = [[]]
+
+    def add(self, word: str, value: Any) -> None:
+        state = 0
+        for char in word:
+            if char not in self._goto[state]:
+                self._goto.append({})
+                self._fail.append(0)
+                self._output.append([])
+                self._goto[state][char] = len(self._goto) - 1
+            state = self._goto[state][char]
+        self._output[state].append((len(word), value))
+
+    def build(self) -> None:
+        """计算失配指针（添加完所有词之后调用）"""
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fail = self._fail[state]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[next_state] = self._goto[fail].get(char, 0)
+                self._output[next_state] = self._output[next_state] + self._output[self._fail[next_state]]
+
+    def search(self, text: str) -> Iterator[Tuple[int, int, Any]]:
+        """返回所有匹配 (start, length, value)"""
+        state = 0
+        for index, char in enumerate(text):
+            while state and char not in self._goto[state]:
+                state = self._fail[state]
+            state = self._goto[state].get(char, 0)
+            for length, value in self._output[state]:
+                yield index - length + 1, length, value
+
 
 class BasicMatcher:
-    """匹配系统应用名称"""
-    def __init__(self, default_patterns=None):
+    """
+    匹配系统应用名称
+    规则按添加顺序生效：第一个在输入中任意位置匹配的规则胜出（默认规则在前，add_rule 添加的在后）；
+    只由字面词组成的规则（如 (?i)\\b(Note|备忘录)\\b）和字面别名编译进 Aho-Corasick 自动机，耗时只和输入长度有关，
+    其他正则规则逐条 re.search，耗时随这类规则的数量线性增长（只检查排在自动机命中的规则之前的部分）；
+    没有规则匹配时才使用别名，取输入中最靠前的别名，位置相同时取更长的别名；规则变化时才重新编译
+    """
+    def __init__(self, default_patterns=None, cache_size: int = 1024):
         if default_patterns is None:
             default_patterns = {}
 
@@ -26,20 +125,170 @@ class BasicMatcher:
         else:
             raise EnvironmentError('Unsupported platform.')
         self.app_patterns = self.default_patterns.copy()  # 初始化时使用默认规则
+        self.app_aliases: Dict[str, List[str]] = {}
+
+        self.cache_size = cache_size
+        self._cache: 'OrderedDict[str, object]' = OrderedDict()
+        self._lock = threading.Lock()
+        self._compiled: Optional[Tuple[List[Tuple[str, Optional[re.Pattern]]], AhoCorasick, AhoCorasick,
+                                       AhoCorasick]] = None
 
     def add_rule(self, app_name: str, pattern: str):
         """添加或更新应用匹配规则，如果应用名称已存在则抛出异常"""
         if app_name in self.app_patterns:
             raise ValueError(f"应用名称 '{app_name}' 已经存在")
         self.app_patterns[app_name] = pattern
+        self._invalidate()
 
-    def match_app(self, input_content: str) -> Union[str, None]:
-        """匹配输入字符串并返回应用名称"""
-        for app_name, pattern in self.app_patterns.items():
-            if re.search(pattern, input_content):
+    def add_alias(self, app_name: str, *aliases: str):
+        """添加应用的字面别名（不区分大小写），大量别名时比正则规则更快"""
+        self.app_aliases.setdefault(app_name, []).extend(aliases)
+        self._invalidate()
+
+    def _invalidate(self) -> None:
+        with self._lock:
+            self._compiled = None
+            self._cache.clear()
+
+    def _compile(self):
+        with self._lock:
+            if self._compiled is None:
+                # (应用名称, 非字面规则的正则)，字面规则的词放进自动机，值为 (规则序号, 开头边界, 结尾边界)
+                rules: List[Tuple[str, Optional[re.Pattern]]] = []
+                folded, exact = AhoCorasick(), AhoCorasick()
+                for index, (app_name, pattern) in enumerate(self.app_patterns.items()):
+                    literal = _literal_rule(pattern)
+                    if literal is None:
+                        rules.append((app_name, re.compile(pattern)))
+                        continue
+                    ignore_case, word_start, word_end, words = literal
+                    for word in words:
+                        if ignore_case:
+                            folded.add(_lower(word), (index, word_start, word_end))
+                        else:
+                            exact.add(word, (index, word_start, word_end))
+                    rules.append((app_name, None))
+                folded.build()
+                exact.build()
+
+                aliases = AhoCorasick()
+                for app_name, alias_list in self.app_aliases.items():
+                    for alias in alias_list:
+                        aliases.add(_lower(alias), app_name)
+                aliases.build()
+                self._compiled = (rules, folded, exact, aliases)
+            return self._compiled
+
+    def _match(self, input_content: str) -> Union[str, None]:
+        rules, folded, exact, aliases = self._compile()
+        lowered = _lower(input_content)
+
+        # 自动机中命中的序号最小的字面规则
+        first = len(rules)
+        for automaton, text in ((folded, lowered), (exact, input_content)):
+            for start, length, (index, word_start, word_end) in automaton.search(text):
+                if index >= first:
+                    continue
+                if word_start and not _at_boundary(input_content, start):
+                    continue
+                if word_end and not _at_boundary(input_content, start + length):
+                    continue
+                first = index
+        # 排在它前面的正则规则优先
+        for app_name, pattern in rules[:first]:
+            if pattern is not None and pattern.search(input_content):
+                return app_name
+        if first < len(rules):
+            return rules[first][0]
+
+        best: Optional[Tuple[int, int, str]] = None
+        for start, length, app_name in aliases.search(lowered):
+            # 位置更靠前的优先，位置相同时更长的别名优先
+            if best is None or (start, -length) < best[:2]:
+                best = (start, -length, app_name)
+        return best[2] if best else None
+
+    def match_exact(self, input_content: str) -> Union[str, None]:
+        """整个输入就是某条规则的匹配（或者某个别名）时返回应用名称，不接受输入中包含应用名称的情况"""
+        text = input_content.strip()
+        if not text:
+            return None
+        rules, folded, exact, aliases = self._compile()
+        lowered = _lower(text)
+        first = len(rules)
+        for automaton, haystack in ((folded, lowered), (exact, text)):
+            for start, length, (index, word_start, word_end) in automaton.search(haystack):
+                if start != 0 or length != len(text) or index >= first:
+                    continue
+                if (word_start and not _at_boundary(text, 0)) or (word_end and not _at_boundary(text, length)):
+                    continue
+                first = index
+        for app_name, pattern in rules[:first]:
+            if pattern is not None and pattern.fullmatch(text):
+                return app_name
+        if first < len(rules):
+            return rules[first][0]
+        for start, length, app_name in aliases.search(lowered):
+            if start == 0 and length == len(text):
                 return app_name
         return None
 
+    def match_app(self, input_content: str) -> Union[str, None]:
+        """匹配输入字符串并返回应用名称"""
+        with self._lock:
+            cached = self._cache.get(input_content, _NO_MATCH)
+            if cached is not _NO_MATCH:
+                self._cache.move_to_end(input_content)
+                return cached
+
+        app_name = self._match(input_content)
+        with self._lock:
+            self._cache[input_content] = app_name
+            if len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return app_name
+
     def reset_to_default(self) -> None:
         """重置为默认匹配规则"""
         self.app_patterns = self.default_patterns.copy()
+        self.app_aliases = {}
+        self._invalidate()
+
+
+_matcher: Optional[BasicMatcher] = None
+_matcher_lock = threading.Lock()
+
+
+def get_matcher() -> BasicMatcher:
+    """进程内共享的应用名称匹配器"""
+    global _matcher
+    with _matcher_lock:
+        if _matcher is None:
+            _matcher = BasicMatcher()
+        return _matcher
+
+
+if __name__ == '__main__':
+    import time
+
+    # 基准测试：别名数量增加时单次匹配的耗时基本不变
+    query = '帮我打开 app-999999 这个应用'
+    for rule_count in (10, 100, 1000, 10000):
+        matcher = BasicMatcher(cache_size=0)
+        for i in range(rule_count):
+            matcher.add_alias(f'App{i}', f'app-{i:06d}', f'应用{i}')
+        matcher.match_app(query)  # 编译
+
+        rounds = 2000
+        start = time.perf_counter()
+        for _ in range(rounds):
+            matcher._match(query)
+        elapsed = (time.perf_counter() - start) / rounds * 1e6
+
+        # 原来的实现：逐条正则 re.search
+        patterns = {f'App{i}': rf'(?i)(app-{i:06d}|应用{i})' for i in range(rule_count)}
+        start = time.perf_counter()
+        for _ in range(max(1, rounds // rule_count)):
+            next((name for name, pattern in patterns.items() if re.search(pattern, query)), None)
+        linear = (time.perf_counter() - start) / max(1, rounds // rule_count) * 1e6
+        print(f'{rule_count:>6} rules: automaton {elapsed:8.2f} us/lookup, per-rule re.search {linear:10.2f} us/lookup')
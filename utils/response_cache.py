@@ -0,0 +1,181 @@
+"""agent 回复的精确匹配缓存（默认关闭，需要显式开启）"""
+import os
+import json
+import time
+import hashlib
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Optional, List, Dict, Any, Union
+
+
+class MemoryCacheBackend:
+    """进程内缓存，LRU + TTL 淘汰"""
+
+    def __init__(self, max_entries: int = 1024):
+        self.max_entries = max_entries
+        self._entries: 'OrderedDict[str, tuple]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at < time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: str, ttl: float) -> None:
+        with self._lock:
+            self._entries[key] = (time.time() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+
+class SQLiteCacheBackend:
+    """本地磁盘缓存（SQLite），进程重启后仍然有效，LRU + TTL 淘汰"""
+
+    def __init__(self, path: str, max_entries: int = 10000):
+        self.max_entries = max_entries
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS response_cache ('
+            'key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL, last_access REAL NOT NULL)'
+        )
+        self._conn.execute('CREATE INDEX IF NOT EXISTS idx_last_access ON response_cache (last_access)')
+        self._conn.commit()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[str]:
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT value, expires_at FROM response_cache WHERE key = ?', (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            if row[1] < now:
+                self._conn.execute('DELETE FROM response_cache WHERE key = ?', (key,))
+                self._conn.commit()
+                return None
+            self._conn.execute('UPDATE response_cache SET last_access = ? WHERE key = ?', (now, key))
+            self._conn.commit()
+            return row[0]
+
+    def set(self, key: str, value: str, ttl: float) -> None:
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO response_cache (key, value, expires_at, last_access) VALUES (?, ?, ?, ?)',
+                (key, value, now + ttl, now)
+            )
+            # 超出容量时删除最久未访问的记录
+            self._conn.execute(
+                'DELETE FROM response_cache WHERE key IN ('
+                'SELECT key FROM response_cache ORDER BY last_access DESC LIMIT -1 OFFSET ?)',
+                (self.max_entries,)
+            )
+            self._conn.commit()
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute('SELECT COUNT(*) FROM response_cache').fetchone()[0]
+
+
+class ResponseCache:
+    """
+    agent 回复缓存
+    key 由 (模型, temperature, 归一化后的消息, 工具集版本) 计算得到；
+    产生了有副作用的工具调用（调节音量、打开应用等）的回复不会被缓存
+    """
+
+    def __init__(self, backend: Union[MemoryCacheBackend, SQLiteCacheBackend], ttl: float = 3600):
+        self.backend = backend
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.bypassed = 0
+        # 计数器在多个工作线程中更新
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _normalize(content: str) -> str:
+        # 去掉首尾空白并合并连续空白
+        return ' '.join(content.split())
+
+    def make_key(
+            self,
+            model: str,
+            temperature: float,
+            query: str,
+            history_messages: Optional[List] = None,
+            toolset_version: str = ''
+    ) -> str:
+        messages = [(message.role, self._normalize(message.content)) for message in history_messages or []]
+        messages.append(('user', self._normalize(query)))
+        raw = json.dumps([model, temperature, messages, toolset_version], ensure_ascii=False)
+        return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        value = self.backend.get(key)
+        with self._lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return value
+
+    def set(self, key: str, value: str) -> None:
+        self.backend.set(key, value, self.ttl)
+
+    def bypass(self) -> None:
+        """记录一次因为工具副作用没有写入缓存的回复"""
+        with self._lock:
+            self.bypassed += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            hits, misses, bypassed = self.hits, self.misses, self.bypassed
+        total = hits + misses
+        return {
+            'backend': type(self.backend).__name__,
+            'entries': len(self.backend),
+            'hits': hits,
+            'misses': misses,
+            'bypassed': bypassed,
+            'hit_rate': round(hits / total, 4) if total else 0.0
+        }
+
+
+def create_response_cache(
+        backend: Optional[str] = None,
+        ttl: float = 3600,
+        path: Optional[str] = None,
+        max_entries: int = 1024
+) -> Optional[ResponseCache]:
+    """
+    创建回复缓存
+    :param backend: memory | sqlite，为空时不开启缓存
+    :param ttl: 缓存有效期(s)
+    :param path: sqlite 文件路径
+    :param max_entries: 最大缓存条数
+    """
+    if not backend:
+        return None
+    if backend == 'memory':
+        return ResponseCache(MemoryCacheBackend(max_entries=max_entries), ttl=ttl)
+    if backend == 'sqlite':
+        path = path or os.path.join(os.path.expanduser('~'), '.united-agent', 'response_cache.sqlite3')
+        return ResponseCache(SQLiteCacheBackend(path, max_entries=max_entries), ttl=ttl)
+    raise ValueError(f'不支持的缓存类型: {backend}')
@@ -0,0 +1,225 @@
+"""
+服务端对话会话：客户端只需要发送 conversation_id 和新消息，不再每轮重复发送完整的历史
+会话在内存中保存已经转换好的 langchain 消息，每轮只转换新增的消息；开启 sqlite 时对话轮次追加写入本地磁盘，进程重启后仍然有效
+"""
+import os
+import time
+import uuid
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Optional, List, Dict, Any, Tuple
+
+from langchain_core.messages import BaseMessage
+
+from utils.utils import ChatMessage, transform_messages_type
+
+
+class Session:
+    """单个对话：原始消息和对应的 langchain 消息，只追加不修改"""
+
+    def __init__(self, conversation_id: str, updated_at: Optional[float] = None):
+        self.id = conversation_id
+        self.messages: List[ChatMessage] = []
+        self.converted: List[BaseMessage] = []
+        self.updated_at = updated_at or time.time()
+        self._lock = threading.Lock()
+
+    def extend(self, messages: List[ChatMessage], converted: Optional[List[BaseMessage]] = None) -> int:
+        """追加消息，返回追加前的消息数（新消息的起始序号）"""
+        converted = converted if converted is not None else transform_messages_type(messages, has_system=True)
+        with self._lock:
+            start = len(self.messages)
+            self.messages.extend(messages)
+            self.converted.extend(converted)
+            self.updated_at = time.time()
+            return start
+
+    def snapshot(self) -> Tuple[List[ChatMessage], List[BaseMessage]]:
+        """当前的历史消息（复制列表，同一对话的并发请求追加消息时不受影响）"""
+        with self._lock:
+            return list(self.messages), list(self.converted)
+
+    def __len__(self):
+        return len(self.messages)
+
+
+class SQLiteSessionBackend:
+    """对话轮次追加写入 SQLite（WAL），每条消息一行"""
+
+    def __init__(self, path: str):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.execute('CREATE TABLE IF NOT EXISTS sessions (id TEXT PRIMARY KEY, updated_at REAL NOT NULL)')
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS turns ('
+            'session_id TEXT NOT NULL, seq INTEGER NOT NULL, role TEXT NOT NULL, content TEXT NOT NULL, '
+            'PRIMARY KEY (session_id, seq))'
+        )
+        self._conn.execute('CREATE INDEX IF NOT EXISTS idx_sessions_updated_at ON sessions (updated_at)')
+        self._conn.commit()
+        self._lock = threading.Lock()
+
+    def load(self, conversation_id: str) -> Optional[Tuple[float, List[ChatMessage]]]:
+        with self._lock:
+            row = self._conn.execute('SELECT updated_at FROM sessions WHERE id = ?', (conversation_id,)).fetchone()
+            if row is None:
+                return None
+            turns = self._conn.execute(
+                'SELECT role, content FROM turns WHERE session_id = ? ORDER BY seq', (conversation_id,)
+            ).fetchall()
+        return row[0], [ChatMessage(role=role, content=content) for role, content in turns]
+
+    def append(self, conversation_id: str, start: int, messages: List[ChatMessage], updated_at: float) -> None:
+        # 序号冲突（同一对话出现了两个内存中的会话对象）时直接报错，不覆盖已经写入的轮次
+        with self._lock:
+            try:
+                self._conn.execute('INSERT OR REPLACE INTO sessions (id, updated_at) VALUES (?, ?)',
+                                   (conversation_id, updated_at))
+                self._conn.executemany(
+                    'INSERT INTO turns (session_id, seq, role, content) VALUES (?, ?, ?, ?)',
+                    [(conversation_id, start + i, message.role, message.content) for i, message in enumerate(messages)]
+                )
+                self._conn.commit()
+            except sqlite3.Error:
+                self._conn.rollback()
+                raise
+
+    def delete_expired(self, before: float) -> int:
+        with self._lock:
+            expired = [row[0] for row in self._conn.execute('SELECT id FROM sessions WHERE updated_at < ?', (before,))]
+            self._conn.executemany('DELETE FROM turns WHERE session_id = ?', [(sid,) for sid in expired])
+            self._conn.executemany('DELETE FROM sessions WHERE id = ?', [(sid,) for sid in expired])
+            self._conn.commit()
+        return len(expired)
+
+
+class SessionStore:
+    """
+    会话存储：内存中 LRU + TTL，可选 SQLite 持久化
+    :param ttl: 会话最后一次更新后的有效期(s)
+    :param max_sessions: 内存中保留的会话数量（超出后淘汰最久未使用的，持久化的会话再次访问时从磁盘加载）
+    :param backend: 持久化后端，为空时只保存在内存中
+    """
+
+    def __init__(self, ttl: float = 3600, max_sessions: int = 10000, backend: Optional[SQLiteSessionBackend] = None):
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        self.backend = backend
+        self._sessions: 'OrderedDict[str, Session]' = OrderedDict()
+        self._lock = threading.Lock()
+        self._last_sweep = time.time()
+        self.hits = 0
+        self.misses = 0
+        self.loaded = 0
+        self.expired = 0
+
+    def _cache(self, session: Session) -> None:
+        with self._lock:
+            self._cache_locked(session)
+
+    def _cache_locked(self, session: Session) -> None:
+        self._sessions[session.id] = session
+        self._sessions.move_to_end(session.id)
+        while len(self._sessions) > self.max_sessions:
+            self._sessions.popitem(last=False)
+
+    def create(self) -> Session:
+        self._sweep()
+        session = Session(uuid.uuid4().hex)
+        self._cache(session)
+        return session
+
+    def get(self, conversation_id: str) -> Optional[Session]:
+        """获取会话，不存在或者已经过期时返回 None"""
+        now = time.time()
+        with self._lock:
+            session = self._sessions.get(conversation_id)
+            if session is not None:
+                if session.updated_at + self.ttl < now:
+                    del self._sessions[conversation_id]
+                    self.expired += 1
+                    session = None
+                else:
+                    self._sessions.move_to_end(conversation_id)
+                    self.hits += 1
+                    return session
+
+        if self.backend is not None:
+            loaded = self.backend.load(conversation_id)
+            if loaded is not None and loaded[0] + self.ttl >= now:
+                # 从磁盘加载时整段对话转换一次，之后的轮次只转换新增的消息
+                session = Session(conversation_id, updated_at=loaded[0])
+                session.extend(loaded[1])
+                session.updated_at = loaded[0]
+                with self._lock:
+                    # 并发请求可能已经加载了同一个会话，只保留一个对象（否则两个对象会分配相同的序号）
+                    cached = self._sessions.get(conversation_id)
+                    if cached is not None:
+                        self._sessions.move_to_end(conversation_id)
+                        self.hits += 1
+                        return cached
+                    self.loaded += 1
+                    self._cache_locked(session)
+                return session
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def append(self, session: Session, messages: List[ChatMessage]) -> None:
+        """一轮对话结束后追加本轮的消息（用户消息和回复）"""
+        start = session.extend(messages)
+        if self.backend is not None:
+            self.backend.append(session.id, start, messages, session.updated_at)
+        self._cache(session)
+
+    def _sweep(self) -> None:
+        """定期清理过期的会话（最多每 ttl/10 秒一次）"""
+        now = time.time()
+        if now - self._last_sweep < self.ttl / 10:
+            return
+        self._last_sweep = now
+        with self._lock:
+            expired = [sid for sid, session in self._sessions.items() if session.updated_at + self.ttl < now]
+            for sid in expired:
+                del self._sessions[sid]
+            self.expired += len(expired)
+        if self.backend is not None:
+            self.backend.delete_expired(now - self.ttl)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'backend': 'sqlite' if self.backend is not None else 'memory',
+                'sessions': len(self._sessions),
+                'messages': sum(len(session) for session in self._sessions.values()),
+                'hits': self.hits,
+                'misses': self.misses,
+                'loaded': self.loaded,
+                'expired': self.expired
+            }
+
+
+def create_session_store(
+        backend: Optional[str] = None,
+        ttl: float = 3600,
+        path: Optional[str] = None,
+        max_sessions: int = 10000
+) -> Optional[SessionStore]:
+    """
+    创建会话存储
+    :param backend: memory | sqlite，为空时不开启会话（客户端每次发送完整的历史）
+    :param ttl: 会话有效期(s)
+    :param path: sqlite 文件路径
+    :param max_sessions: 内存中的最大会话数
+    """
+    if not backend:
+        return None
+    if backend == 'memory':
+        return SessionStore(ttl=ttl, max_sessions=max_sessions)
+    if backend == 'sqlite':
+        path = path or os.path.join(os.path.expanduser('~'), '.united-agent', 'sessions.sqlite3')
+        return SessionStore(ttl=ttl, max_sessions=max_sessions, backend=SQLiteSessionBackend(path))
+    raise ValueError(f'不支持的会话存储类型: {backend}')
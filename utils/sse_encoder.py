@@ -0,0 +1,218 @@
+"""
+SSE 流式输出编码
+每个请求预先渲染一次 chunk 的 JSON 模板，之后每个片段只需要转义内容并拼接（不再逐个片段构建 pydantic 模型再序列化）；
+短时间内的多个片段可以合并为一个事件，减少事件数量和网络包
+"""
+import os
+import json
+import time
+import asyncio
+from collections import deque
+from typing import Optional, AsyncIterator, Callable, Deque, Dict, Any
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+SSE_SEPARATOR = '\r\n'
+# 默认的合并参数：间隔(ms)和字节数，都为 0 时不合并（每个片段一个事件）
+COALESCE_MS = int(os.environ.get('SSE_COALESCE_MS', 0))
+COALESCE_BYTES = int(os.environ.get('SSE_COALESCE_BYTES', 0))
+
+_SENTINEL = '\x00__delta__\x00'
+
+
+def _escape_json(text: str) -> bytes:
+    return json.dumps(text, ensure_ascii=False).encode('utf-8')
+
+
+# orjson 转义字符串比 json.dumps 快数倍，结果等价（都输出 UTF-8 原文，只转义控制字符、引号和反斜杠）
+escape_json: Callable[[str], bytes] = orjson.dumps if orjson is not None else _escape_json
+
+
+def sse_event(data: bytes) -> bytes:
+    """data 事件（JSON 中没有换行，只需要一行 data）"""
+    return b'data: ' + data + (SSE_SEPARATOR * 2).encode()
+
+
+class ChunkEncoder:
+    """
+    chat.completion.chunk 编码器
+    :param render: render(role=..., content=..., finish_reason=...) 返回一个 chunk 的 JSON 字符串（通常就是原来的
+        pydantic 模型 model_dump(exclude_unset=True) 再 json.dumps），只在创建编码器时调用三次：角色、内容模板（内容为占位符）、结束，
+        因此输出的结构和原来完全一致
+    :param escape: 把字符串转义为 JSON 字符串（带引号）的函数
+    """
+
+    def __init__(self, render: Callable[..., str], escape: Callable[[str], bytes] = escape_json):
+        self.escape = escape
+        self.role_event = sse_event(render(role='assistant').encode('utf-8'))
+        self.stop_event = sse_event(render(finish_reason='stop').encode('utf-8'))
+        template = render(content=_SENTINEL).encode('utf-8')
+        self._prefix, self._suffix = template.split(json.dumps(_SENTINEL, ensure_ascii=False).encode('utf-8'))
+        self._prefix = b'data: ' + self._prefix
+        self._suffix = self._suffix + (SSE_SEPARATOR * 2).encode()
+        self.done_event = sse_event(b'[DONE]')
+        self.events = 0
+        self.bytes = 0
+
+    @staticmethod
+    def error_event(message: str, error_type: str = 'server_error') -> bytes:
+        """流式输出中途出错时的错误事件（和 OpenAI 的流式错误格式一致），之后仍然发送 done_event"""
+        return sse_event(json.dumps({'error': {'message': message, 'type': error_type}}, ensure_ascii=False)
+                         .encode('utf-8'))
+
+    def content(self, text: str) -> bytes:
+        event = self._prefix + self.escape(text) + self._suffix
+        self.events += 1
+        self.bytes += len(event)
+        return event
+
+
+async def coalesce(
+        fragments: AsyncIterator[str],
+        interval_ms: int = COALESCE_MS,
+        max_bytes: int = COALESCE_BYTES,
+        max_pending: int = 256
+) -> AsyncIterator[str]:
+    """
+    合并片段：缓冲区中第一个片段等待超过 interval_ms，或者缓冲区超过 max_bytes 时输出一次
+    interval_ms 和 max_bytes 都为 0 时原样输出；输入正常结束时输出缓冲区中剩余的内容，输入出错时抛出同样的异常
+    :param max_pending: 读取任务最多预读的片段数，超过后等待消费（保留上游通道的背压）
+    """
+    if interval_ms <= 0 and max_bytes <= 0:
+        async for fragment in fragments:
+            yield fragment
+        return
+
+    interval = interval_ms / 1000
+    # 单独的读取任务把片段放进队列，消费端每次醒来取走队列中的所有片段（不需要为每个片段创建任务）
+    queue: Deque[str] = deque()
+    wake, drained = asyncio.Event(), asyncio.Event()
+    state: Dict[str, Any] = {'finished': False, 'error': None}
+
+    async def read():
+        try:
+            async for fragment in fragments:
+                queue.append(fragment)
+                wake.set()
+                if len(queue) >= max_pending:
+                    drained.clear()
+                    await drained.wait()
+        except Exception as e:
+            state['error'] = e
+        finally:
+            state['finished'] = True
+            wake.set()
+
+    reader = asyncio.ensure_future(read())
+    buffer, size, deadline = [], 0, None
+    try:
+        while True:
+            if not queue and not state['finished']:
+                timeout = None if deadline is None or interval <= 0 else max(deadline - time.monotonic(), 0)
+                try:
+                    await asyncio.wait_for(wake.wait(), timeout)
+                except asyncio.TimeoutError:
+                    if buffer:
+                        yield ''.join(buffer)
+                    buffer, size, deadline = [], 0, None
+                    continue
+                wake.clear()
+
+            if queue:
+                while queue:
+                    fragment = queue.popleft()
+                    # 缓冲区中第一个片段开始计时（按字节数输出后缓冲区为空，不再计时）
+                    if not buffer:
+                        deadline = time.monotonic() + interval
+                    buffer.append(fragment)
+                    if max_bytes > 0:
+                        size += len(fragment.encode('utf-8'))
+                        if size >= max_bytes:
+                            yield ''.join(buffer)
+                            buffer, size, deadline = [], 0, None
+                drained.set()
+                if buffer and interval > 0 and time.monotonic() >= deadline:
+                    yield ''.join(buffer)
+                    buffer, size, deadline = [], 0, None
+
+            if state['finished'] and not queue:
+                break
+    finally:
+        # 消费者提前关闭时停止读取
+        reader.cancel()
+    if buffer:
+        yield ''.join(buffer)
+    if state['error'] is not None:
+        raise state['error']
+
+
+if __name__ == '__main__':
+    from typing import List, Literal, Union
+    from pydantic import BaseModel, Field
+    from sse_starlette.sse import ensure_bytes
+
+    # 和 server.py 中相同的数据模型（server.py 导入时需要加载 flowy.dll，这里单独定义）
+    class DeltaMessage(BaseModel):
+        role: Optional[Literal["user", "assistant", "system"]] = None
+        content: Optional[str] = None
+
+    class ChatCompletionResponseStreamChoice(BaseModel):
+        index: int
+        delta: DeltaMessage
+        finish_reason: Optional[Literal["stop", "length"]]
+
+    class ChatCompletionResponse(BaseModel):
+        model: str
+        object: Literal["chat.completion", "chat.completion.chunk"]
+        choices: List[Union[ChatCompletionResponseStreamChoice]]
+        created: Optional[int] = Field(default_factory=lambda: int(time.time()))
+        conversation_id: Optional[str] = None
+
+    def render(finish_reason=None, **delta) -> str:
+        choice = ChatCompletionResponseStreamChoice(index=0, delta=DeltaMessage(**delta), finish_reason=finish_reason)
+        chunk = ChatCompletionResponse(model='glm-4', choices=[choice], object='chat.completion.chunk',
+                                       conversation_id='c0ffee')
+        return json.dumps(chunk.model_dump(exclude_unset=True), ensure_ascii=False)
+
+    def legacy(text: str) -> bytes:
+        """原来的实现：每个片段构建 pydantic 模型 + model_dump + json.dumps，再由 sse_starlette 编码"""
+        return ensure_bytes(render(content=text), SSE_SEPARATOR)
+
+    tokens = ['你好', '，', '这是', '一个', '"流式"', '输出', '\n', 'token', ' test', '。'] * 100  # 1k tokens
+
+    def bench(label, encode, repeat=50):
+        start_wall, start_cpu = time.perf_counter(), time.process_time()
+        events = 0
+        for _ in range(repeat):
+            for token in tokens:
+                encode(token)
+                events += 1
+        wall, cpu = time.perf_counter() - start_wall, time.process_time() - start_cpu
+        print(f'{label:36} {events / wall:12,.0f} events/s   {cpu / repeat * 1000:7.2f} ms CPU / 1k tokens')
+
+    template_json = ChunkEncoder(render, escape=_escape_json)
+    assert legacy(tokens[4]) == template_json.content(tokens[4]), '模板输出和原来的结构不一致'
+
+    bench('pydantic + json.dumps (legacy)', legacy)
+    bench('template + json.dumps', template_json.content)
+    if orjson is not None:
+        bench('template + orjson', ChunkEncoder(render, escape=orjson.dumps).content)
+
+    # 合并：片段连续到达时每 64 字节一个事件
+    async def produce():
+        for token in tokens:
+            yield token
+
+    async def run_coalesced(max_bytes):
+        encoder = ChunkEncoder(render)
+        start = time.process_time()
+        async for text in coalesce(produce(), interval_ms=20, max_bytes=max_bytes):
+            encoder.content(text)
+        return encoder.events, (time.process_time() - start) * 1000
+
+    for max_bytes in (64, 256):
+        events, cpu = asyncio.run(run_coalesced(max_bytes))
+        print(f'coalesce max_bytes={max_bytes:<4} (1k tokens)   {events:5} events          {cpu:7.2f} ms CPU / 1k tokens')
@@ -0,0 +1,55 @@
+"""请求级别的流式输出通道"""
+import asyncio
+from typing import Optional
+
+
+class StreamChannel:
+    """
+    每个请求独享的有界输出通道
+    生产者（langchain 输出 / flowy ctypes 回调）写入片段，SSE 生成器读取片段；
+    队列有上限，消费者跟不上时生产者会被阻塞（背压），单个请求占用的内存是常量
+    """
+    _END = object()
+
+    def __init__(self, maxsize: int = 256, loop: Optional[asyncio.AbstractEventLoop] = None):
+        self.loop = loop or asyncio.get_running_loop()
+        self._queue = asyncio.Queue(maxsize=maxsize)
+        self._error: Optional[BaseException] = None
+        self.closed = False
+
+    async def put(self, fragment: str) -> None:
+        """在事件循环中写入片段"""
+        if not self.closed:
+            await self._queue.put(fragment)
+
+    def put_threadsafe(self, fragment: str) -> None:
+        """在工作线程中写入片段（不能在事件循环线程中调用，否则会死锁）"""
+        if self.closed:
+            return
+        asyncio.run_coroutine_threadsafe(self.put(fragment), self.loop).result()
+
+    async def finish(self, error: Optional[BaseException] = None) -> None:
+        """生产者结束输出，error 不为空时消费者会收到该异常"""
+        self._error = error
+        if not self.closed:
+            await self._queue.put(self._END)
+
+    def finish_threadsafe(self, error: Optional[BaseException] = None) -> None:
+        asyncio.run_coroutine_threadsafe(self.finish(error), self.loop).result()
+
+    def close(self) -> None:
+        """消费者不再读取：丢弃剩余片段并唤醒阻塞中的生产者"""
+        self.closed = True
+        while not self._queue.empty():
+            self._queue.get_nowait()
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self) -> str:
+        fragment = await self._queue.get()
+        if fragment is self._END:
+            if self._error is not None:
+                raise self._error
+            raise StopAsyncIteration
+        return fragment
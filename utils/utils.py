@@ -30,11 +30,9 @@ def get_os_type() -> Literal['Windows', 'macOS']:
 def transform_messages_type(history_messages: List[ChatMessage], has_system: bool = False):
     """ChatMessage类型转换为langchain ChatPrompt所需要的"""
 
-    if not has_system:
-        first_message = history_messages[0]
-        # 如果存在system
-        if first_message.role == 'system':
-            history_messages.pop(0)
+    # 如果存在system，跳过第一条消息（不修改传入的列表，调用方可能还会继续使用）
+    if not has_system and history_messages and history_messages[0].role == 'system':
+        history_messages = history_messages[1:]
 
     chat_history = []
     for history_message in history_messages:
@@ -82,20 +80,6 @@ def change_model(model_name: str) -> Union[Dict[str, str], None]:
 
 
 def write_docx(doc_path: str, doc_content: str):
-    from docx import Document
-    from docx.enum.text import WD_PARAGRAPH_ALIGNMENT
-    # from docx.shared import Cm, RGBColor, Pt
-
-    doc = Document()
-
-    doc.encoding = 'utf-8'
-
-    """添加标题"""
-    # para_head = doc.add_heading("标题", level=1)  # level代表标题级别
-    # para_head.alignment = WD_PARAGRAPH_ALIGNMENT.CENTER  # 标题居中
-
-    """添加正文段落"""
-    doc.add_paragraph(doc_content)
-
-    """保存文档"""
-    doc.save(doc_path)
+    """把 markdown 内容渲染为 docx（标题、列表、代码块、表格等保留结构）"""
+    from utils.docx_renderer import write_docx as render_docx
+    render_docx(doc_path, doc_content)